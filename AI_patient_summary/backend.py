@@ -1,22 +1,54 @@
 import time
 import threading
+import asyncio
 import os
 import uvicorn
 import webview
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import json
+import queue
+import atexit
+import hashlib
+import contextvars
+import uuid
+from email.utils import formatdate
 import mysql.connector
 from mysql.connector import Error
 # OpenAI imports - will be conditionally imported based on configuration
 from dotenv import load_dotenv
 from bdt_parser import BDTParser
+from summary_store import SummaryStore, make_content_key
+from ttl_cache import BoundedTTLCache, PatientCache, patient_cache_key
+from cache_snapshot import CacheSnapshotter
+from shared_cache import SharedCacheStore
+from event_bus import EventBus
+from response_encoding import PreparedJSON, ResponseEncoder, parse_list, project
+from singleflight import SingleFlight
+from json_stream import JSONSectionStream
+from prompt_budget import PromptAssembler, estimate_tokens
+from model_router import ModelRouter
+from llm_telemetry import LLMTelemetry
+from overnight_scheduler import (
+    LocalBatchProvider, OpenAIBatchProvider, OvernightScheduler, appointments_for_day,
+    load_schedule_file, normalize_appointment, parse_window, run_batch
+)
+from structured_output import SchemaValidator, StructuredOutputError, repair_messages, strict_response_format
+from summary_mapreduce import (
+    WINDOW_SUMMARY_JSON_SCHEMA, WINDOW_SUMMARY_SYSTEM_PROMPT, build_reduce_prompt, format_window_prompt,
+    needs_hierarchical_summary, partition_history
+)
+from summary_delta import build_delta_prompt, collect_source_records, plan_update, record_dates, record_hashes
+from llm_client import AsyncLLMClient, ConcurrencySlots, LLMGateway, background_priority
+from llm_resilience import CircuitBreaker, ProviderEndpoint, ProviderUnavailableError, ResilientLLMClient
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Load environment variables
@@ -129,6 +161,9 @@ You must return a valid JSON object with exactly these keys. Do not use Markdown
 8. **Action Plan:** Include 2-3 specific next steps for patient management
 """
 
+# Part of every summary cache key - editing the prompt invalidates stored summaries
+AI_SUMMARY_PROMPT_VERSION = hashlib.sha256(AI_SUMMARY_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
 AI_SUMMARY_JSON_SCHEMA = {
     "name": "patient_summary",
     "schema": {
@@ -241,43 +276,7 @@ def build_error_summary(message: str) -> Dict[str, Any]:
     }
 
 
-def extract_json_from_response(response) -> Dict[str, Any]:
-    """Extract concatenated text content from a Responses API call and parse JSON."""
-    if not response:
-        raise ValueError("Empty OpenAI response object")
-
-    # Prefer the convenience attribute when available
-    raw_text = getattr(response, "output_text", None)
-
-    if not raw_text:
-        segments: List[str] = []
-        for item in getattr(response, "output", []):
-            for content in getattr(item, "content", []):
-                text = getattr(content, "text", None)
-                if text:
-                    segments.append(text)
-        raw_text = "".join(segments)
-
-    if not raw_text:
-        raise ValueError("OpenAI response did not contain any text output")
-
-    try:
-        return json.loads(raw_text)
-    except json.JSONDecodeError as exc:
-        # Attempt to salvage by slicing to outermost braces
-        cleaned = raw_text.strip()
-        start = cleaned.find('{')
-        end = cleaned.rfind('}')
-        if start != -1 and end != -1 and end > start:
-            snippet = cleaned[start:end + 1]
-            try:
-                return json.loads(snippet)
-            except json.JSONDecodeError:
-                pass
-        raise ValueError(f"Failed to parse JSON output: {exc}")
-
-
-def extract_json_from_chat_completion(response) -> Dict[str, Any]:
+def chat_completion_text(response) -> str:
     if not response or not getattr(response, "choices", None):
         raise ValueError("Empty chat completion response")
 
@@ -300,57 +299,88 @@ def extract_json_from_chat_completion(response) -> Dict[str, Any]:
     if not isinstance(content, str):
         raise ValueError("Chat completion returned unsupported content format")
 
+    return content
+
+
+def response_format_for(named_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Strict json_schema output when the provider supports it, JSON mode otherwise"""
+    if STRUCTURED_OUTPUTS:
+        return strict_response_format(named_schema)
+    return {"type": "json_object"}
+
+
+def complete_structured(validator: SchemaValidator, named_schema: Dict[str, Any],
+                        messages: List[Dict[str, Any]], purpose: str, **kwargs) -> Dict[str, Any]:
+    """Chat completion validated against its schema, with exactly one repair attempt"""
+    response_format = response_format_for(named_schema)
     try:
-        return json.loads(content)
-    except json.JSONDecodeError as exc:
-        cleaned = content.strip()
-        start = cleaned.find('{')
-        end = cleaned.rfind('}')
-        if start != -1 and end != -1 and end > start:
-            snippet = cleaned[start:end + 1]
-            try:
-                return json.loads(snippet)
-            except json.JSONDecodeError:
-                pass
-        raise ValueError(f"Failed to parse JSON output: {exc}")
+        return complete_tracked(purpose, validator, messages=messages, response_format=response_format, **kwargs)
+    except StructuredOutputError as e:
+        print(f"🩹 {e} - sending one repair request")
+        return complete_tracked(f"{purpose}_repair", validator, messages=repair_messages(messages, e),
+                                response_format=response_format, **kwargs)
 
 
-def call_openai_for_summary(prompt: str, temperature: float = 0.2) -> Dict[str, Any]:
-    """Generate AI summary using OpenAI GPT-4o mini"""
+# Interactive summary calls - the only ones made with a routed deployment, so the only ones
+# whose latency and cost belong in the router's per-route metrics
+ROUTED_PURPOSES = {"summary", "summary_repair", "summary_stream", "summary_stream_repair"}
+
+
+def observe_routed_call(call: Any) -> None:
+    """Feed a finished summary call into the model router's metrics (other purposes are ignored)"""
+    if call.purpose in ROUTED_PURPOSES and call.latency is not None:
+        model_router.observe(call.model, call.latency, call, ok=call.outcome == "ok")
+
+
+def complete_tracked(purpose: str, validator: Optional[SchemaValidator] = None, **kwargs) -> Any:
+    """llm_gateway.complete with per-call telemetry; returns the parsed document when a validator is given"""
+    call = llm_telemetry.track(purpose, kwargs.get("model"))
+    try:
+        with call:
+            response = llm_gateway.complete(trace=call.trace, **kwargs)
+            call.set_usage(getattr(response, "usage", None))
+            return validator.parse(chat_completion_text(response)) if validator else response
+    finally:
+        observe_routed_call(call)
+
+
+def call_openai_for_summary(prompt: str, temperature: float = 0.2, force: bool = False,
+                            model: Optional[str] = None) -> Dict[str, Any]:
+    """Generate AI summary using OpenAI GPT-4o mini (or the deployment chosen by the router)"""
     if not ai_client:
         return build_error_summary("OpenAI API not configured")
 
+    model = model or AI_MODEL
+    store_key = make_content_key(prompt, model, AI_SUMMARY_PROMPT_VERSION, purpose="summary")
+    if not force:
+        stored = summary_store.get(store_key)
+        if stored is not None:
+            print(f"💾 Summary served from persistent store ({store_key[:12]})")
+            return stored
+
+    # Concurrent requests for the same prompt share one LLM call
+    return generation_flight.do(f"summary:{store_key}", _request_summary_completion, prompt, temperature, store_key, model)
+
+
+def _request_summary_completion(prompt: str, temperature: float, store_key: str, model: str) -> Dict[str, Any]:
     try:
         # Call OpenAI with structured output
-        response = ai_client.chat.completions.create(
-            model=AI_MODEL,
-            messages=[
+        summary = complete_structured(
+            SUMMARY_VALIDATOR,
+            AI_SUMMARY_JSON_SCHEMA,
+            [
                 {"role": "system", "content": AI_SUMMARY_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
+            purpose="summary",
+            model=model,
             temperature=temperature,
-            max_tokens=3000,
-            response_format={"type": "json_object"}
+            max_tokens=3000
         )
-
-        summary = extract_json_from_chat_completion(response)
-        
-        # Log what we received
         print(f"📋 OpenAI returned keys: {list(summary.keys())}")
-        if 'problem_representation' in summary:
-            print(f"✅ New format detected")
-        elif 'patient_status' in summary:
-            print(f"⚠️ Old format detected - converting...")
-            # Convert old format to new format
-            summary = {
-                "problem_representation": summary.get("patient_status", "No summary available"),
-                "current_trajectory": summary.get("medication_summary", "No trajectory data"),
-                "vitals_trends": [],
-                "lab_trends": [],
-                "medication_evolution": summary.get("current_medications", []),
-                "red_flags": summary.get("red_flags", [])
-            }
-        
+
+        summary_store.put(store_key, summary, purpose="summary", model=model,
+                          prompt_version=AI_SUMMARY_PROMPT_VERSION)
         return summary
 
     except Exception as e:
@@ -359,6 +389,103 @@ def call_openai_for_summary(prompt: str, temperature: float = 0.2) -> Dict[str,
         traceback.print_exc()
         return build_error_summary(str(e))
 
+
+def stream_openai_summary(prompt: str, temperature: float = 0.1, model: Optional[str] = None, force: bool = False):
+    """Stream a summary completion, yielding ("section", {...}) per finished section and ("complete", summary) last"""
+    if not ai_client:
+        yield "complete", build_error_summary("OpenAI API not configured")
+        return
+
+    model = model or AI_MODEL
+    store_key = make_content_key(prompt, model, AI_SUMMARY_PROMPT_VERSION, purpose="summary")
+    stored = None if force else summary_store.get(store_key)
+    if stored is not None:
+        for key, value in stored.items():
+            yield "section", {"key": key, "value": value}
+        yield "complete", stored
+        return
+
+    parser = JSONSectionStream()
+    try:
+        try:
+            call = llm_telemetry.track("summary_stream", model)
+            try:
+                with call:
+                    stream = llm_gateway.stream(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": AI_SUMMARY_SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=3000,
+                        response_format=response_format_for(AI_SUMMARY_JSON_SCHEMA),
+                        trace=call.trace,
+                        **STREAM_USAGE_OPTIONS
+                    )
+
+                    for chunk in stream:
+                        call.set_usage(getattr(chunk, "usage", None))
+                        if not chunk.choices:
+                            continue
+                        content = chunk.choices[0].delta.content or ""
+                        if content:
+                            call.first_token()
+                        for key, value in parser.feed(content):
+                            print(f"📤 Streamed section: {key}")
+                            yield "section", {"key": key, "value": value}
+
+                    if not call.completion_tokens:
+                        # No usage chunk (stream usage off for this provider) - count locally
+                        call.prompt_tokens = estimate_tokens(AI_SUMMARY_SYSTEM_PROMPT + prompt)
+                        call.completion_tokens = estimate_tokens(parser.text)
+                    summary = SUMMARY_VALIDATOR.parse(parser.text)
+            finally:
+                observe_routed_call(call)
+        except StructuredOutputError as e:
+            print(f"🩹 {e} - sending one repair request")
+            summary = complete_tracked(
+                "summary_stream_repair",
+                SUMMARY_VALIDATOR,
+                model=model,
+                messages=repair_messages([
+                    {"role": "system", "content": AI_SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ], e),
+                temperature=temperature,
+                max_tokens=3000,
+                response_format=response_format_for(AI_SUMMARY_JSON_SCHEMA)
+            )
+    except Exception as e:
+        print(f"❌ Streaming summary request failed: {e}")
+        yield "complete", build_error_summary(str(e))
+        return
+
+    summary_store.put(store_key, summary, purpose="summary", model=model,
+                      prompt_version=AI_SUMMARY_PROMPT_VERSION)
+    yield "complete", summary
+
+
+def summarize_prompt(prompt: str, temperature: float = 0.1, force: bool = False, model: Optional[str] = None,
+                     on_section=None) -> Dict[str, Any]:
+    """Summary completion for a prompt; streamed when on_section is given (called once per finished section)"""
+    if on_section is None:
+        return call_openai_for_summary(prompt, temperature=temperature, force=force, model=model)
+
+    summary = None
+    for event, payload in stream_openai_summary(prompt, temperature=temperature, model=model, force=force):
+        if event == "section":
+            on_section(payload)
+        else:
+            summary = payload
+    return summary
+
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Encode one Server-Sent Event"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 # ==========================================
 # 🧪 DRUG INTERACTION & RISK ASSESSMENT AI
 # ==========================================
@@ -446,6 +573,72 @@ Return a valid JSON object with this structure:
 - Interactions already well-managed based on current labs
 """
 
+AI_DRUG_RISK_PROMPT_VERSION = hashlib.sha256(AI_DRUG_RISK_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+AI_DRUG_RISK_JSON_SCHEMA = {
+    "name": "drug_risk_assessment",
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "drug_interactions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "drugs": {"type": "array", "items": {"type": "string"}},
+                        "risk_level": {"type": "string", "enum": ["HIGH", "MODERATE", "LOW"]},
+                        "interaction": {"type": "string"},
+                        "clinical_effect": {"type": "string"},
+                        "recommendation": {"type": "string"},
+                        "source": {"type": "string"}
+                    },
+                    "required": ["drugs", "risk_level", "interaction", "clinical_effect", "recommendation", "source"]
+                }
+            },
+            "drug_lab_effects": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "medication": {"type": "string"},
+                        "lab_parameter": {"type": "string"},
+                        "current_value": {"type": "string"},
+                        "risk_level": {"type": "string", "enum": ["HIGH", "MODERATE", "LOW"]},
+                        "mechanism": {"type": "string"},
+                        "clinical_significance": {"type": "string"},
+                        "recommendation": {"type": "string"},
+                        "source": {"type": "string"}
+                    },
+                    "required": ["medication", "lab_parameter", "current_value", "risk_level", "mechanism",
+                                 "clinical_significance", "recommendation", "source"]
+                }
+            },
+            "contraindications": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "medication": {"type": "string"},
+                        "issue": {"type": "string"},
+                        "risk_level": {"type": "string", "enum": ["HIGH", "MODERATE", "LOW"]},
+                        "reason": {"type": "string"},
+                        "recommendation": {"type": "string"},
+                        "source": {"type": "string"}
+                    },
+                    "required": ["medication", "issue", "risk_level", "reason", "recommendation", "source"]
+                }
+            }
+        },
+        "required": ["drug_interactions", "drug_lab_effects", "contraindications"]
+    }
+}
+
+# Schemas are compiled once; every response is validated locally before it is cached
+SUMMARY_VALIDATOR = SchemaValidator(AI_SUMMARY_JSON_SCHEMA)
+DRUG_RISK_VALIDATOR = SchemaValidator(AI_DRUG_RISK_JSON_SCHEMA)
+WINDOW_SUMMARY_VALIDATOR = SchemaValidator(WINDOW_SUMMARY_JSON_SCHEMA)
+
 def generate_drug_risk_assessment(patient_data: Dict[str, Any]) -> Dict[str, Any]:
     """Generate AI-powered drug interaction and risk assessment"""
     if not openai_client:
@@ -495,45 +688,38 @@ def generate_drug_risk_assessment(patient_data: Dict[str, Any]) -> Dict[str, Any
                     'date': lab.get('result_date', lab.get('ordered_at'))
                 })
         
-        # Format input for AI
+        # Format input for AI - fixed instructions and stable background first, recent labs last
         input_text = f"""
+Analyze for drug-drug interactions, drug-induced lab abnormalities, and contraindications.
+Focus ONLY on clinically significant risks requiring intervention.
+
 PATIENT MEDICATION PROFILE:
 
-Current Medications:
-{chr(10).join(f"- {med}" for med in medications) if medications else "None recorded"}
+Known Allergies:
+{chr(10).join(f"- {allergy}" for allergy in allergies) if allergies else "None recorded"}
 
 Chronic Conditions:
 {chr(10).join(f"- {cond}" for cond in chronic_conditions) if chronic_conditions else "None recorded"}
 
-Known Allergies:
-{chr(10).join(f"- {allergy}" for allergy in allergies) if allergies else "None recorded"}
+Current Medications:
+{chr(10).join(f"- {med}" for med in medications) if medications else "None recorded"}
 
 Recent Lab Results:
 {chr(10).join(f"- {lab['test']}: {lab['value']} ({lab['date']})" for lab in recent_labs) if recent_labs else "No recent labs"}
-
-Analyze for drug-drug interactions, drug-induced lab abnormalities, and contraindications.
-Focus ONLY on clinically significant risks requiring intervention.
 """
         
+        store_key = make_content_key(input_text, AI_MODEL, AI_DRUG_RISK_PROMPT_VERSION, purpose="drug_risk")
+        stored = summary_store.get(store_key)
+        if stored is not None:
+            print(f"💾 Drug risk assessment served from persistent store ({store_key[:12]})")
+            return stored
+
         print(f"🧪 Generating drug risk assessment with OpenAI...")
         print(f"   Medications to analyze: {medications}")
         print(f"   Recent labs: {len(recent_labs)} results")
         
-        # Use OpenAI for drug risk assessment
-        response = ai_client.chat.completions.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": AI_DRUG_RISK_SYSTEM_PROMPT},
-                {"role": "user", "content": input_text}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.2,
-            max_tokens=2000
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        print(f"✅ OpenAI drug risk assessment generated")
-        return result
+        # Use OpenAI for drug risk assessment (shared with concurrent identical requests)
+        return generation_flight.do(f"drug_risk:{store_key}", _request_drug_risk_completion, input_text, store_key)
         
     except Exception as e:
         print(f"❌ Drug risk assessment failed: {e}")
@@ -546,6 +732,25 @@ Focus ONLY on clinically significant risks requiring intervention.
             "contraindications": []
         }
 
+
+def _request_drug_risk_completion(input_text: str, store_key: str) -> Dict[str, Any]:
+    result = complete_structured(
+        DRUG_RISK_VALIDATOR,
+        AI_DRUG_RISK_JSON_SCHEMA,
+        [
+            {"role": "system", "content": AI_DRUG_RISK_SYSTEM_PROMPT},
+            {"role": "user", "content": input_text}
+        ],
+        purpose="drug_risk",
+        model=AI_MODEL,
+        temperature=0.2,
+        max_tokens=2000
+    )
+    print(f"✅ OpenAI drug risk assessment generated")
+    summary_store.put(store_key, result, purpose="drug_risk", model=AI_MODEL,
+                      prompt_version=AI_DRUG_RISK_PROMPT_VERSION)
+    return result
+
 FULL_PATH = (WATCH_FOLDER / WATCH_FILE).resolve()
 
 # HTML File Path (points to the sidecar HTML in this workspace)
@@ -589,22 +794,43 @@ AI_PROVIDER = os.getenv('AI_PROVIDER', 'azure').lower()
 
 # Initialize AI client based on provider
 ai_client = None
+ai_async_client = None
 AI_MODEL = None
-
-if AI_PROVIDER == 'openai' and OPENAI_API_KEY:
-    from openai import OpenAI
+AI_PROVIDER_NAME = None
+
+# Retries are handled by llm_resilience, so the SDK's own retry loop is disabled
+if AI_PROVIDER == 'fake':
+    # Offline development and load tests (see fake_llm.py for FAKE_LLM_* settings)
+    from fake_llm import FakeAsyncOpenAI, FakeLLMEngine, FakeOpenAI
+    fake_engine = FakeLLMEngine()
+    ai_client = FakeOpenAI(fake_engine)
+    ai_async_client = FakeAsyncOpenAI(fake_engine)
+    AI_MODEL = 'fake-model'
+    AI_PROVIDER_NAME = 'fake'
+    print(f"🧪 Using fake LLM provider - latency {fake_engine.config.latency}")
+elif AI_PROVIDER == 'openai' and OPENAI_API_KEY:
+    from openai import OpenAI, AsyncOpenAI
     ai_client = OpenAI(api_key=OPENAI_API_KEY)
+    ai_async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
     AI_MODEL = 'gpt-4o-mini'
+    AI_PROVIDER_NAME = 'openai'
     print(f"🤖 Using OpenAI - Model: {AI_MODEL}")
     print(f"🔑 API Key configured: {OPENAI_API_KEY[:10]}...")
 elif FOUNDRY_API_KEY and FOUNDRY_ENDPOINT:
-    from openai import AzureOpenAI
+    from openai import AzureOpenAI, AsyncAzureOpenAI
     ai_client = AzureOpenAI(
         api_key=FOUNDRY_API_KEY,
         api_version=FOUNDRY_API_VERSION,
         azure_endpoint=FOUNDRY_ENDPOINT
     )
+    ai_async_client = AsyncAzureOpenAI(
+        api_key=FOUNDRY_API_KEY,
+        api_version=FOUNDRY_API_VERSION,
+        azure_endpoint=FOUNDRY_ENDPOINT,
+        max_retries=0
+    )
     AI_MODEL = FOUNDRY_DEPLOYMENT_NAME
+    AI_PROVIDER_NAME = 'foundry'
     print(f"🤖 Using Microsoft Foundry - Model: {AI_MODEL}")
     print(f"🔑 API Key configured: {FOUNDRY_API_KEY[:10]}...")
     print(f"🌐 Endpoint: {FOUNDRY_ENDPOINT}")
@@ -617,6 +843,146 @@ else:
 # Keep legacy variable for backward compatibility
 openai_client = ai_client
 
+# All LLM calls are admitted through a rate-limited, priority-aware async client
+# LLM_RATE_LIMITS overrides the defaults per deployment, e.g. {"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}
+# Rate limits are per provider (separate quotas); LLM_MAX_CONCURRENCY caps calls in flight across all providers
+llm_admission_slots = ConcurrencySlots(int(os.getenv('LLM_MAX_CONCURRENCY', 4)))
+
+
+def build_admission_client(async_client) -> AsyncLLMClient:
+    return AsyncLLMClient(
+        async_client,
+        slots=llm_admission_slots,
+        default_limits={
+            "rpm": int(os.getenv('LLM_REQUESTS_PER_MINUTE', 60)),
+            "tpm": int(os.getenv('LLM_TOKENS_PER_MINUTE', 60000))
+        },
+        deployment_limits=json.loads(os.getenv('LLM_RATE_LIMITS', '{}'))
+    )
+
+
+def build_provider_endpoint(name: str, async_client, model: str) -> ProviderEndpoint:
+    return ProviderEndpoint(
+        name,
+        build_admission_client(async_client),
+        model,
+        CircuitBreaker(
+            failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30))
+        )
+    )
+
+
+llm_providers: List[ProviderEndpoint] = []
+if ai_async_client:
+    llm_providers.append(build_provider_endpoint(AI_PROVIDER_NAME, ai_async_client, AI_MODEL))
+
+    # The other configured provider serves hedged requests and failover
+    if AI_PROVIDER_NAME == 'openai' and FOUNDRY_API_KEY and FOUNDRY_ENDPOINT:
+        from openai import AsyncAzureOpenAI
+        llm_providers.append(build_provider_endpoint('foundry', AsyncAzureOpenAI(
+            api_key=FOUNDRY_API_KEY,
+            api_version=FOUNDRY_API_VERSION,
+            azure_endpoint=FOUNDRY_ENDPOINT,
+            max_retries=0
+        ), FOUNDRY_DEPLOYMENT_NAME))
+    elif AI_PROVIDER_NAME == 'foundry' and OPENAI_API_KEY:
+        from openai import AsyncOpenAI
+        llm_providers.append(build_provider_endpoint(
+            'openai', AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0), 'gpt-4o-mini'
+        ))
+    if len(llm_providers) > 1:
+        print(f"🛟 Alternate provider for hedging/failover: {llm_providers[1].name}")
+
+llm_gateway = None
+if llm_providers:
+    llm_gateway = LLMGateway(ResilientLLMClient(
+        llm_providers,
+        deadline=float(os.getenv('LLM_CALL_DEADLINE_SECONDS', 45)),
+        max_retries=int(os.getenv('LLM_MAX_RETRIES', 2)),
+        hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', 95)),
+        hedging=os.getenv('LLM_HEDGING', '1') != '0',
+        first_token_timeout=float(os.getenv('LLM_STREAM_FIRST_TOKEN_SECONDS', 20)),
+        chunk_timeout=float(os.getenv('LLM_STREAM_CHUNK_TIMEOUT_SECONDS', 15))
+    ))
+
+# Persistent summary store (survives restarts, keyed by prompt/model/prompt version)
+summary_store_env = os.getenv('SUMMARY_STORE_PATH')
+if summary_store_env:
+    SUMMARY_STORE_PATH = Path(summary_store_env).expanduser()
+    if not SUMMARY_STORE_PATH.is_absolute():
+        SUMMARY_STORE_PATH = (BASE_DIR / SUMMARY_STORE_PATH).resolve()
+else:
+    SUMMARY_STORE_PATH = (BASE_DIR / "cache" / "summary_store.sqlite3").resolve()
+
+summary_store = SummaryStore(
+    SUMMARY_STORE_PATH,
+    max_bytes=int(os.getenv('SUMMARY_STORE_MAX_MB', 200)) * 1024 * 1024,
+    memory_entries=int(os.getenv('SUMMARY_STORE_MEMORY_ENTRIES', 256))
+)
+print(f"💾 Summary store: {SUMMARY_STORE_PATH}")
+
+# Collapses concurrent generations for the same patient/prompt into one LLM call
+generation_flight = SingleFlight()
+
+# Strict json_schema structured outputs (Azure needs API version 2024-08-01-preview or later);
+# when off, JSON mode is used and responses are still validated locally
+STRUCTURED_OUTPUTS = os.getenv('LLM_STRUCTURED_OUTPUTS', '1' if AI_PROVIDER_NAME in ('openai', 'fake') else '0') == '1'
+
+# Complexity-based routing: simple follow-ups to the fast deployment, complex patients to the strong one.
+# A patient reaching any threshold (or a combination of partial ones) is complex.
+model_router = ModelRouter(
+    fast_model=os.getenv('LLM_FAST_MODEL', AI_MODEL or ''),
+    strong_model=os.getenv('LLM_STRONG_MODEL', AI_MODEL or ''),
+    thresholds={
+        "history_records": float(os.getenv('ROUTER_HISTORY_RECORDS', 60)),
+        "active_problems": float(os.getenv('ROUTER_ACTIVE_PROBLEMS', 5)),
+        "abnormal_labs": float(os.getenv('ROUTER_ABNORMAL_LABS', 4)),
+        "medications": float(os.getenv('ROUTER_MEDICATIONS', 8))
+    },
+    prices=json.loads(os.getenv('LLM_MODEL_PRICES', '{}'))
+)
+
+# Per-call LLM telemetry: rolling percentiles plus a local SQLite log for daily reports
+llm_telemetry_env = os.getenv('LLM_TELEMETRY_PATH')
+LLM_TELEMETRY_PATH = (BASE_DIR / Path(llm_telemetry_env).expanduser()).resolve() if llm_telemetry_env \
+    else (BASE_DIR / "cache" / "llm_telemetry.sqlite3").resolve()
+llm_telemetry = LLMTelemetry(LLM_TELEMETRY_PATH, prices=model_router.prices,
+                             window=int(os.getenv('LLM_TELEMETRY_WINDOW', 1000)))
+llm_telemetry.prune(int(os.getenv('LLM_TELEMETRY_RETENTION_DAYS', 90)))
+
+# Ask for token usage on streamed calls (prefix-cache telemetry); needs a recent Azure API version
+STREAM_USAGE_OPTIONS = (
+    {"stream_options": {"include_usage": True}}
+    if os.getenv('LLM_STREAM_USAGE', '1' if AI_PROVIDER_NAME in ('openai', 'fake') else '0') == '1' else {}
+)
+
+# Estimated input-token budget for the patient history part of a prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 6000))
+
+# Incremental summaries: full regeneration after this many deltas or when too much changed at once
+SUMMARY_MAX_DELTAS = int(os.getenv('SUMMARY_MAX_DELTAS', 5))
+SUMMARY_DELTA_MAX_CHANGE_RATIO = float(os.getenv('SUMMARY_DELTA_MAX_CHANGE_RATIO', 0.3))
+
+# Hierarchical summaries for long histories: per-window map calls, then one reduce call
+SUMMARY_HIERARCHICAL = os.getenv('SUMMARY_HIERARCHICAL', '1') != '0'
+SUMMARY_WINDOW_DAYS = int(os.getenv('SUMMARY_WINDOW_DAYS', 365))
+SUMMARY_HISTORY_LIMIT = int(os.getenv('SUMMARY_HISTORY_LIMIT', 500))
+SUMMARY_WINDOW_WORKERS = int(os.getenv('SUMMARY_WINDOW_WORKERS', 4))
+WINDOW_SUMMARY_PROMPT_VERSION = hashlib.sha256(WINDOW_SUMMARY_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# Overnight pre-generation for the next day's appointments (EHR appointments table or SCHEDULE_FILE)
+OVERNIGHT_PREGENERATION = os.getenv('OVERNIGHT_PREGENERATION', '1') != '0'
+OVERNIGHT_WINDOW = parse_window(os.getenv('OVERNIGHT_WINDOW', '22:00-06:00'))
+OVERNIGHT_POLL_SECONDS = float(os.getenv('OVERNIGHT_POLL_SECONDS', 60))
+schedule_file_env = os.getenv('SCHEDULE_FILE')
+SCHEDULE_FILE = (BASE_DIR / Path(schedule_file_env).expanduser()).resolve() if schedule_file_env else None
+
+# Batch API for OpenAI/Azure (cheaper, runs within the window); local stand-in for the fake provider
+OVERNIGHT_BATCH_PROVIDER = os.getenv(
+    'OVERNIGHT_BATCH_PROVIDER', 'openai' if AI_PROVIDER_NAME in ('openai', 'foundry') else 'local'
+).lower()
+
 # ==========================================
 # 🚀 FASTAPI APP
 # ==========================================
@@ -628,6 +994,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Version"],
 )
 
 # ==========================================
@@ -642,14 +1009,116 @@ current_patient = {
     "diagnoses": [],
     "medications": []
 }
+# Bumped whenever the EHR opens another patient (sent with the current_patient push event and as ETag)
+current_patient_version = 0
+current_patient_changed_at = time.time()
+
+# Push channel for the sidecar (GET /api/events) - replaces its polling of /api/current_patient
+event_bus = EventBus(history=int(os.getenv('EVENTS_HISTORY', 500)))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv('EVENTS_KEEPALIVE_SECONDS', 15))
+
+
+def set_current_patient(patient: Dict[str, Any]) -> None:
+    """Switch the patient open in the EHR and push it to subscribers"""
+    global current_patient, current_patient_version, current_patient_changed_at
+    current_patient = patient
+    current_patient_version += 1
+    current_patient_changed_at = time.time()
+    event_bus.publish("current_patient", {"version": current_patient_version, "patient": patient})
+
+
+def summary_cached(patient_id: Any, entry: Dict[str, Any]) -> None:
+    """After a new summary is cached: prepare its response bodies, then push summary_ready"""
+    for selected in PREPARED_SUMMARY_SELECTIONS:
+        prepared_summary(patient_id, entry, selected)
+    publish_summary_ready(patient_id)
+
+
+def publish_summary_ready(patient_id: Any, revalidated: bool = False) -> None:
+    """Tell subscribers a patient's cached summary is new (or confirmed current)"""
+    event_bus.publish("summary_ready", {
+        "patient_id": patient_id,
+        "version": ai_summary_cache.version(patient_id),
+        "revalidated": revalidated
+    })
+
+# In-memory caches, bounded by approximate entry size (LRU) with a TTL for freshness;
+# expired entries regenerate cheaply through the persistent store / incremental state.
+# Keyed by canonical patient ID (see patient_cache_key) and checked against a data+prompt fingerprint.
+# Summaries use stale-while-revalidate: past the soft TTL they are served and refreshed in the
+# background, past the hard TTL they are dropped.
+SUMMARY_CACHE_SOFT_TTL_SECONDS = float(os.getenv('SUMMARY_CACHE_SOFT_TTL_SECONDS', 3600))
+SUMMARY_CACHE_HARD_TTL_SECONDS = float(os.getenv('SUMMARY_CACHE_HARD_TTL_SECONDS', 24 * 3600))
+
+# Shared L2 for multi-worker deployments (uvicorn --workers N): the caches below become per-process
+# L1s in front of one SQLite file, and per-patient generation locks hold across processes
+shared_cache_env = os.getenv('SHARED_CACHE_PATH')
+if shared_cache_env:
+    shared_cache_store = SharedCacheStore(
+        (BASE_DIR / Path(shared_cache_env).expanduser()).resolve(),
+        max_bytes=int(os.getenv('SHARED_CACHE_MAX_MB', 256)) * 1024 * 1024,
+        lock_lease_seconds=float(os.getenv('SHARED_CACHE_LOCK_LEASE_SECONDS', 60))
+    )
+    print(f"🔗 Shared cache across worker processes: {shared_cache_store.db_path}")
+else:
+    shared_cache_store = None
+
+ai_summary_cache = PatientCache(BoundedTTLCache(
+    "ai_summary",
+    max_bytes=int(os.getenv('SUMMARY_CACHE_MAX_MB', 64)) * 1024 * 1024,
+    ttl_seconds=SUMMARY_CACHE_HARD_TTL_SECONDS,
+    shared=shared_cache_store
+), soft_ttl_seconds=SUMMARY_CACHE_SOFT_TTL_SECONDS)
+drug_risk_cache = PatientCache(BoundedTTLCache(
+    "drug_risk",
+    max_bytes=int(os.getenv('DRUG_RISK_CACHE_MAX_MB', 16)) * 1024 * 1024,
+    ttl_seconds=float(os.getenv('DRUG_RISK_CACHE_TTL_SECONDS', 3600)),
+    shared=shared_cache_store
+))
+# Free-text summaries of the patient currently open in the EHR (GDT data, not the structured summary)
+current_patient_cache = PatientCache(BoundedTTLCache(
+    "current_patient_summary",
+    max_bytes=4 * 1024 * 1024,
+    ttl_seconds=SUMMARY_CACHE_SOFT_TTL_SECONDS,
+    shared=shared_cache_store
+))
+visit_reason_cache = BoundedTTLCache("visit_reason", max_bytes=1024 * 1024, ttl_seconds=12 * 3600,
+                                     shared=shared_cache_store)
+
+# Shared secret the EHR sends with change notifications (X-Events-Token); empty accepts any local caller
+EHR_EVENTS_TOKEN = os.getenv('EHR_EVENTS_TOKEN', '')
+
+# Snapshots of the in-memory caches (periodic and on shutdown), restored on startup.
+# Not needed with the shared cache - its file already survives restarts.
+CACHE_SNAPSHOT = os.getenv('CACHE_SNAPSHOT', '1') != '0' and shared_cache_store is None
+cache_snapshot_env = os.getenv('CACHE_SNAPSHOT_PATH')
+CACHE_SNAPSHOT_PATH = (BASE_DIR / Path(cache_snapshot_env).expanduser()).resolve() if cache_snapshot_env \
+    else (BASE_DIR / "cache" / "cache_snapshot.bin").resolve()
+
+
+def cache_snapshot_meta() -> Dict[str, Any]:
+    """What snapshot entries were generated with - restored only if it still matches"""
+    return {
+        "models": {"default": AI_MODEL, **model_router.routes},
+        "prompt_versions": {"summary": AI_SUMMARY_PROMPT_VERSION, "drug_risk": AI_DRUG_RISK_PROMPT_VERSION}
+    }
 
-# Cache for AI summaries to avoid repeated API calls
-ai_summary_cache = {}
-visit_reason_cache = {}
+
+cache_snapshotter = CacheSnapshotter(
+    CACHE_SNAPSHOT_PATH,
+    {
+        "ai_summary": ai_summary_cache.cache,
+        "drug_risk": drug_risk_cache.cache,
+        "current_patient": current_patient_cache.cache,
+        "visit_reason": visit_reason_cache
+    },
+    meta=cache_snapshot_meta,
+    interval_seconds=float(os.getenv('CACHE_SNAPSHOT_INTERVAL_SECONDS', 300))
+)
 
 # Background pre-loading function
 def preload_recent_patients():
-    """Pre-generate AI summaries for recent patients in background"""
+    """Pre-generate AI summaries for today's scheduled (or else recent) patients in background"""
     try:
         connection = get_db_connection()
         if not connection:
@@ -669,31 +1138,29 @@ def preload_recent_patients():
         recent_patients = cursor.fetchall()
         cursor.close()
         connection.close()
+
+        # Prefer today's remaining appointments over guessing from recent visits
+        upcoming = [appointment for appointment in load_appointments(date.today())
+                    if appointment['scheduled_at'] >= datetime.now()]
+        if upcoming:
+            recent_patients = [{'id': patient_id} for patient_id in
+                               dict.fromkeys(appointment['patient_id'] for appointment in upcoming)]
         
         if recent_patients:
             print(f"🔄 Pre-loading summaries for {len(recent_patients)} recent patients...")
             
             for patient_row in recent_patients:
                 patient_id = patient_row['id']
-                cache_key = str(patient_id)
-                
+
                 # Skip if already cached and fresh
-                if cache_key in ai_summary_cache:
-                    cached = ai_summary_cache[cache_key]
-                    age = (datetime.now() - cached['generated_at']).total_seconds()
-                    if age < 3600:  # Less than 1 hour old
-                        continue
+                if ai_summary_cache.get(patient_id) is not None and not ai_summary_cache.is_stale(patient_id):
+                    continue
                 
                 try:
-                    patient_data = get_comprehensive_patient_data(patient_id)
-                    if patient_data:
-                        ai_summary = generate_ai_summary(patient_data)
-                        ai_summary_cache[cache_key] = {
-                            'summary': ai_summary,
-                            'generated_at': datetime.now(),
-                            'patient_data': patient_data
-                        }
-                        print(f"  ✅ Pre-loaded patient {patient_id}")
+                    # Preload yields to interactive requests at the LLM admission queue
+                    with background_priority():
+                        if generate_and_cache_summary(patient_id):
+                            print(f"  ✅ Pre-loaded patient {patient_id}")
                 except Exception as e:
                     print(f"  ⚠️ Failed to pre-load patient {patient_id}: {e}")
             
@@ -701,16 +1168,252 @@ def preload_recent_patients():
     except Exception as e:
         print(f"❌ Pre-loading error: {e}")
 
-@app.on_event("startup")
-async def startup_event():
-    """Run background tasks on startup"""
-    # Skip pre-loading if requested
+# ==========================================
+# 🌙 OVERNIGHT PRE-GENERATION
+# ==========================================
+
+def _complete_in_background(**body) -> Any:
+    # Local batch requests queue behind interactive calls at LLM admission
+    with background_priority():
+        return complete_tracked("overnight_batch", **body)
+
+
+if OVERNIGHT_BATCH_PROVIDER == 'openai' and ai_client is not None and AI_PROVIDER_NAME != 'fake':
+    batch_provider = OpenAIBatchProvider(
+        ai_client, endpoint="/chat/completions" if AI_PROVIDER_NAME == 'foundry' else "/v1/chat/completions",
+        telemetry=llm_telemetry
+    )
+else:
+    batch_provider = LocalBatchProvider(_complete_in_background, workers=int(os.getenv('LLM_MAX_CONCURRENCY', 4)))
+
+
+def load_appointments(day: date) -> List[Dict[str, Any]]:
+    """Scheduled appointments for one day from SCHEDULE_FILE, or from the EHR appointments table"""
+    if SCHEDULE_FILE:
+        try:
+            return appointments_for_day(load_schedule_file(SCHEDULE_FILE), day)
+        except Exception as e:
+            print(f"❌ Could not read schedule file {SCHEDULE_FILE}: {e}")
+            return []
+
+    connection = get_db_connection()
+    if not connection:
+        return []
+    day_start = datetime.combine(day, datetime.min.time())
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT patient_id, scheduled_at, reason, status
+            FROM appointments
+            WHERE scheduled_at >= %s AND scheduled_at < %s
+            ORDER BY scheduled_at
+        """, (day_start, day_start + timedelta(days=1)))
+        rows = cursor.fetchall()
+        cursor.close()
+    except Error as e:
+        print(f"❌ Could not load appointments for {day}: {e}")
+        return []
+    finally:
+        connection.close()
+
+    appointments = [normalize_appointment(row) for row in rows]
+    return appointments_for_day([appointment for appointment in appointments if appointment], day)
+
+
+def pregenerate_for_day(day: date, deadline: Optional[datetime] = None) -> Dict[str, Any]:
+    """Pre-generate a day's summaries (in one worker process only when the cache is shared)"""
+    if shared_cache_store is None:
+        return _pregenerate_for_day(day, deadline)
+
+    day_lock = shared_cache_store.lock(f"overnight:{day.isoformat()}")
+    if not day_lock.acquire(timeout=0):
+        print(f"🌙 Pre-generation for {day} already running in another worker")
+        return {"clinic_day": day.isoformat(), "skipped": "running in another worker"}
+    try:
+        return _pregenerate_for_day(day, deadline)
+    finally:
+        day_lock.release()
+
+
+def _pregenerate_for_day(day: date, deadline: Optional[datetime] = None) -> Dict[str, Any]:
+    """Build summary prompts for everyone on a day's appointment list and submit them as one batch"""
+    appointments = load_appointments(day)
+    patient_ids = list(dict.fromkeys(appointment['patient_id'] for appointment in appointments))
+    report = {"clinic_day": day.isoformat(), "appointments": len(appointments), "patients": len(patient_ids),
+              "already_warm": 0, "submitted": 0, "generated": 0, "direct": 0, "failed": 0}
+    print(f"🌙 Pre-generating summaries for {len(patient_ids)} patients scheduled on {day}")
+
+    requests = []
+    pending = {}
+    for patient_id in patient_ids:
+        patient_data = get_comprehensive_patient_data(patient_id)
+        if not patient_data:
+            report["failed"] += 1
+            continue
+
+        state = summary_store.get(summary_state_key(patient_id), use_memory=False)
+        records = collect_source_records(patient_data)
+        if plan_update(state, records, SUMMARY_MAX_DELTAS, SUMMARY_DELTA_MAX_CHANGE_RATIO)['mode'] == 'unchanged':
+            report["already_warm"] += 1
+            continue
+
+        if SUMMARY_HIERARCHICAL:
+            history = get_comprehensive_patient_data(patient_id, history_limit=SUMMARY_HISTORY_LIMIT)
+            if history and needs_hierarchical_summary(history, PROMPT_TOKEN_BUDGET, SUMMARY_WINDOW_DAYS):
+                # Map/reduce needs the window results before the reduce prompt exists - not batchable
+                with background_priority():
+                    entry = generate_and_cache_summary(patient_id, patient_data=patient_data)
+                report["direct" if entry and "error" not in entry['summary'] else "failed"] += 1
+                continue
+
+        prompt = format_patient_data_for_ai(patient_data)
+        model = model_router.route(patient_data)['model']
+        store_key = make_content_key(prompt, model, AI_SUMMARY_PROMPT_VERSION, purpose="summary")
+        stored = summary_store.get(store_key)
+        if stored is not None:
+            save_summary_state(patient_id, records, stored)
+            report["already_warm"] += 1
+            continue
+
+        requests.append({"custom_id": str(patient_id), "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": AI_SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": 3000,
+            "response_format": response_format_for(AI_SUMMARY_JSON_SCHEMA)
+        }})
+        pending[str(patient_id)] = (patient_id, patient_data, records, store_key, model)
+
+    report["submitted"] = len(requests)
+    results = run_batch(batch_provider, requests, deadline=deadline, poll_seconds=OVERNIGHT_POLL_SECONDS)
+
+    for custom_id, (patient_id, patient_data, records, store_key, model) in pending.items():
+        result = results.get(custom_id)
+        try:
+            if result is None or "error" in result:
+                raise StructuredOutputError((result or {}).get("error", "no batch result"))
+            summary = SUMMARY_VALIDATOR.parse(result["content"])
+        except StructuredOutputError as e:
+            # Left for on-demand generation when the chart is opened
+            print(f"  ⚠️ No pre-generated summary for patient {patient_id}: {e}")
+            report["failed"] += 1
+            continue
+
+        summary_store.put(store_key, summary, purpose="summary", model=model,
+                          prompt_version=AI_SUMMARY_PROMPT_VERSION)
+        save_summary_state(patient_id, records, summary)
+        generate_and_cache_summary(patient_id, patient_data=patient_data)
+        report["generated"] += 1
+
+    print(f"🌅 Pre-generation for {day} done: {report}")
+    return report
+
+
+overnight_scheduler = OvernightScheduler(OVERNIGHT_WINDOW, pregenerate_for_day)
+
+
+def restore_cache_snapshot() -> List[int]:
+    """Load the last cache snapshot, keeping entries built with the current models and prompts.
+
+    Restored summaries are marked stale; returns the patient IDs to revalidate.
+    """
+    snapshot = cache_snapshotter.load()
+    if not snapshot:
+        return []
+
+    current = cache_snapshot_meta()
+    same_models = snapshot["meta"].get("models") == current["models"]
+    same_prompts = snapshot["meta"].get("prompt_versions") == current["prompt_versions"]
+    prompt_versions = {"ai_summary": AI_SUMMARY_PROMPT_VERSION, "drug_risk": AI_DRUG_RISK_PROMPT_VERSION}
+
+    def still_valid(name: str, value: Any) -> bool:
+        if name == "visit_reason":
+            return True
+        if not same_models:
+            return False
+        if name in prompt_versions:
+            # Entry fingerprints cover the data and prompt version; recheck against the current prompt
+            fingerprint, entry, _version = value
+            if not entry.get('fingerprint'):
+                return False
+            return cache_fingerprint(entry['fingerprint'], prompt_versions[name]) == fingerprint
+        return same_prompts
+
+    counts = {}
+    for name, cache in cache_snapshotter.caches.items():
+        items = [item for item in snapshot["caches"].get(name, []) if still_valid(name, item[1])]
+        counts[name] = cache.restore(items)
+    cache_snapshotter.record_restore(counts)
+    print(f"♻️ Restored cache snapshot from {datetime.fromtimestamp(snapshot['saved_at']):%Y-%m-%d %H:%M}: {counts}")
+
+    patient_ids = []
+    for key, _value, _age in ai_summary_cache.cache.export() + drug_risk_cache.cache.export():
+        if key.isdigit() and int(key) not in patient_ids:
+            ai_summary_cache.mark_stale(key)
+            patient_ids.append(int(key))
+    return patient_ids
+
+
+def revalidate_restored_patients(patient_ids: List[int]) -> None:
+    """Check restored entries against the current patient data (LLM calls only where it changed)"""
+    print(f"♻️ Revalidating {len(patient_ids)} restored patients...")
+    for patient_id in patient_ids:
+        try:
+            with background_priority():
+                if ai_summary_cache.peek(patient_id) is not None:
+                    revalidate_summary(patient_id)
+                else:
+                    generate_and_cache_drug_risk(patient_id)
+        except Exception as e:
+            print(f"  ⚠️ Failed to revalidate patient {patient_id}: {e}")
+    print(f"✅ Restored cache revalidated")
+
+
+def warm_up(restored_patient_ids: List[int]) -> None:
+    if restored_patient_ids:
+        revalidate_restored_patients(restored_patient_ids)
     if os.getenv('SKIP_PRELOAD'):
         print("⏩ Pre-loading skipped")
         return
-    # Start pre-loading in background thread to not block startup
-    threading.Thread(target=preload_recent_patients, daemon=True).start()
-    print("🚀 Background pre-loading initiated")
+    preload_recent_patients()
+
+
+def save_cache_snapshot() -> None:
+    if not CACHE_SNAPSHOT:
+        return
+    counts = cache_snapshotter.save()
+    if counts is not None:
+        print(f"💾 Cache snapshot saved: {counts}")
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Run background tasks on startup"""
+    if OVERNIGHT_PREGENERATION:
+        overnight_scheduler.start()
+        print(f"🌙 Overnight pre-generation scheduled for {overnight_scheduler.stats()['window']}")
+
+    restored_patient_ids = []
+    if CACHE_SNAPSHOT:
+        # Restored entries are served right away; revalidation runs in the background
+        restored_patient_ids = restore_cache_snapshot()
+        cache_snapshotter.start()
+        # The desktop app exits with the window closed, without a shutdown event
+        atexit.register(save_cache_snapshot)
+
+    # Revalidate restored entries, then pre-load, in a background thread to not block startup
+    threading.Thread(target=warm_up, args=(restored_patient_ids,), daemon=True).start()
+    print("🚀 Background warm-up initiated")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Snapshot the caches before exiting"""
+    save_cache_snapshot()
+    atexit.unregister(save_cache_snapshot)
 
 def parse_lab_date(value: Optional[str]) -> Optional[datetime]:
     """Parse flexible lab/date strings into datetime when possible."""
@@ -874,21 +1577,25 @@ def get_patient_radiology_orders(patient_id: int, limit: int = 20):
         print(f"❌ Error fetching radiology orders: {e}")
         return []
 
-def get_comprehensive_patient_data(patient_id: int):
-    """Gather all patient data for AI analysis with parallel queries"""
+def get_comprehensive_patient_data(patient_id: int, history_limit: Optional[int] = None):
+    """Gather all patient data for AI analysis with parallel queries
+
+    history_limit overrides the per-table row limits (used to load the full history).
+    """
     patient = get_patient_by_id(patient_id)
     if not patient:
         return None
     
     # Run all queries in parallel for faster loading
     data = {'patient': patient}
+    limit_args = (history_limit,) if history_limit else ()
     
     with ThreadPoolExecutor(max_workers=4) as executor:
         futures = {
-            'visits': executor.submit(get_patient_visits, patient_id),
-            'prescriptions': executor.submit(get_patient_prescriptions, patient_id),
-            'lab_orders': executor.submit(get_patient_lab_orders, patient_id),
-            'radiology_orders': executor.submit(get_patient_radiology_orders, patient_id)
+            'visits': executor.submit(get_patient_visits, patient_id, *limit_args),
+            'prescriptions': executor.submit(get_patient_prescriptions, patient_id, *limit_args),
+            'lab_orders': executor.submit(get_patient_lab_orders, patient_id, *limit_args),
+            'radiology_orders': executor.submit(get_patient_radiology_orders, patient_id, *limit_args)
         }
         
         for key, future in futures.items():
@@ -1101,36 +1808,46 @@ def format_patient_data_for_ai(data: Dict[str, Any]) -> str:
             pass
     
     # --- START OF DATA DUMP WITH VISIT REASON FOCUS ---
-    prompt = f"""
+    reason_text = f"{visit_reason.get('primary_reason', '')} {visit_reason.get('detailed_reason', '')}"
+    assembler = PromptAssembler(PROMPT_TOKEN_BUDGET, reason=reason_text)
+
+    # Stable background first and the current visit last, so consecutive prompts for a
+    # patient share the longest possible byte-identical prefix (provider prefix caching)
+    assembler.pin(f"""
 PATIENT DATA DUMP:
 
-0. CURRENT VISIT REASON - PRIMARY FOCUS FOR ANALYSIS
-"""
-    
+1. DEMOGRAPHICS
+- Name: {patient.get('first_name')} {patient.get('last_name')}
+- Age: {age}
+- Allergies: {patient.get('allergies', 'None')}
+- Chronic Conditions: {patient.get('chronic_conditions', 'None')}
+
+""")
+
+    focus = "\n6. CURRENT VISIT REASON - PRIMARY FOCUS FOR ANALYSIS\n"
     if visit_reason:
-        prompt += f"""- Primary Reason: {visit_reason.get('primary_reason', 'Not specified')}
+        focus += f"""- Primary Reason: {visit_reason.get('primary_reason', 'Not specified')}
 - Visit Type: {visit_reason.get('visit_type', 'Not specified')}
 - Priority: {visit_reason.get('priority_level', 'Normal')}
 - Detailed Reason: {visit_reason.get('detailed_reason', 'Not provided')}
 - Referring Doctor: {visit_reason.get('referring_doctor', 'None')}
 
 INSTRUCTION: Focus your analysis specifically on data related to "{visit_reason.get('primary_reason', 'general care')}" and "{visit_reason.get('detailed_reason', '')[:50]}...". Prioritize relevant historical data, medications, lab trends, and vitals related to this specific concern.
-
 """
     else:
-        prompt += "- No specific reason provided - provide general clinical summary\n\n"
+        focus += "- No specific reason provided - provide general clinical summary\n"
+    assembler.pin_tail(focus)
 
-    prompt += f"""1. DEMOGRAPHICS
-- Name: {patient.get('first_name')} {patient.get('last_name')}
-- Age: {age}
-- Allergies: {patient.get('allergies', 'None')}
-- Chronic Conditions: {patient.get('chronic_conditions', 'None')}
+    # History sections are filled by score (recency, abnormality, relevance) up to the token budget.
+    # Entries are listed oldest first and titles carry no counts (those follow the sections),
+    # so new records append instead of shifting the prefix.
+    assembler.section('visits', "2. VISIT HISTORY (chronological) - FOCUS ON VISITS RELATED TO CURRENT REASON\n")
+    assembler.section('medications', "\n3. MEDICATIONS (chronological) - HIGHLIGHT RELEVANT TO VISIT REASON\n")
+    assembler.section('labs', "\n4. LAB RESULTS (chronological) - PRIORITIZE RELEVANT TO VISIT REASON\n")
+    assembler.section('radiology', "\n5. RADIOLOGY (chronological)\n")
 
-2. VISIT HISTORY ({len(visits)} records) - FOCUS ON VISITS RELATED TO CURRENT REASON
-"""
-    
     # Add visit details with relevance scoring based on visit reason
-    for i, visit in enumerate(visits[:10], 1):
+    for visit in reversed(visits):
         visit_date = visit.get('visit_date', 'Unknown date')
         diagnosis = visit.get('diagnosis', 'N/A')
         plan = visit.get('treatment_plan', 'N/A')
@@ -1152,44 +1869,55 @@ INSTRUCTION: Focus your analysis specifically on data related to "{visit_reason.
             ] if keyword):
                 relevance_marker = " ⭐ HIGHLY RELEVANT TO CURRENT VISIT"
         
-        prompt += f"   [{visit_date}] Dx: {diagnosis} | Plan: {plan}{relevance_marker}\n"
+        entry = f"   [{visit_date}] Dx: {diagnosis} | Plan: {plan}{relevance_marker}"
         
         # Add vitals if available
         vitals = visit.get('vitals_json')
         if vitals:
-            prompt += f"   > Vitals: {vitals}\n"
+            entry += f"\n   > Vitals: {vitals}"
+
+        assembler.add('visits', entry, when=parse_lab_date(visit.get('visit_date')), relevant=bool(relevance_marker))
 
-    # Add medications with focus on relevant ones
-    prompt += f"\n3. MEDICATIONS ({len(prescriptions)} records) - HIGHLIGHT RELEVANT TO VISIT REASON\n"
+    # Add medications with focus on relevant ones (latest prescription per drug, listed oldest first)
     seen_meds = set()
-    for rx in prescriptions[:25]:
+    latest_prescriptions = []
+    for rx in prescriptions:
         med_name = rx.get('medication_name', '')
         name = str(med_name).lower() if med_name is not None else ''
         if name and name not in seen_meds:
-            # Mark medications relevant to visit reason
-            relevance_marker = ""
-            if visit_reason:
-                detailed_reason = visit_reason.get('detailed_reason', '').lower()
-                if any(condition in detailed_reason for condition in [
-                    'diabetes', 'diabetic', 'glucose', 'insulin',
-                    'hypertension', 'blood pressure', 'cardiac',
-                    'renal', 'kidney', 'dialysis',
-                    'epilepsy', 'seizure', 'neurological'
-                ]):
-                    if any(med_type in name for med_type in [
-                        'metformin', 'insulin', 'glyburide', 'glipizide',  # diabetes
-                        'lisinopril', 'amlodipine', 'hydrochlorothiazide', 'losartan',  # hypertension
-                        'furosemide', 'spironolactone', 'dialysis',  # renal
-                        'levetiracetam', 'phenytoin', 'carbamazepine', 'valproic'  # epilepsy
-                    ]):
-                        relevance_marker = " ⭐ RELEVANT TO VISIT"
-            
-            prompt += f"   - {rx.get('medication_name')} {rx.get('dosage','')} {rx.get('frequency','')}{relevance_marker}\n"
+            latest_prescriptions.append(rx)
             seen_meds.add(name)
+
+    for rx in reversed(latest_prescriptions):
+        name = str(rx.get('medication_name')).lower()
+        # Mark medications relevant to visit reason
+        relevance_marker = ""
+        if visit_reason:
+            detailed_reason = visit_reason.get('detailed_reason', '').lower()
+            if any(condition in detailed_reason for condition in [
+                'diabetes', 'diabetic', 'glucose', 'insulin',
+                'hypertension', 'blood pressure', 'cardiac',
+                'renal', 'kidney', 'dialysis',
+                'epilepsy', 'seizure', 'neurological'
+            ]):
+                if any(med_type in name for med_type in [
+                    'metformin', 'insulin', 'glyburide', 'glipizide',  # diabetes
+                    'lisinopril', 'amlodipine', 'hydrochlorothiazide', 'losartan',  # hypertension
+                    'furosemide', 'spironolactone', 'dialysis',  # renal
+                    'levetiracetam', 'phenytoin', 'carbamazepine', 'valproic'  # epilepsy
+                ]):
+                    relevance_marker = " ⭐ RELEVANT TO VISIT"
+        
+        assembler.add(
+            'medications',
+            f"   - {rx.get('medication_name')} {rx.get('dosage','')} {rx.get('frequency','')}{relevance_marker}",
+            when=parse_lab_date(rx.get('created_at')),
+            abnormal=False,
+            relevant=bool(relevance_marker)
+        )
     
     # Add lab results with focus on relevant tests
-    prompt += f"\n4. LAB RESULTS ({len(labs)} records) - PRIORITIZE RELEVANT TO VISIT REASON\n"
-    for lab in labs[:25]:
+    for lab in reversed(labs):
         lab_test_name = lab.get('test_name', '')
         test_name = str(lab_test_name).lower() if lab_test_name is not None else ''
         relevance_marker = ""
@@ -1209,26 +1937,37 @@ INSTRUCTION: Focus your analysis specifically on data related to "{visit_reason.
             ]) and any(test in test_name for test in ['creatinine', 'urea', 'egfr', 'potassium', 'phosphorus']):
                 relevance_marker = " ⭐ KEY FOR RENAL CARE"
         
-        prompt += f"   [{lab.get('ordered_at')}] {lab.get('test_name')}: {lab.get('result', 'Pending')}{relevance_marker}\n"
+        assembler.add(
+            'labs',
+            f"   [{lab.get('ordered_at')}] {lab.get('test_name')}: {lab.get('result', 'Pending')}{relevance_marker}",
+            when=parse_lab_date(lab.get('ordered_at')),
+            relevant=bool(relevance_marker)
+        )
     
     # Add radiology with relevance
-    if radiology:
-        prompt += f"\n5. RADIOLOGY ({len(radiology)} records)\n"
-        for rad in radiology[:5]:
-            prompt += f"   [{rad.get('ordered_at')}] {rad.get('test_name')}: {rad.get('result', 'Pending')}\n"
+    for rad in reversed(radiology):
+        assembler.add(
+            'radiology',
+            f"   [{rad.get('ordered_at')}] {rad.get('test_name')}: {rad.get('result', 'Pending')}",
+            when=parse_lab_date(rad.get('ordered_at'))
+        )
+
+    prompt, report = assembler.assemble()
+    print(f"📏 Prompt budget: {PromptAssembler.describe(report)}")
 
     # --- NO TASK INSTRUCTIONS HERE. THE SYSTEM PROMPT HANDLES THE TASK. ---
     
     return prompt
 
-def generate_ai_summary(patient_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Generate AI summary using OpenAI"""
+def generate_ai_summary(patient_data: Dict[str, Any], force: bool = False, on_section=None) -> Dict[str, Any]:
+    """Generate AI summary using OpenAI (deployment picked by patient complexity)"""
 
     prompt = format_patient_data_for_ai(patient_data)
     if not prompt.strip():
         return build_error_summary("No patient data available for summary generation")
 
-    summary = call_openai_for_summary(prompt, temperature=0.1)
+    model = model_router.route(patient_data)['model']
+    summary = summarize_prompt(prompt, temperature=0.1, force=force, model=model, on_section=on_section)
 
     if "error" not in summary:
         print("✅ AI Summary Generated Successfully")
@@ -1237,7 +1976,128 @@ def generate_ai_summary(patient_data: Dict[str, Any]) -> Dict[str, Any]:
 
     return summary
 
-# ==========================================
+
+def summarize_history_window(window: Dict[str, Any]) -> Dict[str, Any]:
+    """Map step: condensed summary of one time window (cached - past windows never change)"""
+    prompt = format_window_prompt(window)
+    # Condensing one window is a simple task - always use the fast deployment
+    model = model_router.routes['fast']
+    store_key = make_content_key(prompt, model, WINDOW_SUMMARY_PROMPT_VERSION, purpose="window_summary")
+    stored = summary_store.get(store_key)
+    if stored is not None:
+        return stored
+    return generation_flight.do(f"window_summary:{store_key}", _request_window_summary, prompt, store_key, model)
+
+
+def _request_window_summary(prompt: str, store_key: str, model: str) -> Dict[str, Any]:
+    try:
+        window_summary = complete_structured(
+            WINDOW_SUMMARY_VALIDATOR,
+            WINDOW_SUMMARY_JSON_SCHEMA,
+            [
+                {"role": "system", "content": WINDOW_SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            purpose="window_summary",
+            model=model,
+            temperature=0.1,
+            max_tokens=1200
+        )
+    except Exception as e:
+        print(f"❌ Window summary request failed: {e}")
+        return {"error": str(e)}
+
+    summary_store.put(store_key, window_summary, purpose="window_summary", model=model,
+                      prompt_version=WINDOW_SUMMARY_PROMPT_VERSION)
+    return window_summary
+
+
+def generate_hierarchical_summary(patient_data: Dict[str, Any], history: Dict[str, Any],
+                                  force: bool = False, model: Optional[str] = None, on_section=None) -> Dict[str, Any]:
+    """Summarize each time window of the full history in parallel, then reduce into the summary schema
+
+    With on_section only the reduce call is streamed - the window summaries are needed whole.
+    """
+    if not ai_client:
+        return build_error_summary("OpenAI API not configured")
+
+    windows = partition_history(history, SUMMARY_WINDOW_DAYS)
+    print(f"🪜 Hierarchical summary over {len(windows)} windows of {SUMMARY_WINDOW_DAYS} days")
+
+    # Worker threads keep the caller's LLM priority (interactive vs. background)
+    with ThreadPoolExecutor(max_workers=SUMMARY_WINDOW_WORKERS) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, summarize_history_window, window)
+                   for window in windows]
+        window_summaries = [future.result() for future in futures]
+
+    failed = [summary for summary in window_summaries if "error" in summary]
+    if failed:
+        return build_error_summary(f"{len(failed)} of {len(windows)} window summaries failed: {failed[0]['error']}")
+
+    prompt = build_reduce_prompt(format_patient_data_for_ai(patient_data), windows, window_summaries)
+    return summarize_prompt(prompt, temperature=0.1, force=force, model=model, on_section=on_section)
+
+
+def generate_full_summary(patient_id: int, patient_data: Dict[str, Any], force: bool = False,
+                          on_section=None) -> Dict[str, Any]:
+    """Full regeneration - hierarchical when the complete history does not fit the prompt budget"""
+    if SUMMARY_HIERARCHICAL:
+        history = get_comprehensive_patient_data(patient_id, history_limit=SUMMARY_HISTORY_LIMIT)
+        if history and needs_hierarchical_summary(history, PROMPT_TOKEN_BUDGET, SUMMARY_WINDOW_DAYS):
+            return generate_hierarchical_summary(
+                patient_data, history, force=force, model=model_router.route(history)['model'], on_section=on_section
+            )
+
+    return generate_ai_summary(patient_data, force=force, on_section=on_section)
+
+
+def summary_state_key(patient_id: int) -> str:
+    return make_content_key(f"patient:{patient_id}", AI_MODEL, AI_SUMMARY_PROMPT_VERSION, purpose="summary_state")
+
+
+def generate_incremental_summary(patient_id: int, patient_data: Dict[str, Any], force: bool = False,
+                                 on_section=None) -> Dict[str, Any]:
+    """Update the previous summary with only new/changed records, or regenerate it in full
+
+    With on_section the completion is streamed (an unchanged summary is returned without callbacks).
+    """
+    records = collect_source_records(patient_data)
+    state_key = summary_state_key(patient_id)
+    # Read from disk - another worker process may have updated this patient's state
+    state = None if force else summary_store.get(state_key, use_memory=False)
+
+    plan = plan_update(state, records, SUMMARY_MAX_DELTAS, SUMMARY_DELTA_MAX_CHANGE_RATIO)
+    print(f"🧩 Summary update for patient {patient_id}: {plan['mode']} ({plan['reason']})")
+
+    if plan['mode'] == 'unchanged':
+        return state['summary']
+
+    if plan['mode'] == 'delta':
+        prompt = build_delta_prompt(state['summary'], records, plan['changed'])
+        summary = summarize_prompt(prompt, temperature=0.1, model=model_router.route(patient_data)['model'],
+                                   on_section=on_section)
+        delta_count = state.get('delta_count', 0) + 1
+    else:
+        summary = generate_full_summary(patient_id, patient_data, force=force, on_section=on_section)
+        delta_count = 0
+
+    if "error" not in summary:
+        save_summary_state(patient_id, records, summary, delta_count)
+
+    return summary
+
+
+def save_summary_state(patient_id: int, records: Dict[str, Any], summary: Dict[str, Any], delta_count: int = 0) -> None:
+    """Remember the summary and the source records it covers, for later incremental updates"""
+    summary_store.put(summary_state_key(patient_id), {
+        'summary': summary,
+        'records': record_hashes(records),
+        'dates': record_dates(records),
+        'delta_count': delta_count,
+        'updated_at': datetime.now().isoformat()
+    }, purpose="summary_state", model=AI_MODEL, prompt_version=AI_SUMMARY_PROMPT_VERSION)
+
+# ==========================================
 # 📡 GDT PARSER
 # ==========================================
 
@@ -1261,7 +2121,7 @@ class GDTHandler(FileSystemEventHandler):
             self.read_gdt_file(event.src_path)
 
     def read_gdt_file(self, filepath):
-        global current_patient, ai_summary_cache
+        global current_patient
 
         try:
             with open(filepath, 'r', encoding='latin-1') as f:
@@ -1330,10 +2190,10 @@ class GDTHandler(FileSystemEventHandler):
                                 medications.append(label)
                         new_patient['medications'] = medications
 
-                        current_patient = new_patient
+                        set_current_patient(new_patient)
                         print(f"✅ Patient: {current_patient['firstname']} {current_patient['lastname']}")
 
-                        formatted_text = self.bdt_parser.format_for_ai(patient_data)
+                        formatted_text = self.bdt_parser.format_for_ai(patient_data, token_budget=PROMPT_TOKEN_BUDGET)
 
                         patient_db = get_patient_by_name(
                             current_patient['firstname'],
@@ -1394,7 +2254,7 @@ class GDTHandler(FileSystemEventHandler):
                     else:
                         new_data["diagnoses"].append(value.strip())
 
-            current_patient = new_data
+            set_current_patient(new_data)
             print(f"✅ DATA PARSED: {current_patient['firstname']} {current_patient['lastname']}")
 
             patient_db = get_patient_by_name(
@@ -1417,34 +2277,305 @@ class GDTHandler(FileSystemEventHandler):
             import traceback
             traceback.print_exc()
 
-def generate_and_cache_summary(patient_id: int):
-    """Generate AI summary and cache it"""
-    global ai_summary_cache
+def patient_data_fingerprint(patient_data: Dict[str, Any]) -> str:
+    """Stable hash of a patient data bundle, shared by the summary and drug risk caches"""
+    serialized = json.dumps(patient_data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
 
-    print(f"🤖 Generating AI summary for patient {patient_id}...")
 
+def cache_fingerprint(source: str, prompt_version: str) -> str:
+    """Fingerprint of the data (or prompt text) and prompt version an in-memory cache entry was built from"""
+    return hashlib.sha256(f"{prompt_version}\x00{source}".encode("utf-8")).hexdigest()[:16]
+
+
+def summary_source_fingerprint(patient_data: Optional[Dict[str, Any]], bdt_text: Optional[str] = None) -> str:
+    """Fingerprint stored on summary entries: the data bundle, plus the exported record for BDT summaries"""
+    data_fingerprint = patient_data_fingerprint(patient_data) if patient_data else ""
+    if bdt_text is None:
+        return data_fingerprint
+    return hashlib.sha256(f"bdt\x00{bdt_text}\x00{data_fingerprint}".encode("utf-8")).hexdigest()[:16]
+
+
+def generate_and_cache_summary(patient_id: int, force: bool = False,
+                               patient_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Generate AI summary and cache it (concurrent callers for one patient share the work)"""
+    flight_key = f"patient_summary:{patient_cache_key(patient_id)}" + (":force" if force else "")
+    return generation_flight.do(flight_key, _generate_and_cache_summary, patient_id, force, patient_data)
+
+
+summary_refreshes = set()
+# Patients whose data changed while their refresh was already running (refreshed once more)
+summary_refreshes_pending = set()
+summary_refreshes_lock = threading.Lock()
+
+
+def refresh_summary_in_background(patient_id: int, force: bool = False, changed: bool = False) -> bool:
+    """Revalidate a patient's cached summary in the background (one refresh per patient at a time)"""
+    key = patient_cache_key(patient_id)
+    with summary_refreshes_lock:
+        if key in summary_refreshes:
+            if changed:
+                # The running refresh may have read the data before this change
+                summary_refreshes_pending.add(key)
+            return False
+        summary_refreshes.add(key)
+
+    def run():
+        while True:
+            try:
+                if changed:
+                    # Change notifications yield to interactive requests at the LLM admission queue
+                    with background_priority():
+                        revalidate_summary(patient_id, force=force)
+                else:
+                    revalidate_summary(patient_id, force=force)
+            except Exception as e:
+                print(f"⚠️ Background refresh for patient {patient_id} failed: {e}")
+            with summary_refreshes_lock:
+                if key not in summary_refreshes_pending:
+                    summary_refreshes.discard(key)
+                    return
+                summary_refreshes_pending.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+    print(f"🔄 Background refresh started for patient {patient_id}")
+    return True
+
+
+def summary_refreshing(patient_id: int) -> bool:
+    with summary_refreshes_lock:
+        return patient_cache_key(patient_id) in summary_refreshes
+
+
+def revalidate_summary(patient_id: int, force: bool = False) -> Optional[Dict[str, Any]]:
+    """Refetch the patient's data; keep the cached summary if it was built from the same data, else regenerate"""
     patient_data = get_comprehensive_patient_data(patient_id)
+    if not patient_data:
+        return None
+
+    # A cached drug risk assessment is brought up to date from the same fetch (regenerated only if the data changed)
+    if drug_risk_cache.peek(patient_id) is not None:
+        generate_and_cache_drug_risk(patient_id, patient_data)
+
+    # Summaries generated from a BDT export are checked (and rebuilt) together with that record
+    cached = ai_summary_cache.peek(patient_id)
+    bdt_text = cached.get('bdt_formatted', "") if cached and cached.get('source') == 'bdt' else None
+
+    fingerprint = cache_fingerprint(summary_source_fingerprint(patient_data, bdt_text), AI_SUMMARY_PROMPT_VERSION)
+    if not force:
+        with ai_summary_cache.lock(patient_id):
+            if ai_summary_cache.fingerprint(patient_id) == fingerprint and ai_summary_cache.touch(patient_id):
+                print(f"✅ Summary for patient {patient_id} revalidated (data unchanged)")
+                publish_summary_ready(patient_id, revalidated=True)
+                return ai_summary_cache.peek(patient_id)
+
+    if bdt_text is not None:
+        return generate_and_cache_summary_from_bdt(patient_id, bdt_text, force=force, patient_data=patient_data)
+    return generate_and_cache_summary(patient_id, force=force, patient_data=patient_data)
+
+
+patient_change_stats = {"events": 0, "patients": 0, "refreshed": 0, "ignored": 0}
+
+
+def handle_patient_changes(patient_ids: List[int], source: str = "") -> Dict[str, Any]:
+    """Mark cached entries of changed patients stale and revalidate them in the background.
+
+    Patients without cached summaries (not viewed recently) are ignored - they are
+    generated from fresh data when next opened.
+    """
+    refreshing, ignored = [], []
+    for patient_id in dict.fromkeys(patient_ids):
+        was_cached = ai_summary_cache.mark_stale(patient_id)
+        if not (was_cached or drug_risk_cache.peek(patient_id) is not None):
+            ignored.append(patient_id)
+            continue
+        refresh_summary_in_background(patient_id, changed=True)
+        refreshing.append(patient_id)
+
+    patient_change_stats["events"] += 1
+    patient_change_stats["patients"] += len(refreshing) + len(ignored)
+    patient_change_stats["refreshed"] += len(refreshing)
+    patient_change_stats["ignored"] += len(ignored)
+    print(f"🔔 Change notification{f' from {source}' if source else ''}: "
+          f"refreshing {refreshing or 'none'}, {len(ignored)} not cached")
+    return {"refreshing": refreshing, "ignored": ignored}
+
+
+def _generate_and_cache_summary(patient_id: int, force: bool,
+                                patient_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    print(f"🤖 Generating AI summary for patient {patient_id}...")
+
+    if patient_data is None:
+        patient_data = get_comprehensive_patient_data(patient_id)
 
     if not patient_data:
         print(f"❌ Could not retrieve patient data")
-        return
+        return None
 
-    summary = generate_ai_summary(patient_data)
+    data_fingerprint = patient_data_fingerprint(patient_data)
+    fingerprint = cache_fingerprint(data_fingerprint, AI_SUMMARY_PROMPT_VERSION)
 
-    cache_key = str(patient_id)
-    ai_summary_cache[cache_key] = {
-        'summary': summary,
-        'generated_at': datetime.now(),
-        'patient_data': patient_data  # Include raw data for display
-    }
+    # One producer per patient at a time (watcher, preload, request threads)
+    with ai_summary_cache.lock(patient_id):
+        cached = None if force else ai_summary_cache.get(patient_id, fingerprint)
+        if cached is not None:
+            print(f"📦 Summary for patient {patient_id} already cached for this data")
+            return cached
+
+        event_bus.publish("summary_progress", {"patient_id": patient_id, "stage": "started"})
+        summary = generate_incremental_summary(patient_id, patient_data, force=force)
+
+        entry = {
+            'summary': summary,
+            'generated_at': datetime.now(),
+            'patient_data': patient_data,  # Include raw data for display
+            'fingerprint': data_fingerprint
+        }
+        if "error" in summary:
+            # Failures are never cached - the next request tries again
+            event_bus.publish("summary_progress", {"patient_id": patient_id, "stage": "failed"})
+            previous = ai_summary_cache.peek(patient_id)
+            if previous is not None:
+                # Provider unhealthy - keep serving the last good summary
+                print(f"🛟 Keeping cached summary for patient {patient_id} after failed generation")
+                return previous
+            return entry
+        ai_summary_cache.set(patient_id, fingerprint, entry)
 
     print(f"✅ AI summary cached for patient {patient_id}")
+    summary_cached(patient_id, entry)
+    return entry
+
+
+def stream_and_cache_summary(patient_id: int, patient_data: Dict[str, Any], force: bool = False,
+                             on_section=None) -> Dict[str, Any]:
+    """Like generate_and_cache_summary, but streamed: on_section(section) is called as each one completes.
+
+    Shares the single-flight key with generate_and_cache_summary - a caller that joins a running
+    generation gets the finished entry without section callbacks.
+    """
+    flight_key = f"patient_summary:{patient_cache_key(patient_id)}" + (":force" if force else "")
+    return generation_flight.do(flight_key, _stream_and_cache_summary, patient_id, patient_data, force, on_section)
 
 
-def generate_and_cache_summary_from_bdt(patient_id: int, bdt_formatted_text: str):
+def _stream_and_cache_summary(patient_id: int, patient_data: Dict[str, Any], force: bool,
+                              on_section=None) -> Dict[str, Any]:
+    data_fingerprint = patient_data_fingerprint(patient_data)
+    fingerprint = cache_fingerprint(data_fingerprint, AI_SUMMARY_PROMPT_VERSION)
+
+    with ai_summary_cache.lock(patient_id):
+        cached = None if force else ai_summary_cache.get(patient_id, fingerprint)
+        if cached is not None:
+            return cached
+
+        event_bus.publish("summary_progress", {"patient_id": patient_id, "stage": "started"})
+        # Same delta plan as the non-streamed path: unchanged records reuse the summary, a few new ones stream a delta
+        summary = generate_incremental_summary(patient_id, patient_data, force=force, on_section=on_section)
+
+        entry = {
+            'summary': summary,
+            'generated_at': datetime.now(),
+            'patient_data': patient_data,
+            'fingerprint': data_fingerprint
+        }
+        if "error" in summary:
+            # Failures are never cached - the next request tries again
+            event_bus.publish("summary_progress", {"patient_id": patient_id, "stage": "failed"})
+            previous = ai_summary_cache.peek(patient_id)
+            if previous is not None:
+                # Provider unhealthy - keep serving the last good summary
+                print(f"🛟 Keeping cached summary for patient {patient_id} after failed generation")
+                return previous
+            return entry
+        ai_summary_cache.set(patient_id, fingerprint, entry)
+
+    summary_cached(patient_id, entry)
+    return entry
+
+
+def generate_and_cache_drug_risk(patient_id: int, patient_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Generate the drug risk assessment and cache it under the patient data fingerprint"""
+    return generation_flight.do(
+        f"patient_drug_risk:{patient_cache_key(patient_id)}", _generate_and_cache_drug_risk, patient_id, patient_data
+    )
+
+
+def _generate_and_cache_drug_risk(patient_id: int, patient_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    if patient_data is None:
+        patient_data = get_comprehensive_patient_data(patient_id)
+    if not patient_data:
+        return None
+
+    data_fingerprint = patient_data_fingerprint(patient_data)
+    fingerprint = cache_fingerprint(data_fingerprint, AI_DRUG_RISK_PROMPT_VERSION)
+
+    with drug_risk_cache.lock(patient_id):
+        cached = drug_risk_cache.get(patient_id, fingerprint)
+        if cached and "error" not in cached['assessment']:
+            return cached
+
+        assessment = generate_drug_risk_assessment(patient_data)
+        previous = drug_risk_cache.peek(patient_id)
+        if "error" in assessment and previous and "error" not in previous['assessment']:
+            print(f"🛟 Keeping cached drug risk assessment for patient {patient_id} after failed generation")
+            return previous
+
+        patient = patient_data.get('patient') or {}
+        entry = {
+            'assessment': assessment,
+            'generated_at': datetime.now(),
+            'fingerprint': data_fingerprint,
+            'patient_name': f"{patient.get('first_name', '')} {patient.get('last_name', '')}"
+        }
+        if "error" in assessment:
+            # Returned to this caller only - the next request retries generation
+            return entry
+        drug_risk_cache.set(patient_id, fingerprint, entry)
+    event_bus.publish("drug_risk_ready", {"patient_id": patient_id, "version": drug_risk_cache.version(patient_id)})
+    return entry
+
+
+def run_patient_analysis(patient_id: int, on_part=None) -> Optional[Dict[str, Any]]:
+    """Fetch the patient bundle once and run summary and drug risk generation concurrently.
+
+    on_part(name, entry) is called as each part finishes, in completion order.
+    """
+    patient_data = get_comprehensive_patient_data(patient_id)
+    if not patient_data:
+        return None
+
+    fingerprint = patient_data_fingerprint(patient_data)
+    parts = {}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {
+            executor.submit(generate_and_cache_summary, patient_id, False, patient_data): 'summary',
+            executor.submit(generate_and_cache_drug_risk, patient_id, patient_data): 'drug_risk'
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            parts[name] = future.result()
+            if on_part:
+                on_part(name, parts[name])
+
+    return {
+        'patient_data': patient_data,
+        'fingerprint': fingerprint,
+        'summary': parts.get('summary'),
+        'drug_risk': parts.get('drug_risk')
+    }
+
+
+def generate_and_cache_summary_from_bdt(patient_id: int, bdt_formatted_text: str, force: bool = False,
+                                        patient_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     """Generate AI summary using combined BDT and database data"""
-    global ai_summary_cache
+    flight_key = f"patient_summary:{patient_cache_key(patient_id)}" + (":force" if force else "")
+    return generation_flight.do(
+        flight_key, _generate_and_cache_summary_from_bdt, patient_id, bdt_formatted_text, force, patient_data
+    )
 
+
+def _generate_and_cache_summary_from_bdt(patient_id: int, bdt_formatted_text: str, force: bool = False,
+                                         patient_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     print(f"🤖 Generating AI summary for patient {patient_id} using BDT data...")
 
     sections = ["=== BDT PATIENT RECORD ==="]
@@ -1452,27 +2583,44 @@ def generate_and_cache_summary_from_bdt(patient_id: int, bdt_formatted_text: str
     if base_text:
         sections.append(base_text)
 
-    patient_data = get_comprehensive_patient_data(patient_id)
+    if patient_data is None:
+        patient_data = get_comprehensive_patient_data(patient_id)
 
     if patient_data:
         sections.append("=== ADDITIONAL DATABASE INFORMATION ===")
         sections.append(format_patient_data_for_ai(patient_data))
 
     combined_prompt = "\n\n".join(sections)
-    summary = generate_ai_summary_from_text(combined_prompt)
-
-    cache_key = str(patient_id)
-    ai_summary_cache[cache_key] = {
-        'summary': summary,
-        'generated_at': datetime.now(),
-        'patient_data': patient_data,
-        'source': 'bdt'
-    }
-
-    if base_text:
-        ai_summary_cache[cache_key]['bdt_formatted'] = base_text
-
+    # Same key revalidate_summary and the snapshot restore derive from the entry
+    source_fingerprint = summary_source_fingerprint(patient_data, base_text)
+    fingerprint = cache_fingerprint(source_fingerprint, AI_SUMMARY_PROMPT_VERSION)
+
+    with ai_summary_cache.lock(patient_id):
+        cached = None if force else ai_summary_cache.get(patient_id, fingerprint)
+        if cached is not None:
+            return cached
+
+        summary = generate_ai_summary_from_text(combined_prompt)
+
+        entry = {
+            'summary': summary,
+            'generated_at': datetime.now(),
+            'patient_data': patient_data,
+            'fingerprint': source_fingerprint,
+            'source': 'bdt',
+            'bdt_formatted': base_text
+        }
+        if "error" in summary:
+            previous = ai_summary_cache.peek(patient_id)
+            if previous is not None:
+                print(f"🛟 Keeping cached summary for patient {patient_id} after failed generation")
+                return previous
+            return entry
+
+        ai_summary_cache.set(patient_id, fingerprint, entry)
     print(f"✅ AI summary cached for patient {patient_id} (BDT)")
+    summary_cached(patient_id, entry)
+    return entry
 
 
 def generate_ai_summary_from_bdt_text(bdt_formatted_text: str):
@@ -1534,25 +2682,6 @@ def get_current_patient_summary():
     if not current_patient:
         raise HTTPException(status_code=404, detail="No patient data available. Load a patient file first.")
     
-    # Check if we have cached summary for current patient
-    patient_key = f"{current_patient['firstname']}_{current_patient['lastname']}"
-    current_time = datetime.now()
-    
-    if patient_key in ai_summary_cache:
-        cached = ai_summary_cache[patient_key]
-        age_seconds = (current_time - cached['generated_at']).total_seconds()
-        
-        if age_seconds < 3600:  # 1 hour cache
-            print(f"📦 Returning cached summary for {patient_key}")
-            return {
-                "patient": current_patient,
-                "ai_summary": cached['summary'],
-                "cached": True,
-                "age_seconds": int(age_seconds)
-            }
-    
-    print(f"🔄 Generating fresh AI summary for {patient_key}")
-    
     # Create patient context for AI
     patient_context = f"""
 Patient: {current_patient['firstname']} {current_patient['lastname']}
@@ -1565,34 +2694,53 @@ Diagnoses:
 Medications:
 {chr(10).join(f"- {med}" for med in current_patient['medications'])}
 """
+    user_content = f"Please provide an AI summary for this patient based on their current data:\n\n{patient_context}"
+
+    # Keyed by the EHR patient ID (name only when the export has none), checked against the exported data
+    patient_key = current_patient_key()
+    fingerprint = cache_fingerprint(user_content, AI_SUMMARY_PROMPT_VERSION)
+    current_time = datetime.now()
+
+    cached = current_patient_cache.get(patient_key, fingerprint)
+    if cached is not None:
+        print(f"📦 Returning cached summary for {patient_key}")
+        return {
+            "patient": current_patient,
+            "ai_summary": cached['summary'],
+            "cached": True,
+            "age_seconds": int((current_time - cached['generated_at']).total_seconds())
+        }
+    
+    print(f"🔄 Generating fresh AI summary for {patient_key}")
 
     try:
         if not ai_client:
             return {'error': 'AI service not configured'}
+
+        store_key = make_content_key(user_content, AI_MODEL, AI_SUMMARY_PROMPT_VERSION, purpose="current_patient_summary")
+        stored = summary_store.get(store_key)
+        if stored is not None:
+            current_patient_cache.set(patient_key, fingerprint, {
+                'summary': stored['content'],
+                'generated_at': current_time
+            })
+            return {
+                "patient": current_patient,
+                "ai_summary": stored['content'],
+                "cached": True,
+                "age_seconds": 0
+            }
         
-        response = ai_client.chat.completions.create(
-            model=AI_MODEL,
-            messages=[
-                {
-                    "role": "system", 
-                    "content": AI_SUMMARY_SYSTEM_PROMPT
-                },
-                {
-                    "role": "user", 
-                    "content": f"Please provide an AI summary for this patient based on their current data:\\n\\n{patient_context}"
-                }
-            ],
-            temperature=0.3,
-            max_tokens=2000
+        # The sidecar polls every second - overlapping polls wait on the same call
+        ai_summary = generation_flight.do(
+            f"current_patient_summary:{store_key}", _request_current_patient_completion, user_content, store_key
         )
         
-        ai_summary = response.choices[0].message.content
-        
         # Cache the summary
-        ai_summary_cache[patient_key] = {
+        current_patient_cache.set(patient_key, fingerprint, {
             'summary': ai_summary,
             'generated_at': current_time
-        }
+        })
         
         return {
             "patient": current_patient,
@@ -1603,76 +2751,369 @@ Medications:
         
     except Exception as e:
         print(f"❌ Error generating AI summary: {e}")
+        cached = current_patient_cache.peek(patient_key)
+        if cached:
+            # Fail fast to the last known summary while the provider is unhealthy
+            return {
+                "patient": current_patient,
+                "ai_summary": cached['summary'],
+                "cached": True,
+                "age_seconds": int((current_time - cached['generated_at']).total_seconds()),
+                "provider_unavailable": isinstance(e, ProviderUnavailableError)
+            }
         raise HTTPException(status_code=500, detail=f"Failed to generate AI summary: {str(e)}")
 
+
+def current_patient_key() -> str:
+    """Cache key for the patient currently open in the EHR"""
+    patient_id = str(current_patient.get('id') or '').strip()
+    if patient_id and patient_id not in ('--', 'Unknown'):
+        return patient_cache_key(patient_id)
+    return patient_cache_key(f"name:{current_patient['firstname']}_{current_patient['lastname']}")
+
+def _request_current_patient_completion(user_content: str, store_key: str) -> str:
+    response = complete_tracked(
+        "current_patient_summary",
+        model=AI_MODEL,
+        messages=[
+            {
+                "role": "system", 
+                "content": AI_SUMMARY_SYSTEM_PROMPT
+            },
+            {
+                "role": "user", 
+                "content": user_content
+            }
+        ],
+        temperature=0.3,
+        max_tokens=2000
+    )
+
+    ai_summary = response.choices[0].message.content
+    summary_store.put(store_key, {'content': ai_summary}, purpose="current_patient_summary",
+                      model=AI_MODEL, prompt_version=AI_SUMMARY_PROMPT_VERSION)
+    return ai_summary
+
+# ==========================================
+# 🔁 CONDITIONAL GET / LONG-POLLING
+# ==========================================
+
+# Summary responses are compressed (gzip, or brotli if installed) once they reach this size
+response_encoder = ResponseEncoder(min_size=int(os.getenv('COMPRESS_MIN_BYTES', 1024)))
+
+# Longest a wait_for_version request is held open before answering with the unchanged state
+LONG_POLL_TIMEOUT_SECONDS = float(os.getenv('LONG_POLL_TIMEOUT_SECONDS', 25))
+
+# Part of every ETag, so versions counted by an earlier run never match
+SERVER_INSTANCE = uuid.uuid4().hex[:8]
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """If-None-Match check (weak comparison, as used for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip_weak = lambda tag: tag[2:] if tag.startswith("W/") else tag
+    return any(strip_weak(tag.strip()) == strip_weak(etag) for tag in if_none_match.split(","))
+
+
+def validator_headers(etag: str, modified_at: float, version: Optional[int]) -> Dict[str, str]:
+    """ETag/Last-Modified headers; no-cache makes browsers revalidate instead of re-downloading"""
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified_at, usegmt=True),
+        "Cache-Control": "no-cache",
+        "X-Version": str(version if version is not None else "")
+    }
+
+
+def summary_content_hash(entry: Dict[str, Any]) -> str:
+    """Hash of a cached summary's content (computed once per entry)"""
+    content_hash = entry.get('content_hash')
+    if content_hash is None:
+        content = json.dumps(entry['summary'], sort_keys=True, default=str) + str(entry.get('fingerprint'))
+        content_hash = hashlib.sha256(content.encode()).hexdigest()[:20]
+        entry['content_hash'] = content_hash
+    return content_hash
+
+
 @app.get("/api/current_patient")
-def get_patient():
-    """Get current patient from GDT"""
+async def get_patient(response: Response, wait_for_version: Optional[int] = None,
+                      if_none_match: Optional[str] = Header(None)):
+    """Get current patient from GDT.
+
+    With wait_for_version, waits (long-poll) until the patient differs from that version.
+    """
+    if wait_for_version is not None:
+        await event_bus.wait_until(lambda: current_patient_version != wait_for_version, LONG_POLL_TIMEOUT_SECONDS)
+
+    headers = validator_headers(f'"{SERVER_INSTANCE}-{current_patient_version}"',
+                                current_patient_changed_at, current_patient_version)
+    if etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return current_patient
 
-@app.get("/api/patient/{patient_id}/summary")
-def get_patient_summary(patient_id: int, force_refresh: bool = False):
-    """Get comprehensive patient summary with AI analysis"""
-    
-    cache_key = str(patient_id)
-    current_time = datetime.now()
+@app.get("/api/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Push channel (Server-Sent Events): current patient, summary progress/ready, drug risk ready.
 
-    # Check cache first - ALWAYS return cached data if available (instant response)
-    if cache_key in ai_summary_cache and not force_refresh:
-        cached = ai_summary_cache[cache_key]
-        generated_at = cached['generated_at']
+    Reconnecting clients send Last-Event-ID and get the events they missed replayed;
+    new clients (or ones too far behind) start with a current_patient snapshot.
+    """
+    try:
+        after = int(last_event_id) if last_event_id else None
+    except ValueError:
+        after = None
 
-        if isinstance(generated_at, datetime):
-            delta = current_time - generated_at
-            age_seconds = delta.total_seconds()
-        elif isinstance(generated_at, str):
-            try:
-                parsed = datetime.fromisoformat(generated_at)
-                delta = current_time - parsed
-                age_seconds = delta.total_seconds()
-                generated_at = parsed
-            except (ValueError, TypeError):
-                age_seconds = 0
-        else:
-            age_seconds = 0
+    subscription, replay = event_bus.subscribe(after)
 
-        is_stale = age_seconds > 3600  # 1 hour
-        
-        print(f"📦 Returning cached summary for patient {patient_id} (age: {age_seconds:.0f}s)")
-        return {
-            "cached": True,
-            "is_stale": is_stale,
-            "age_seconds": int(age_seconds),
-            "generated_at": generated_at.isoformat() if isinstance(generated_at, datetime) else str(generated_at),
-            "ai_summary": cached['summary'],
-            "patient_data": cached['patient_data']
-        }
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            if replay is None:
+                snapshot = {"version": current_patient_version, "patient": current_patient}
+                yield format_sse("current_patient", snapshot, event_id=event_bus.last_id)
+            sent = after or 0
+            for event in replay or []:
+                yield format_sse(event["type"], event["data"], event_id=event["id"])
+                sent = event["id"]
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Fell too far behind - the client reconnects and replays from its last id
+                    return
+                if event["id"] <= sent:
+                    continue
+                yield format_sse(event["type"], event["data"], event_id=event["id"])
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/patient/{patient_id}/summary")
+async def get_patient_summary(patient_id: int, force_refresh: bool = False, wait_for_version: Optional[int] = None,
+                              fields: Optional[str] = None, include: Optional[str] = None,
+                              if_none_match: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
+    """Get comprehensive patient summary with AI analysis (stale-while-revalidate).
+
+    The default response is compact (no raw patient_data); include= adds patient_data sections
+    (e.g. include=lab_orders, or include=patient_data for all), fields= selects exactly which
+    fields are returned (e.g. fields=version,ai_summary.red_flags).
+    Answers If-None-Match with 304 when the content is unchanged; with wait_for_version,
+    waits (long-poll) until the cached version differs from it.
+    """
+    if wait_for_version is not None:
+        await wait_for_summary_change(patient_id, wait_for_version)
+    return await run_in_threadpool(_get_patient_summary, patient_id, force_refresh, summary_fields(fields, include),
+                                   if_none_match, accept_encoding)
+
+
+async def wait_for_summary_change(patient_id: int, version: int) -> None:
+    """Long-poll: return once the cached summary is no longer `version`, or was revalidated.
+
+    The version is read in the threadpool (the cache may be backed by SQLite); after
+    that, waiting only watches the event bus.
+    """
+    after = event_bus.last_id
+    if await run_in_threadpool(ai_summary_cache.version, patient_id) != version:
+        return
+    key = patient_cache_key(patient_id)
+    await event_bus.wait_for(
+        lambda event: event["type"] == "summary_ready" and patient_cache_key(event["data"]["patient_id"]) == key,
+        LONG_POLL_TIMEOUT_SECONDS, after=after
+    )
+
+
+def _get_patient_summary(patient_id: int, force_refresh: bool, selected: List[str],
+                         if_none_match: Optional[str], accept_encoding: Optional[str]) -> Response:
+    # Any cached entry within the hard TTL is returned instantly; stale or force-refreshed
+    # entries are revalidated in the background and picked up through the version field
+    cached = ai_summary_cache.get(patient_id)
+    if cached is not None:
+        is_stale = ai_summary_cache.is_stale(patient_id)
+        if is_stale or force_refresh:
+            refresh_summary_in_background(patient_id, force=force_refresh)
+
+        # Checked before building the payload - an unchanged summary costs no serialization
+        headers = summary_validator_headers(patient_id, cached, is_stale, selected)
+        if etag_matches(headers["ETag"], if_none_match):
+            return Response(status_code=304, headers=headers)
+        age_seconds = (datetime.now() - cached['generated_at']).total_seconds()
+
+        print(f"📦 Returning cached summary for patient {patient_id} (age: {age_seconds:.0f}s, stale: {is_stale})")
+        return response_encoder.prepared_response(
+            prepared_summary(patient_id, cached, selected),
+            project(summary_live_fields(patient_id, cached, cached=True, is_stale=is_stale), selected),
+            accept_encoding, headers
+        )
     
-    # Generate new summary (only if no cache or forced refresh)
+    # Nothing cached (or past the hard TTL) - generate now
     print(f"🔄 Generating fresh summary for patient {patient_id}")
-    patient_data = get_comprehensive_patient_data(patient_id)
+    entry = generate_and_cache_summary(patient_id)
     
-    if not patient_data:
+    if not entry:
         raise HTTPException(status_code=404, detail="Patient not found")
     
-    ai_summary = generate_ai_summary(patient_data)
-    
-    # Cache it
-    ai_summary_cache[cache_key] = {
-        'summary': ai_summary,
-        'generated_at': current_time,
-        'patient_data': patient_data
+    headers = summary_validator_headers(patient_id, entry, False, selected)
+    return response_encoder.prepared_response(
+        prepared_summary(patient_id, entry, selected),
+        project(summary_live_fields(patient_id, entry, cached=False), selected),
+        accept_encoding, headers
+    )
+
+
+def summary_validator_headers(patient_id: int, entry: Dict[str, Any], is_stale: bool,
+                              selected: List[str]) -> Dict[str, str]:
+    """Weak ETag: same summary content, staleness and field selection, regardless of the age field"""
+    flags = f"{int(is_stale)}{int(summary_refreshing(patient_id))}"
+    variant = hashlib.sha1(",".join(selected).encode()).hexdigest()[:8]
+    return validator_headers(f'W/"{summary_content_hash(entry)}-{flags}-{variant}"',
+                             entry['generated_at'].timestamp(), ai_summary_cache.version(patient_id))
+
+
+# Compact default: the sidecar renders the summary, raw rows are only sent when asked for (include=)
+SUMMARY_DEFAULT_FIELDS = ["cached", "is_stale", "refreshing", "version", "age_seconds", "generated_at", "ai_summary"]
+
+
+def summary_fields(fields: Optional[str], include: Optional[str]) -> List[str]:
+    """Field selection from the fields= and include= query parameters"""
+    selected = parse_list(fields) or list(SUMMARY_DEFAULT_FIELDS)
+    for section in parse_list(include):
+        selected.append("patient_data" if section in ("all", "patient_data") else f"patient_data.{section}")
+    return selected
+
+
+# Selections whose bodies are prepared as soon as a summary is cached: the default and the sidecar's
+PREPARED_SUMMARY_SELECTIONS = [SUMMARY_DEFAULT_FIELDS, summary_fields(None, "lab_orders")]
+
+# Serialized (and deflated) summary bodies, keyed by entry and field selection. Per process and
+# rebuilt on demand, so neither shared between workers nor snapshotted.
+summary_body_cache = BoundedTTLCache(
+    "summary_bodies",
+    max_bytes=int(os.getenv('SUMMARY_BODY_CACHE_MAX_MB', 32)) * 1024 * 1024,
+    ttl_seconds=SUMMARY_CACHE_HARD_TTL_SECONDS
+)
+
+
+def summary_static_fields(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary fields fixed for the lifetime of a cache entry"""
+    return {
+        "generated_at": entry['generated_at'].isoformat(),
+        "ai_summary": entry['summary'],
+        "patient_data": entry.get('patient_data')
     }
-    
+
+
+def summary_live_fields(patient_id: int, entry: Dict[str, Any], cached: bool, is_stale: bool = False) -> Dict[str, Any]:
+    """Summary fields that change from request to request"""
     return {
-        "cached": False,
-        "is_stale": False,
-        "age_seconds": 0,
-        "generated_at": current_time.isoformat(),
-        "ai_summary": ai_summary,
-        "patient_data": patient_data
+        "cached": cached,
+        "is_stale": is_stale,
+        "refreshing": summary_refreshing(patient_id),
+        "version": ai_summary_cache.version(patient_id),
+        "age_seconds": int((datetime.now() - entry['generated_at']).total_seconds())
     }
 
+
+def prepared_summary(patient_id: int, entry: Dict[str, Any], selected: List[str]) -> PreparedJSON:
+    """The entry's static fields for this selection, serialized once (built here if not prepared at write time)"""
+    key = (patient_cache_key(patient_id), summary_content_hash(entry), entry['generated_at'].isoformat(),
+           ",".join(selected))
+    prepared = summary_body_cache.get(key)
+    if prepared is None:
+        prepared = response_encoder.prepare(project(summary_static_fields(entry), selected))
+        summary_body_cache.set(key, prepared)
+    return prepared
+
+
+def summary_response(patient_id: int, entry: Dict[str, Any], cached: bool, is_stale: bool = False,
+                     fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Summary payload for the streaming endpoint (all fields unless a selection is given)"""
+    payload = {**summary_live_fields(patient_id, entry, cached, is_stale), **summary_static_fields(entry)}
+    return project(payload, fields) if fields is not None else payload
+
+@app.get("/api/patient/{patient_id}/summary/stream")
+def stream_patient_summary(patient_id: int, force_refresh: bool = False,
+                           fields: Optional[str] = None, include: Optional[str] = None):
+    """Stream the patient summary as Server-Sent Events, one event per completed section.
+
+    The closing "complete" event takes the same fields=/include= selection as /summary.
+    """
+    selected = summary_fields(fields, include)
+
+    def events():
+        entry = None if force_refresh else ai_summary_cache.get(patient_id)
+
+        # Another path is already generating this patient - wait for it instead of a second LLM call
+        if entry is None and generation_flight.in_flight(f"patient_summary:{patient_cache_key(patient_id)}"):
+            entry = generate_and_cache_summary(patient_id)
+
+        if entry is not None:
+            is_stale = ai_summary_cache.is_stale(patient_id)
+            if is_stale:
+                refresh_summary_in_background(patient_id)
+            for key, value in entry['summary'].items():
+                yield format_sse("section", {"key": key, "value": value})
+            yield format_sse("complete", summary_response(patient_id, entry, cached=True, is_stale=is_stale,
+                                                          fields=selected))
+            return
+
+        patient_data = get_comprehensive_patient_data(patient_id)
+        if not patient_data:
+            yield format_sse("error", {"detail": "Patient not found"})
+            return
+
+        # The sidecar asks for drug risk next - start it now on the same data bundle (single-flight)
+        threading.Thread(target=generate_and_cache_drug_risk, args=(patient_id, patient_data), daemon=True).start()
+
+        # Generated in a worker under the patient's single-flight key, so other requests join it;
+        # it finishes and caches the summary even if this client disconnects
+        parts: "queue.Queue" = queue.Queue()
+
+        def worker():
+            try:
+                entry = stream_and_cache_summary(patient_id, patient_data, force_refresh,
+                                                 on_section=lambda section: parts.put(("section", section)))
+                parts.put(("complete", entry))
+            except Exception as e:
+                parts.put(("error", str(e)))
+
+        threading.Thread(target=worker, daemon=True).start()
+        streamed = False
+        while True:
+            name, payload = parts.get()
+            if name == "error":
+                yield format_sse("error", {"detail": payload})
+                return
+            if name == "complete":
+                break
+            streamed = True
+            yield format_sse("section", payload)
+
+        entry = payload
+        if not streamed:
+            # Joined another request's generation (or it was cached meanwhile)
+            for key, value in entry['summary'].items():
+                yield format_sse("section", {"key": key, "value": value})
+        yield format_sse("complete", summary_response(patient_id, entry, cached=not streamed, fields=selected))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/patient/by_name")
 def get_patient_by_name_endpoint(firstname: str, lastname: str):
     """Find patient by name"""
@@ -1686,58 +3127,169 @@ def get_drug_risk_assessment(patient_id: int):
     """Get AI-powered drug interaction and risk assessment"""
     
     print(f"🧪 Drug risk assessment requested for patient {patient_id}")
-    
-    # Get comprehensive patient data
-    patient_data = get_comprehensive_patient_data(patient_id)
-    if not patient_data:
+
+    # Join an assessment already being generated alongside the summary (same data bundle)
+    if generation_flight.in_flight(f"patient_drug_risk:{patient_cache_key(patient_id)}"):
+        entry = generate_and_cache_drug_risk(patient_id)
+    else:
+        patient_data = get_comprehensive_patient_data(patient_id)
+        if not patient_data:
+            raise HTTPException(status_code=404, detail="Patient not found")
+
+        # Served from the cache only if it was built from this data
+        entry = generate_and_cache_drug_risk(patient_id, patient_data)
+
+    if not entry:
         raise HTTPException(status_code=404, detail="Patient not found")
     
-    # Generate drug risk assessment
-    risk_assessment = generate_drug_risk_assessment(patient_data)
-    
     return {
         "patient_id": patient_id,
-        "patient_name": f"{patient_data.get('firstName', '')} {patient_data.get('lastName', '')}",
-        "assessment": risk_assessment,
-        "generated_at": datetime.now().isoformat()
+        "patient_name": entry['patient_name'],
+        "assessment": entry['assessment'],
+        "generated_at": entry['generated_at'].isoformat(),
+        "fingerprint": entry['fingerprint'],
+        "version": drug_risk_cache.version(patient_id)
     }
 
+@app.get("/api/patient/{patient_id}/analysis")
+def get_patient_analysis(patient_id: int, stream: bool = False):
+    """Summary and drug risk assessment from a single data fetch, generated concurrently"""
+
+    def build_part(name: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not entry:
+            return {"part": name, "error": "Generation failed"}
+        result = entry['summary'] if name == 'summary' else entry['assessment']
+        return {
+            "part": name,
+            "result": result,
+            "generated_at": entry['generated_at'].isoformat(),
+            "fingerprint": entry.get('fingerprint')
+        }
+
+    if not stream:
+        analysis = run_patient_analysis(patient_id)
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        return {
+            "patient_id": patient_id,
+            "fingerprint": analysis['fingerprint'],
+            "ai_summary": build_part('summary', analysis['summary']),
+            "drug_risk_assessment": build_part('drug_risk', analysis['drug_risk']),
+            "patient_data": analysis['patient_data']
+        }
+
+    def events():
+        parts: "queue.Queue" = queue.Queue()
+
+        def worker():
+            try:
+                analysis = run_patient_analysis(patient_id, on_part=lambda name, entry: parts.put((name, entry)))
+                parts.put(("complete", analysis))
+            except Exception as e:
+                parts.put(("error", str(e)))
+
+        threading.Thread(target=worker, daemon=True).start()
+        while True:
+            name, payload = parts.get()
+            if name == "error":
+                yield format_sse("error", {"detail": payload})
+                return
+            if name == "complete":
+                if not payload:
+                    yield format_sse("error", {"detail": "Patient not found"})
+                else:
+                    yield format_sse("complete", {
+                        "patient_id": patient_id,
+                        "fingerprint": payload['fingerprint'],
+                        "patient_data": payload['patient_data']
+                    })
+                return
+            yield format_sse(name, build_part(name, payload))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/patient/{patient_id}/regenerate_summary")
 def regenerate_summary(patient_id: int):
     """Force regenerate AI summary"""
     
     # Clear cache first
-    cache_key = str(patient_id)
-    if cache_key in ai_summary_cache:
-        del ai_summary_cache[cache_key]
+    if ai_summary_cache.pop(patient_id) is not None:
         print(f"🗑️ Cleared cache for patient {patient_id}")
     
-    patient_data = get_comprehensive_patient_data(patient_id)
-    if not patient_data:
+    entry = generate_and_cache_summary(patient_id, force=True)
+    if not entry:
         raise HTTPException(status_code=404, detail="Patient not found")
     
-    ai_summary = generate_ai_summary(patient_data)
-    
-    ai_summary_cache[cache_key] = {
-        'summary': ai_summary,
-        'generated_at': datetime.now(),
-        'patient_data': patient_data
-    }
-    
     return {
         "status": "success",
-        "generated_at": datetime.now().isoformat(),
-        "ai_summary": ai_summary
+        "generated_at": entry['generated_at'].isoformat(),
+        "ai_summary": entry['summary']
     }
 
+@app.post("/api/pregenerate")
+def trigger_pregeneration(background_tasks: BackgroundTasks, day: Optional[date] = None):
+    """Run pre-generation for a day's appointment list now (default: tomorrow)"""
+    target = day or (date.today() + timedelta(days=1))
+    background_tasks.add_task(pregenerate_for_day, target)
+    return {"status": "started", "clinic_day": target.isoformat()}
+
+class PatientChangedEvent(BaseModel):
+    patient_ids: List[int]
+    source: Optional[str] = None
+
+@app.post("/api/events/patient_changed")
+def patient_changed(event: PatientChangedEvent, x_events_token: Optional[str] = Header(None)):
+    """Change notification from the EHR: refresh cached summaries of the listed patients"""
+    if EHR_EVENTS_TOKEN and x_events_token != EHR_EVENTS_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid events token")
+    return {"status": "accepted", **handle_patient_changes(event.patient_ids, event.source or "")}
+
+@app.get("/api/telemetry/llm")
+def get_llm_telemetry(day: Optional[date] = None):
+    """Rolling per-purpose LLM metrics, or the stored report for one day"""
+    if day:
+        return llm_telemetry.daily_report(day)
+    return llm_telemetry.stats()
+
 @app.delete("/api/cache/clear")
-def clear_all_cache():
+def clear_all_cache(include_store: bool = False):
     """Clear all cached AI summaries"""
-    global ai_summary_cache
-    count = len(ai_summary_cache)
-    ai_summary_cache.clear()
+    count = ai_summary_cache.clear()
+    drug_risk_cache.clear()
+    current_patient_cache.clear()
+    summary_body_cache.clear()
     print(f"🗑️ Cleared {count} cached summaries")
-    return {"status": "success", "cleared": count}
+    result = {"status": "success", "cleared": count}
+    if include_store:
+        result["store_cleared"] = summary_store.clear()
+        print(f"🗑️ Cleared {result['store_cleared']} stored summaries")
+    return result
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Report in-memory cache size and persistent store statistics"""
+    return {
+        "memory_cache_entries": len(ai_summary_cache),
+        "drug_risk_cache_entries": len(drug_risk_cache),
+        "summary_cache": ai_summary_cache.stats(),
+        "drug_risk_cache": drug_risk_cache.stats(),
+        "current_patient_cache": current_patient_cache.stats(),
+        "summary_store": summary_store.stats(),
+        "single_flight": generation_flight.stats(),
+        "model_router": model_router.stats(),
+        "overnight": overnight_scheduler.stats(),
+        "patient_changes": dict(patient_change_stats),
+        "events": event_bus.stats(),
+        "responses": response_encoder.stats(),
+        "summary_bodies": summary_body_cache.stats(),
+        "snapshot": cache_snapshotter.stats() if CACHE_SNAPSHOT else None,
+        "shared_cache": shared_cache_store.stats() if shared_cache_store else None,
+        "llm": llm_gateway.stats() if llm_gateway else None
+    }
 
 # ==========================================
 # 🎬 PATIENT SIMULATOR
@@ -1794,7 +3346,7 @@ def save_visit_reason(patient_id: int, visit_reason: VisitReasonData):
     """Save visit reason for a patient and trigger AI analysis"""
     try:
         # Store visit reason in a temporary cache for AI processing
-        visit_reason_cache[patient_id] = visit_reason.dict()
+        visit_reason_cache.set(patient_cache_key(patient_id), visit_reason.dict())
         
         print(f"📝 Visit reason saved for patient {patient_id}: {visit_reason.primary_reason}")
         
@@ -1803,14 +3355,21 @@ def save_visit_reason(patient_id: int, visit_reason: VisitReasonData):
         if patient_data:
             # Add visit reason to patient data
             patient_data['visit_reason'] = visit_reason.dict()
-            ai_summary = generate_ai_summary(patient_data)
-            
-            # Cache the updated summary
-            ai_summary_cache[patient_id] = {
-                'summary': ai_summary,
-                'generated_at': datetime.now(),
-                'patient_data': patient_data
-            }
+            data_fingerprint = patient_data_fingerprint(patient_data)
+
+            # Cache the updated summary (same key as every other summary path)
+            with ai_summary_cache.lock(patient_id):
+                ai_summary = generate_ai_summary(patient_data)
+                entry = {
+                    'summary': ai_summary,
+                    'generated_at': datetime.now(),
+                    'patient_data': patient_data,
+                    'fingerprint': data_fingerprint
+                }
+                if "error" in ai_summary:
+                    return {"status": "success", "message": "Visit reason saved; AI summary update failed"}
+                ai_summary_cache.set(patient_id, cache_fingerprint(data_fingerprint, AI_SUMMARY_PROMPT_VERSION), entry)
+            summary_cached(patient_id, entry)
             
             return {"status": "success", "message": "Visit reason saved and AI summary updated"}
         else:
@@ -8,6 +8,11 @@ and prepares the data for AI summarization.
 Add this to your backend.py or import it as a separate module.
 """
 
+from prompt_budget import PromptAssembler, parse_entry_date
+
+# Result flags of abnormal lab values (high, low, "auffällig"); 'N' and blank mean normal
+ABNORMAL_LAB_FLAGS = {'H', 'HH', 'L', 'LL', 'A', 'AA', '+', '++', '!'}
+
 class BDTParser:
     """
     Parse BDT files to extract comprehensive patient data
@@ -377,11 +382,12 @@ class BDTParser:
             print(f"❌ Error parsing BDT file: {e}")
             return None
     
-    def format_for_ai(self, patient_data):
+    def format_for_ai(self, patient_data, token_budget=None):
         """
         Format parsed BDT data into readable text for AI processing
         
-        This matches the format your AI expects
+        This matches the format your AI expects. With a token_budget, labs,
+        procedures and visits are selected by priority until the budget is used.
         """
         if not patient_data:
             return ""
@@ -469,87 +475,92 @@ class BDTParser:
                 lines.append(med_line)
             lines.append("")
         
-        # === LAB RESULTS ===
-        labs = patient_data.get('lab_results', [])
-        if labs:
-            lines.append("RECENT LAB RESULTS:")
-            for lab in labs:
-                test_name = lab.get('test_name', 'Unknown')
-                value = lab.get('result_value', 'Pending')
-                unit = lab.get('unit', '')
-                date = lab.get('test_date', '')
-                flag = lab.get('flag', '')
-                
-                lab_line = f"  • {test_name}: {value}"
-                if unit:
-                    lab_line += f" {unit}"
-                if date:
-                    lab_line += f" (Date: {date})"
-                if flag in ['H', 'HH']:
-                    lab_line += " [HIGH]"
-                elif flag in ['L', 'LL']:
-                    lab_line += " [LOW]"
-                
-                lines.append(lab_line)
-            lines.append("")
+        # === HISTORY (budgeted) ===
+        # Labs, procedures and visits compete for the remaining token budget by
+        # recency, abnormality and relevance to the current complaint
+        visits = patient_data.get('visits', [])
+        reason = visits[0].get('chief_complaint', '') if visits else ''
+        assembler = PromptAssembler(token_budget if token_budget is not None else 10 ** 9, reason=reason)
+        assembler.pin('\n'.join(lines) + '\n')
+        assembler.section('lab_results', "RECENT LAB RESULTS:\n")
+        assembler.section('procedures', "\nPROCEDURES/IMAGING:\n")
+        assembler.section('visits', "\nRECENT VISIT HISTORY:\n")
+
+        for lab in patient_data.get('lab_results', []):
+            test_name = lab.get('test_name', 'Unknown')
+            value = lab.get('result_value', 'Pending')
+            unit = lab.get('unit', '')
+            date = lab.get('test_date', '')
+            flag = lab.get('flag', '')
+            
+            lab_line = f"  • {test_name}: {value}"
+            if unit:
+                lab_line += f" {unit}"
+            if date:
+                lab_line += f" (Date: {date})"
+            if flag in ['H', 'HH']:
+                lab_line += " [HIGH]"
+            elif flag in ['L', 'LL']:
+                lab_line += " [LOW]"
+            
+            assembler.add('lab_results', lab_line, when=parse_entry_date(date),
+                          abnormal=str(flag).strip().upper() in ABNORMAL_LAB_FLAGS)
         
-        # === PROCEDURES ===
-        procedures = patient_data.get('procedures', [])
-        if procedures:
-            lines.append("PROCEDURES/IMAGING:")
-            for proc in procedures:
-                name = proc.get('name', 'Unknown')
-                date = proc.get('date', '')
-                notes = proc.get('notes', '')
-                
-                proc_line = f"  • {name}"
-                if date:
-                    proc_line += f" (Date: {date})"
-                if notes:
-                    proc_line += f"\n    Notes: {notes}"
-                
-                lines.append(proc_line)
-            lines.append("")
+        for proc in patient_data.get('procedures', []):
+            name = proc.get('name', 'Unknown')
+            date = proc.get('date', '')
+            notes = proc.get('notes', '')
+            
+            proc_line = f"  • {name}"
+            if date:
+                proc_line += f" (Date: {date})"
+            if notes:
+                proc_line += f"\n    Notes: {notes}"
+            
+            assembler.add('procedures', proc_line, when=parse_entry_date(date))
         
-        # === VISIT HISTORY ===
-        visits = patient_data.get('visits', [])
-        if visits:
-            lines.append("RECENT VISIT HISTORY:")
-            for idx, visit in enumerate(visits[:5], 1):  # Last 5 visits
-                lines.append(f"\n  Visit #{idx}:")
-                
-                if visit.get('date'):
-                    lines.append(f"  Date: {visit['date']}")
-                
-                if visit.get('chief_complaint'):
-                    lines.append(f"  Chief Complaint: {visit['chief_complaint']}")
-                
-                # Vitals
-                vitals = visit.get('vitals', {})
-                if vitals:
-                    vital_parts = []
-                    if vitals.get('systolic') and vitals.get('diastolic'):
-                        vital_parts.append(f"BP: {vitals['systolic']}/{vitals['diastolic']}")
-                    if vitals.get('heart_rate'):
-                        vital_parts.append(f"HR: {vitals['heart_rate']}")
-                    if vitals.get('temperature'):
-                        vital_parts.append(f"Temp: {vitals['temperature']}°C")
-                    if vitals.get('weight'):
-                        vital_parts.append(f"Weight: {vitals['weight']}kg")
-                    
-                    if vital_parts:
-                        lines.append(f"  Vitals: {', '.join(vital_parts)}")
-                
-                if visit.get('diagnosis'):
-                    lines.append(f"  Diagnosis: {visit['diagnosis']}")
-                
-                if visit.get('treatment_plan'):
-                    lines.append(f"  Plan: {visit['treatment_plan']}")
-                
-                if visit.get('doctor_summary'):
-                    lines.append(f"  Summary: {visit['doctor_summary']}")
+        # Without a budget, the last 5 visits as before
+        for idx, visit in enumerate(visits if token_budget is not None else visits[:5], 1):
+            visit_lines = [f"\n  Visit #{idx}:"]
             
-            lines.append("")
+            if visit.get('date'):
+                visit_lines.append(f"  Date: {visit['date']}")
+            
+            if visit.get('chief_complaint'):
+                visit_lines.append(f"  Chief Complaint: {visit['chief_complaint']}")
+            
+            # Vitals
+            vitals = visit.get('vitals', {})
+            if vitals:
+                vital_parts = []
+                if vitals.get('systolic') and vitals.get('diastolic'):
+                    vital_parts.append(f"BP: {vitals['systolic']}/{vitals['diastolic']}")
+                if vitals.get('heart_rate'):
+                    vital_parts.append(f"HR: {vitals['heart_rate']}")
+                if vitals.get('temperature'):
+                    vital_parts.append(f"Temp: {vitals['temperature']}°C")
+                if vitals.get('weight'):
+                    vital_parts.append(f"Weight: {vitals['weight']}kg")
+                
+                if vital_parts:
+                    visit_lines.append(f"  Vitals: {', '.join(vital_parts)}")
+            
+            if visit.get('diagnosis'):
+                visit_lines.append(f"  Diagnosis: {visit['diagnosis']}")
+            
+            if visit.get('treatment_plan'):
+                visit_lines.append(f"  Plan: {visit['treatment_plan']}")
+            
+            if visit.get('doctor_summary'):
+                visit_lines.append(f"  Summary: {visit['doctor_summary']}")
+
+            # The current visit is always the most relevant one
+            assembler.add('visits', '\n'.join(visit_lines), when=parse_entry_date(visit.get('date')), relevant=(idx == 1))
+
+        prompt, report = assembler.assemble()
+        if token_budget is not None:
+            print(f"📏 BDT prompt budget: {PromptAssembler.describe(report)}")
+        lines = [prompt.rstrip('\n'), ""]
         
         lines.append("=" * 60)
         lines.append("END OF PATIENT RECORD")
@@ -0,0 +1,115 @@
+"""
+Cache Snapshots
+===============
+
+Saves the backend's in-memory caches to one compressed file, periodically
+and on shutdown, and loads them back on startup, so a restart (a deployment
+at lunch) does not leave the afternoon clinic with a cold cache.
+
+Each entry keeps its age, so TTLs and soft staleness carry over across the
+restart. The snapshot also records caller metadata (models, prompt versions)
+that the backend checks before reusing entries. Payloads are pickled
+because MySQL rows hold datetime/Decimal values, zlib compressed, and
+written atomically (temp file + rename).
+"""
+
+import os
+import pickle
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from ttl_cache import BoundedTTLCache
+
+SNAPSHOT_FORMAT = 1
+
+
+class CacheSnapshotter:
+    """
+    Periodic + on-demand snapshots of named BoundedTTLCaches to one file
+    """
+
+    def __init__(self, path: Path, caches: Dict[str, BoundedTTLCache],
+                 meta: Callable[[], Dict[str, Any]], interval_seconds: float = 300.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.caches = caches
+        self.meta = meta
+        self.interval_seconds = interval_seconds
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"saves": 0, "failures": 0, "last_saved_at": None, "last_entries": 0,
+                       "last_bytes": 0, "restored": None}
+
+    def save(self) -> Optional[Dict[str, int]]:
+        """Write all caches to disk; returns entry counts per cache (None on failure)"""
+        with self._lock:
+            try:
+                caches = {name: cache.export() for name, cache in self.caches.items()}
+                payload = {
+                    "format": SNAPSHOT_FORMAT,
+                    "saved_at": time.time(),
+                    "meta": self.meta(),
+                    "caches": caches
+                }
+                data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), 6)
+                tmp_path = self.path.with_name(self.path.name + ".tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self._stats["failures"] += 1
+                print(f"⚠️ Cache snapshot failed: {e}")
+                return None
+
+            counts = {name: len(items) for name, items in caches.items()}
+            self._stats.update(saves=self._stats["saves"] + 1, last_saved_at=payload["saved_at"],
+                               last_entries=sum(counts.values()), last_bytes=len(data))
+        return counts
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Read the snapshot as {"saved_at", "meta", "caches"}; None if missing, unreadable or another format.
+
+        Cache items are (key, value, age) with ages as of startup, i.e. including the downtime.
+        """
+        if not self.path.exists():
+            return None
+        try:
+            payload = pickle.loads(zlib.decompress(self.path.read_bytes()))
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cache snapshot {self.path}: {e}")
+            return None
+        if not isinstance(payload, dict) or payload.get("format") != SNAPSHOT_FORMAT:
+            print(f"⚠️ Ignoring cache snapshot {self.path} (different format)")
+            return None
+
+        downtime = max(0.0, time.time() - payload["saved_at"])
+        payload["caches"] = {
+            name: [(key, value, age + downtime) for key, value, age in items]
+            for name, items in payload["caches"].items()
+        }
+        return payload
+
+    def record_restore(self, counts: Dict[str, int]) -> None:
+        self._stats["restored"] = counts
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "path": str(self.path),
+            "interval_seconds": self.interval_seconds,
+            "running": bool(self._thread and self._thread.is_alive())
+        }
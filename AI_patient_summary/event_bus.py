@@ -0,0 +1,171 @@
+"""
+Push Event Bus
+==============
+
+Publish/subscribe channel behind GET /api/events (Server-Sent Events), so
+the sidecar is told about changes instead of polling for them.
+
+Events carry an increasing sequence number (the SSE id). The most recent
+ones are kept in a ring buffer, so a client that reconnects with
+Last-Event-ID replays exactly what it missed. Publishing is thread-safe
+(the GDT watcher and generation threads publish); subscribers are asyncio
+queues, so idle connections hold no worker thread.
+
+Event types:
+    current_patient   - the EHR opened another patient (GDT/BDT export)
+    summary_progress  - generation of a patient's summary started or failed
+    summary_ready     - a new summary version was cached (or revalidated)
+    drug_risk_ready   - a new drug risk assessment was cached
+
+The bus lives in one process; with several uvicorn workers each worker
+pushes its own events.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Subscription:
+    """
+    One connected client: an asyncio queue fed from any thread
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up - end the stream; the client reconnects and replays from its last id
+            self.overflowed = True
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            self.queue.put_nowait(None)
+
+
+class EventBus:
+    """
+    Sequence-numbered events with a replay buffer, fanned out to SSE subscribers
+    """
+
+    def __init__(self, history: int = 500, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: List[Subscription] = []
+        self._last_id = 0
+        self._stats = {"published": 0, "overflows": 0, "connections": 0}
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> int:
+        """Send an event to every subscriber and return its id"""
+        with self._lock:
+            self._last_id += 1
+            event = {"id": self._last_id, "type": event_type, "data": data, "ts": time.time()}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self._stats["published"] += 1
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # Event loop already closed
+                self.unsubscribe(subscription)
+        return event["id"]
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> "tuple[Subscription, Optional[List[Dict[str, Any]]]]":
+        """Register a subscriber on the running loop.
+
+        Returns it with the events to replay after last_event_id, or None when
+        the client is new or missed more than the buffer holds (send it the
+        current state instead).
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._subscribers.append(subscription)
+            self._stats["connections"] += 1
+            replay = None
+            if last_event_id is not None and last_event_id <= self._last_id:
+                oldest = self._history[0]["id"] if self._history else self._last_id + 1
+                if last_event_id >= oldest - 1:
+                    replay = [event for event in self._history if event["id"] > last_event_id]
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                if subscription.overflowed:
+                    self._stats["overflows"] += 1
+
+    async def wait_until(self, check: Callable[[], bool], timeout: float) -> bool:
+        """Wait (without a thread) until check() is true, re-testing after every event; False on timeout.
+
+        Backs long-polling for clients that cannot hold an event stream open.
+        """
+        if check():
+            return True
+        subscription, _ = self.subscribe()
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return check()
+                try:
+                    await asyncio.wait_for(subscription.queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return check()
+                if check():
+                    return True
+                if subscription.overflowed:
+                    return check()
+        finally:
+            self.unsubscribe(subscription)
+
+    async def wait_for(self, match: Callable[[Dict[str, Any]], bool], timeout: float,
+                       after: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the first event after id `after` (or from now) that match() accepts; None on timeout.
+
+        Pass the last_id read before checking the current state, so an event
+        published in between is replayed instead of missed.
+        """
+        subscription, replay = self.subscribe(after)
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            for event in replay or []:
+                if match(event):
+                    return event
+            while not subscription.overflowed:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return None
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return None
+                if event is not None and match(event):
+                    return event
+            return None
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "subscribers": len(self._subscribers), "last_id": self._last_id}
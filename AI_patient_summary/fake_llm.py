@@ -0,0 +1,411 @@
+"""
+Fake LLM Provider
+=================
+
+Local stand-in for the OpenAI / Azure chat-completions API, for offline
+development, reproducible load tests and latency benchmarks.
+
+Two ways to use it:
+  - in-process: AI_PROVIDER=fake makes backend.py use FakeOpenAI /
+    FakeAsyncOpenAI instead of the real SDK clients;
+  - as a local HTTP server: ``python fake_llm.py --port 8765`` serves
+    ``/v1/chat/completions`` (and the Azure deployment route), so the real
+    SDK can be pointed at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1.
+
+Responses are canned, schema-valid JSON chosen from the system prompt
+(patient summary, drug risk, window summary) or plain text otherwise.
+Behaviour is configured with FakeLLMConfig (or FAKE_LLM_* env vars):
+  - latency distribution: ``fixed:800``, ``uniform:300:1500`` or
+    ``lognormal:900:0.5`` (median ms, sigma),
+  - token streaming speed in tokens per second,
+  - error rate (HTTP 500) and rate-limit rate (HTTP 429 with retry-after),
+  - a seed for reproducible runs.
+Reported usage includes prompt_tokens_details.cached_tokens, simulating a
+provider prefix cache in 128-token blocks.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+# ==========================================
+# 🧾 CANNED RESPONSES
+# ==========================================
+
+CANNED_SUMMARY = {
+    "problem_representation": "67-year-old male with a 12-year history of type 2 diabetes mellitus[1] and hypertension[2], presenting for routine follow-up.",
+    "current_trajectory": "Glycemic control improving on metformin[1]; blood pressure controlled on current regimen[2].",
+    "vitals_trends": [
+        {"metric": "Blood Pressure", "values": [{"date": "2024-01-15", "value": "145/90"}, {"date": "2024-06-10", "value": "128/82"}],
+         "interpretation": "Improving, controlled", "citation_id": 2}
+    ],
+    "lab_trends": [
+        {"system": "Metabolic", "metric": "HbA1c", "values": [{"date": "2023-12-01", "value": "8.2%"}, {"date": "2024-06-01", "value": "7.1%"}],
+         "interpretation": "Improving, nearing target", "citation_id": 1}
+    ],
+    "medication_evolution": ["Continued: Metformin 1000mg BID (glycemic control)[1]", "Continued: Ramipril 5mg daily (hypertension)[2]"],
+    "red_flags": ["Allergy: Penicillin[1]"],
+    "action_plan": ["Repeat HbA1c in 3 months", "Annual diabetic retinopathy screening"],
+    "citations": [
+        {"id": 1, "visit_date": "2024-06-01", "doctor_name": "Dr. Fake", "diagnosis": "Type 2 diabetes mellitus",
+         "treatment_plan": "Continue metformin", "lab_results": "HbA1c 7.1%", "excerpt": "Diabetes follow-up, improving control."},
+        {"id": 2, "visit_date": "2024-06-10", "doctor_name": "Dr. Fake", "diagnosis": "Essential hypertension",
+         "treatment_plan": "Continue ramipril", "lab_results": "BP 128/82", "excerpt": "Blood pressure at target."}
+    ]
+}
+
+CANNED_DRUG_RISK = {
+    "drug_interactions": [
+        {"drugs": ["Ramipril", "Spironolactone"], "risk_level": "MODERATE",
+         "interaction": "Additive potassium retention", "clinical_effect": "Hyperkalemia",
+         "recommendation": "Monitor potassium within 1 week", "source": "Lexicomp"}
+    ],
+    "drug_lab_effects": [
+        {"medication": "Metformin", "lab_parameter": "eGFR", "current_value": "52 mL/min", "risk_level": "LOW",
+         "mechanism": "Renally cleared", "clinical_significance": "Dose limits below eGFR 45",
+         "recommendation": "Recheck eGFR in 3 months", "source": "FDA label"}
+    ],
+    "contraindications": []
+}
+
+CANNED_WINDOW_SUMMARY = {
+    "period": "2023-01-01 to 2023-12-31",
+    "diagnoses": ["Type 2 diabetes mellitus (first seen 2012-03-01)"],
+    "medication_changes": ["Adjusted: Metformin 500mg -> 1000mg BID (HbA1c 8.2%) 2023-04-12"],
+    "lab_highlights": [{"metric": "HbA1c", "date": "2023-04-12", "value": "8.2%", "abnormal": True}],
+    "vitals_highlights": [{"metric": "Blood Pressure", "date": "2023-04-12", "value": "138/86"}],
+    "key_events": [],
+    "citations": [{"visit_date": "2023-04-12", "doctor_name": "Dr. Fake", "diagnosis": "Type 2 diabetes mellitus",
+                   "treatment_plan": "Increase metformin"}]
+}
+
+CANNED_TEXT = "Fake summary: stable chronic conditions, continue current management and routine monitoring."
+
+
+def canned_content(messages: List[Dict[str, Any]], response_format: Optional[Dict[str, Any]] = None) -> str:
+    """Pick the canned response matching the request's task"""
+    system = " ".join(str(message.get("content") or "") for message in messages if message.get("role") == "system")
+    schema_name = ((response_format or {}).get("json_schema") or {}).get("name", "")
+
+    if schema_name == "drug_risk_assessment" or "Clinical Pharmacology Expert" in system:
+        return json.dumps(CANNED_DRUG_RISK)
+    if schema_name == "window_summary" or "condensing one time period" in system:
+        return json.dumps(CANNED_WINDOW_SUMMARY)
+    if schema_name == "patient_summary" or (response_format or {}).get("type") in ("json_object", "json_schema"):
+        return json.dumps(CANNED_SUMMARY)
+    return CANNED_TEXT
+
+
+# ==========================================
+# ⚙️ CONFIGURATION
+# ==========================================
+
+class FakeLLMConfig:
+    """
+    Latency, streaming speed and failure behaviour of the fake provider
+    """
+
+    def __init__(self, latency: str = "lognormal:900:0.4", tokens_per_second: float = 80.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMConfig":
+        seed = os.getenv('FAKE_LLM_SEED')
+        return cls(
+            latency=os.getenv('FAKE_LLM_LATENCY', 'lognormal:900:0.4'),
+            tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', 80)),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', 0)),
+            rate_limit_rate=float(os.getenv('FAKE_LLM_RATE_LIMIT_RATE', 0)),
+            retry_after=float(os.getenv('FAKE_LLM_RETRY_AFTER', 1)),
+            seed=int(seed) if seed else None
+        )
+
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """Seconds to wait before the first token, from a 'kind:params' spec in milliseconds"""
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(":") if value]
+    if kind == "fixed":
+        ms = values[0] if values else 0.0
+    elif kind == "uniform":
+        ms = rng.uniform(values[0], values[1])
+    elif kind == "lognormal":
+        median = values[0] if values else 900.0
+        sigma = values[1] if len(values) > 1 else 0.4
+        ms = rng.lognormvariate(math.log(median), sigma)
+    else:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return max(ms, 0.0) / 1000.0
+
+
+# ==========================================
+# 🧱 RESPONSE OBJECTS
+# ==========================================
+
+class _Obj:
+    """Attribute-style object mirroring the SDK's response models"""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def model_dump(self) -> Dict[str, Any]:
+        def dump(value):
+            if isinstance(value, _Obj):
+                return value.model_dump()
+            if isinstance(value, list):
+                return [dump(item) for item in value]
+            return value
+        return {key: dump(value) for key, value in self.__dict__.items()}
+
+
+class FakeAPIError(Exception):
+    """Mirrors openai.APIStatusError: carries status_code and response headers"""
+
+    def __init__(self, message: str, status_code: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = _Obj(headers=headers or {})
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _split_tokens(text: str) -> List[str]:
+    # ~4 characters per streamed token, like the usage estimate
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class FakeLLMEngine:
+    """
+    Shared request logic for the in-process clients and the HTTP server
+    """
+
+    PREFIX_BLOCK_CHARS = 512  # 128 tokens
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig.from_env()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self._counter = 0
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "streamed": 0}
+
+    def _draw(self) -> Dict[str, Any]:
+        with self._lock:
+            self._counter += 1
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            return {
+                "id": f"chatcmpl-fake-{self._counter}",
+                "latency": sample_latency(self.config.latency, self._rng),
+                "rate_limited": roll < self.config.rate_limit_rate,
+                "error": self.config.rate_limit_rate <= roll < self.config.rate_limit_rate + self.config.error_rate
+            }
+
+    def _cached_tokens(self, prompt: str) -> int:
+        """Longest previously seen prompt prefix, in whole 128-token blocks"""
+        cached_chars = 0
+        with self._lock:
+            for end in range(self.PREFIX_BLOCK_CHARS, len(prompt) + 1, self.PREFIX_BLOCK_CHARS):
+                digest = hashlib.sha1(prompt[:end].encode("utf-8")).hexdigest()
+                if digest in self._prefixes:
+                    cached_chars = end
+                    self._prefixes.move_to_end(digest)
+                else:
+                    self._prefixes[digest] = None
+            while len(self._prefixes) > 50000:
+                self._prefixes.popitem(last=False)
+        return cached_chars // 4
+
+    def prepare(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Decide the outcome of one request (raises FakeAPIError for injected failures)"""
+        draw = self._draw()
+        if draw["rate_limited"]:
+            with self._lock:
+                self.stats["rate_limited"] += 1
+            raise FakeAPIError("Fake rate limit exceeded", 429, {"retry-after": str(self.config.retry_after)})
+        if draw["error"]:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise FakeAPIError("Fake internal server error", 500)
+
+        messages = kwargs.get("messages", [])
+        prompt = "".join(str(message.get("content") or "") for message in messages)
+        content = canned_content(messages, kwargs.get("response_format"))
+        prompt_tokens = _estimate_tokens(prompt)
+        completion_tokens = _estimate_tokens(content)
+        usage = _Obj(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=_Obj(cached_tokens=min(self._cached_tokens(prompt), prompt_tokens))
+        )
+        return {**draw, "model": kwargs.get("model") or "fake-model", "content": content, "usage": usage}
+
+    def completion(self, plan: Dict[str, Any]) -> _Obj:
+        return _Obj(
+            id=plan["id"], object="chat.completion", created=int(time.time()), model=plan["model"],
+            choices=[_Obj(index=0, finish_reason="stop", message=_Obj(role="assistant", content=plan["content"]))],
+            usage=plan["usage"]
+        )
+
+    def chunks(self, plan: Dict[str, Any], include_usage: bool) -> Iterator[_Obj]:
+        for token in _split_tokens(plan["content"]):
+            yield _Obj(id=plan["id"], object="chat.completion.chunk", model=plan["model"], usage=None,
+                       choices=[_Obj(index=0, finish_reason=None, delta=_Obj(role="assistant", content=token))])
+        yield _Obj(id=plan["id"], object="chat.completion.chunk", model=plan["model"], usage=None,
+                   choices=[_Obj(index=0, finish_reason="stop", delta=_Obj(content=None))])
+        if include_usage:
+            yield _Obj(id=plan["id"], object="chat.completion.chunk", model=plan["model"], choices=[], usage=plan["usage"])
+
+    def token_delay(self) -> float:
+        return 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+
+# ==========================================
+# 🔌 IN-PROCESS CLIENTS
+# ==========================================
+
+class _SyncCompletions:
+    def __init__(self, engine: FakeLLMEngine):
+        self._engine = engine
+
+    def create(self, stream: bool = False, **kwargs):
+        plan = self._engine.prepare(kwargs)
+        time.sleep(plan["latency"])
+        if not stream:
+            time.sleep(plan["usage"].completion_tokens * self._engine.token_delay())
+            return self._engine.completion(plan)
+        self._engine.stats["streamed"] += 1
+        include_usage = bool((kwargs.get("stream_options") or {}).get("include_usage"))
+        return self._stream(plan, include_usage)
+
+    def _stream(self, plan, include_usage):
+        for chunk in self._engine.chunks(plan, include_usage):
+            time.sleep(self._engine.token_delay())
+            yield chunk
+
+
+class _AsyncStream:
+    def __init__(self, engine: FakeLLMEngine, plan: Dict[str, Any], include_usage: bool):
+        self._engine = engine
+        self._chunks = engine.chunks(plan, include_usage)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(self._engine.token_delay())
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _AsyncCompletions:
+    def __init__(self, engine: FakeLLMEngine):
+        self._engine = engine
+
+    async def create(self, stream: bool = False, **kwargs):
+        plan = self._engine.prepare(kwargs)
+        await asyncio.sleep(plan["latency"])
+        if not stream:
+            await asyncio.sleep(plan["usage"].completion_tokens * self._engine.token_delay())
+            return self._engine.completion(plan)
+        self._engine.stats["streamed"] += 1
+        return _AsyncStream(self._engine, plan, bool((kwargs.get("stream_options") or {}).get("include_usage")))
+
+
+class FakeOpenAI:
+    """Synchronous client with the ``chat.completions.create`` surface"""
+
+    def __init__(self, engine: Optional[FakeLLMEngine] = None):
+        self.engine = engine or FakeLLMEngine()
+        self.chat = _Obj(completions=_SyncCompletions(self.engine))
+
+
+class FakeAsyncOpenAI:
+    """Async client with the ``chat.completions.create`` surface (streaming supported)"""
+
+    def __init__(self, engine: Optional[FakeLLMEngine] = None):
+        self.engine = engine or FakeLLMEngine()
+        self.chat = _Obj(completions=_AsyncCompletions(self.engine))
+
+
+# ==========================================
+# 🌐 HTTP SERVER
+# ==========================================
+
+def create_app(engine: Optional[FakeLLMEngine] = None):
+    """FastAPI app serving the OpenAI and Azure chat-completions routes"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    engine = engine or FakeLLMEngine()
+    app = FastAPI(title="Fake LLM Provider")
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        try:
+            plan = engine.prepare(body)
+        except FakeAPIError as e:
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"error": {"message": str(e), "type": "fake_error", "code": str(e.status_code)}},
+                headers=e.response.headers
+            )
+
+        await asyncio.sleep(plan["latency"])
+        if not body.get("stream"):
+            await asyncio.sleep(plan["usage"].completion_tokens * engine.token_delay())
+            return JSONResponse(engine.completion(plan).model_dump())
+
+        engine.stats["streamed"] += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            for chunk in engine.chunks(plan, include_usage):
+                await asyncio.sleep(engine.token_delay())
+                yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/openai/deployments/{deployment}/chat/completions", chat_completions, methods=["POST"])
+
+    @app.get("/stats")
+    def stats():
+        return engine.stats
+
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the fake LLM provider as a local HTTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig.from_env()
+    print(f"🧪 Fake LLM provider on http://{args.host}:{args.port}/v1 (latency {config.latency}, "
+          f"{config.tokens_per_second:g} tok/s, errors {config.error_rate:.0%}, 429s {config.rate_limit_rate:.0%})")
+    uvicorn.run(create_app(FakeLLMEngine(config)), host=args.host, port=args.port, log_level="warning")
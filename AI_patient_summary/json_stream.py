@@ -0,0 +1,90 @@
+"""
+Incremental JSON Section Parser
+===============================
+
+Parses a streamed JSON object token by token and reports each top-level
+member as soon as its value is complete.
+
+The summary schema is a flat object of sections (``problem_representation``,
+``red_flags``, ...). Feeding the model's token stream through this parser
+lets the sidecar render the first sections long before the whole document
+has been generated. The complete document is validated from ``text``
+afterwards (structured_output), not reassembled from the sections.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class JSONSectionStream:
+    """
+    Emit (key, value) pairs for each completed top-level member of a JSON object
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+        self._closed = False
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume the next chunk of text and return newly completed sections"""
+        if not chunk or self._closed:
+            return []
+
+        self._text += chunk
+        completed: List[Tuple[str, Any]] = []
+
+        while self._pos < len(self._text) and not self._closed:
+            ch = self._text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                # Text before the outer object (e.g. a ```json fence) is ignored
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+            elif ch in '}]':
+                if self._depth == 1:
+                    completed.extend(self._complete_member(self._pos))
+                    self._closed = True
+                self._depth = max(self._depth - 1, 0)
+            elif ch == ',' and self._depth == 1:
+                completed.extend(self._complete_member(self._pos))
+                self._member_start = self._pos + 1
+
+            self._pos += 1
+
+        return completed
+
+    def _complete_member(self, end: int) -> List[Tuple[str, Any]]:
+        if self._member_start is None:
+            return []
+
+        member = self._text[self._member_start:end].strip()
+        self._member_start = None
+        if not member:
+            return []
+
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+
+        return list(parsed.items())
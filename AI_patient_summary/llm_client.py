@@ -0,0 +1,432 @@
+"""
+Async LLM Client Layer
+======================
+
+Admission control in front of the provider's async chat-completions API.
+
+Every request passes through:
+  - a per-deployment token bucket that knows the deployment's requests- and
+    tokens-per-minute quota,
+  - a global concurrency limit shared by all deployments (ConcurrencySlots,
+    also shared by the admission clients of failover providers),
+  - priority ordering, so interactive requests (doctor opened a patient)
+    are admitted ahead of background work (preload, overnight batches).
+
+Requests that cannot be admitted yet wait in a queue instead of failing,
+and provider 429 responses put the request back into the queue after the
+advertised retry delay. The backend itself is thread based, so LLMGateway
+runs the async machinery on its own event loop thread and exposes blocking
+``complete()`` / ``stream()`` wrappers.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+_request_priority: contextvars.ContextVar = contextvars.ContextVar("llm_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """Run the enclosed LLM calls at background priority"""
+    token = _request_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _request_priority.get()
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Rough token estimate (~4 characters per token) plus the completion budget"""
+    chars = sum(len(str(message.get("content") or "")) for message in messages)
+    return chars // 4 + max_tokens
+
+
+def usage_cached_tokens(usage) -> int:
+    """Cached prompt tokens reported by the provider (0 when not reported)"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return int(details.get("cached_tokens") or 0)
+    return int(getattr(details, "cached_tokens", 0) or 0)
+
+
+def prefix_cache_summary(counters: List[Dict[str, int]]) -> Dict[str, Any]:
+    """Combine prompt/cached token counters and compute the prefix-cache hit rate"""
+    prompt_tokens = sum(counter["prompt_tokens"] for counter in counters)
+    cached_tokens = sum(counter["cached_tokens"] for counter in counters)
+    return {
+        "calls": sum(counter["calls"] for counter in counters),
+        "calls_with_cache_hit": sum(counter["calls_with_cache_hit"] for counter in counters),
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "hit_rate": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None
+    }
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after_seconds(error: Exception, default: float) -> float:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """
+    Requests-per-minute and tokens-per-minute budget for one deployment
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60.0)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def delay_for(self, tokens: int) -> float:
+        """Seconds until a request of this size fits into the bucket (0 = now)"""
+        self._refill()
+        # A single request larger than the whole minute budget is admitted on a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        delay = max(self._blocked_until - time.monotonic(), 0.0)
+        if self._requests < 1:
+            delay = max(delay, (1 - self._requests) * 60.0 / self.requests_per_minute)
+        if self._tokens < tokens:
+            delay = max(delay, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+        return delay
+
+    def consume(self, tokens: int) -> None:
+        self._refill()
+        self._requests -= 1
+        self._tokens -= min(tokens, self.tokens_per_minute)
+
+    def reconcile(self, estimated: int, actual: int) -> None:
+        """Return over-estimated tokens (or charge under-estimated ones) after the call"""
+        self._tokens = min(self.tokens_per_minute, self._tokens + estimated - actual)
+
+    def block_for(self, seconds: float) -> None:
+        """Stop admitting requests after the provider reported a 429"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_requests": round(self._requests, 2),
+            "available_tokens": int(self._tokens),
+            "blocked_for_seconds": round(max(self._blocked_until - time.monotonic(), 0.0), 2)
+        }
+
+
+class _DeploymentLane:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.pending: List[Any] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class ConcurrencySlots:
+    """
+    Priority-ordered limit on requests in flight; one instance can be shared by several clients
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: List[Any] = []
+        self._seq = itertools.count()
+
+    @property
+    def full(self) -> bool:
+        return self.active >= self.limit
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted just as the waiter was cancelled - pass the slot on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._waiters and self.active < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+
+class AsyncLLMClient:
+    """
+    Rate-limited, priority-ordered wrapper around an async OpenAI-compatible client
+
+    Token buckets belong to this client (each provider has its own quota); pass
+    a shared ConcurrencySlots to cap requests in flight across providers.
+    """
+
+    def __init__(self, client, max_concurrency: int = 4, default_limits: Optional[Dict[str, int]] = None,
+                 deployment_limits: Optional[Dict[str, Dict[str, int]]] = None, max_rate_limit_retries: int = 5,
+                 slots: Optional[ConcurrencySlots] = None):
+        self.client = client
+        self.slots = slots or ConcurrencySlots(max_concurrency)
+        self.default_limits = default_limits or {"rpm": 60, "tpm": 60000}
+        self.deployment_limits = deployment_limits or {}
+        self.max_rate_limit_retries = max_rate_limit_retries
+
+        self._lanes: Dict[str, _DeploymentLane] = {}
+        self._seq = itertools.count()
+        self._stats = {"admitted": 0, "queued": 0, "rate_limited": 0, "interactive": 0, "background": 0}
+        self._prefix_cache: Dict[str, Dict[str, int]] = {}
+
+    # ---- admission -------------------------------------------------------
+
+    def _lane(self, deployment: str) -> _DeploymentLane:
+        lane = self._lanes.get(deployment)
+        if lane is None:
+            limits = {**self.default_limits, **self.deployment_limits.get(deployment, {})}
+            lane = _DeploymentLane(TokenBucket(int(limits["rpm"]), int(limits["tpm"])))
+            lane.task = asyncio.get_running_loop().create_task(self._dispatch(lane))
+            self._lanes[deployment] = lane
+        return lane
+
+    async def _dispatch(self, lane: _DeploymentLane) -> None:
+        """Admit queued requests for one deployment in priority order as the bucket allows"""
+        while True:
+            while lane.pending and lane.pending[0][3].done():
+                heapq.heappop(lane.pending)
+            if not lane.pending:
+                lane.wakeup.clear()
+                await lane.wakeup.wait()
+                continue
+
+            priority, _, tokens, future = lane.pending[0]
+            delay = lane.bucket.delay_for(tokens)
+            if delay > 0:
+                # Sleep until the bucket refills, or until a higher-priority request arrives
+                lane.wakeup.clear()
+                try:
+                    await asyncio.wait_for(lane.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.slots.acquire(priority)
+            # A higher-priority request may have arrived while waiting for the slot
+            while lane.pending and lane.pending[0][3].done():
+                heapq.heappop(lane.pending)
+            if not lane.pending:
+                self.slots.release()
+                continue
+            _, _, tokens, future = heapq.heappop(lane.pending)
+            lane.bucket.consume(tokens)
+            future.set_result(None)
+
+    async def _admit(self, deployment: str, tokens: int, priority: int) -> _DeploymentLane:
+        lane = self._lane(deployment)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.pending, (priority, next(self._seq), tokens, future))
+        if len(lane.pending) > 1 or self.slots.full:
+            self._stats["queued"] += 1
+        lane.wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted (slot taken) just as the caller was cancelled - hand the slot back
+            if future.done() and not future.cancelled():
+                self.slots.release()
+            raise
+        self._stats["admitted"] += 1
+        self._stats["interactive" if priority < PRIORITY_BACKGROUND else "background"] += 1
+        return lane
+
+    def _record_usage(self, deployment: str, usage) -> None:
+        prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        if not prompt_tokens:
+            return
+        cached_tokens = usage_cached_tokens(usage)
+        counter = self._prefix_cache.setdefault(
+            deployment, {"calls": 0, "calls_with_cache_hit": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        )
+        counter["calls"] += 1
+        counter["prompt_tokens"] += prompt_tokens
+        counter["cached_tokens"] += cached_tokens
+        if cached_tokens:
+            counter["calls_with_cache_hit"] += 1
+        print(f"🧊 {deployment}: {cached_tokens}/{prompt_tokens} prompt tokens served from prefix cache")
+
+    # ---- requests --------------------------------------------------------
+
+    async def create(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Admitted equivalent of client.chat.completions.create (non-streaming)
+
+        timeout bounds the provider request only - it starts once the request is admitted.
+        """
+        deployment = kwargs.get("model") or "default"
+        estimated = estimate_request_tokens(kwargs.get("messages", []), kwargs.get("max_tokens") or 1000)
+
+        for attempt in range(self.max_rate_limit_retries + 1):
+            lane = None
+            try:
+                # The slot is held once _admit returns (it releases it itself when cancelled)
+                lane = await self._admit(deployment, estimated, priority)
+                request = self.client.chat.completions.create(**kwargs)
+                response = await (asyncio.wait_for(request, timeout) if timeout else request)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt >= self.max_rate_limit_retries:
+                    raise
+                self._stats["rate_limited"] += 1
+                wait = _retry_after_seconds(e, default=2.0 * (attempt + 1))
+                print(f"⏳ {deployment} rate limited - re-queueing request in {wait:.1f}s")
+                lane.bucket.block_for(wait)
+                continue
+            finally:
+                if lane is not None:
+                    self.slots.release()
+
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                lane.bucket.reconcile(estimated, usage.total_tokens)
+                self._record_usage(deployment, usage)
+            return response
+
+    async def stream(self, sink: "queue.Queue", priority: int = PRIORITY_INTERACTIVE,
+                     admitted: Optional[asyncio.Event] = None, **kwargs) -> None:
+        """Admitted streaming request; chunks are pushed into sink followed by None
+
+        admitted (optional) is set once the request leaves the admission queue.
+        """
+        deployment = kwargs.get("model") or "default"
+        estimated = estimate_request_tokens(kwargs.get("messages", []), kwargs.get("max_tokens") or 1000)
+
+        try:
+            for attempt in range(self.max_rate_limit_retries + 1):
+                lane = None
+                forwarded = False
+                try:
+                    lane = await self._admit(deployment, estimated, priority)
+                    if admitted is not None:
+                        admitted.set()
+                    response = await self.client.chat.completions.create(stream=True, **kwargs)
+                    async for chunk in response:
+                        # With stream_options.include_usage the final chunk carries the usage
+                        usage = getattr(chunk, "usage", None)
+                        if usage is not None and getattr(usage, "total_tokens", None):
+                            lane.bucket.reconcile(estimated, usage.total_tokens)
+                            self._record_usage(deployment, usage)
+                        sink.put(chunk)
+                        forwarded = True
+                    return
+                except Exception as e:
+                    if not _is_rate_limit_error(e) or lane is None:
+                        sink.put(e)
+                        return
+                    self._stats["rate_limited"] += 1
+                    wait = _retry_after_seconds(e, default=2.0 * (attempt + 1))
+                    lane.bucket.block_for(wait)
+                    # Chunks already reached the caller - a second request would repeat them
+                    if forwarded or attempt >= self.max_rate_limit_retries:
+                        sink.put(e)
+                        return
+                    print(f"⏳ {deployment} rate limited - re-queueing stream in {wait:.1f}s")
+                finally:
+                    if lane is not None:
+                        self.slots.release()
+        finally:
+            sink.put(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "active": self.slots.active,
+            "max_concurrency": self.slots.limit,
+            "waiting_for_slot": self.slots.waiting,
+            "deployments": {
+                name: {**lane.bucket.snapshot(), "queued": len(lane.pending)}
+                for name, lane in self._lanes.items()
+            },
+            "prefix_cache": {
+                **prefix_cache_summary(list(self._prefix_cache.values())),
+                "by_deployment": {
+                    name: prefix_cache_summary([counter]) for name, counter in self._prefix_cache.items()
+                }
+            }
+        }
+
+
+class LLMGateway:
+    """
+    Blocking facade over AsyncLLMClient for the thread-based backend
+    """
+
+    def __init__(self, async_client: AsyncLLMClient):
+        self.async_client = async_client
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def complete(self, **kwargs) -> Any:
+        """Blocking chat completion, admitted at the calling thread's priority
+
+        A ``trace`` dict is passed through to clients that report retries/provider (ResilientLLMClient).
+        """
+        priority = kwargs.pop("priority", current_priority())
+        future = asyncio.run_coroutine_threadsafe(self.async_client.create(priority=priority, **kwargs), self._loop)
+        return future.result()
+
+    def stream(self, **kwargs) -> Iterator[Any]:
+        """Blocking iterator over streamed chat completion chunks"""
+        priority = kwargs.pop("priority", current_priority())
+        sink: "queue.Queue" = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self.async_client.stream(sink, priority=priority, **kwargs), self._loop)
+        while True:
+            item = sink.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def stats(self) -> Dict[str, Any]:
+        return asyncio.run_coroutine_threadsafe(self._stats(), self._loop).result()
+
+    async def _stats(self) -> Dict[str, Any]:
+        return self.async_client.stats()
@@ -0,0 +1,429 @@
+"""
+LLM Provider Resilience
+=======================
+
+Deadlines, retries, hedging and circuit breaking across LLM providers.
+
+Each configured provider (Azure Foundry, OpenAI, or the local fake used for
+tests) is wrapped in a ProviderEndpoint with its own admission client,
+circuit breaker and latency history. ResilientLLMClient then:
+  - enforces one overall deadline per call; streams get a first-token and
+    an inter-chunk deadline, and fail over until the first chunk arrives,
+  - retries transient provider failures (timeouts, connection errors, 5xx)
+    with exponential backoff and full jitter; deadlines of each attempt
+    start once the admission client lets the request through. 429s are
+    re-queued by the admission client only, never retried again here,
+  - sends a hedged request to the alternate provider when the primary is
+    slower than its recent latency percentile, keeping the first answer,
+  - skips providers whose breaker is open and raises ProviderUnavailableError
+    immediately when none is healthy, so callers can fall back to cached
+    results instead of waiting. Only provider-side failures count toward
+    the breaker; a local backlog or a 429 is the admission client's job.
+
+It exposes the same create()/stream()/stats() surface as AsyncLLMClient,
+so LLMGateway can wrap either.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from llm_client import PRIORITY_INTERACTIVE, prefix_cache_summary
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when every provider's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after consecutive failures; half-open trial after a cool-down
+
+    available() is a side-effect-free check for routing; acquire() is called
+    right before a request and takes the single half-open trial slot. A trial
+    ends with record_success/record_failure, release() (call cancelled or
+    inconclusive), or expires after the hold time passed to acquire().
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_expires_at: Optional[float] = None
+
+    def _trial_in_flight(self) -> bool:
+        return self._trial_expires_at is not None and time.monotonic() < self._trial_expires_at
+
+    def available(self) -> bool:
+        """Could a request be sent now (without taking the trial slot)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._trial_in_flight()
+
+    def acquire(self, hold_seconds: float) -> bool:
+        """Permission to send one request; in half-open state this takes the trial for up to hold_seconds"""
+        if not self.available():
+            return False
+        if self.state == "open":
+            self.state = "half_open"
+        if self.state == "half_open":
+            self._trial_expires_at = time.monotonic() + hold_seconds
+        return True
+
+    def release(self) -> None:
+        """End a trial without a verdict (cancelled, or a non-transient error)"""
+        self._trial_expires_at = None
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._trial_expires_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_expires_at = None
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"🔌 Circuit opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+
+class ProviderEndpoint:
+    """
+    One LLM provider: its admission client, default model and health state
+    """
+
+    def __init__(self, name: str, client, model: str, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "hedged_wins": 0}
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Provider-side failures: retried here and counted by the circuit breaker (429s are not - see AsyncLLMClient)"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+class ResilientLLMClient:
+    """
+    Deadline/retry/hedge/circuit-breaker policy over one or more providers
+    """
+
+    def __init__(self, providers: List[ProviderEndpoint], deadline: float = 45.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, hedge_percentile: float = 95.0,
+                 hedge_min_samples: int = 20, hedging: bool = True, first_token_timeout: float = 20.0,
+                 chunk_timeout: float = 15.0):
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.providers = providers
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedging = hedging
+        # Streams: the first chunk must arrive within first_token_timeout (capped by the deadline),
+        # and later chunks within chunk_timeout of each other
+        self.first_token_timeout = first_token_timeout
+        self.chunk_timeout = chunk_timeout
+        self._stats = {"calls": 0, "streams": 0, "retries": 0, "hedged": 0, "deadline_exceeded": 0,
+                       "unavailable": 0, "stalled_streams": 0}
+
+    def _healthy(self) -> List[ProviderEndpoint]:
+        return [provider for provider in self.providers if provider.breaker.available()]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform(0, min(cap, base * 2^attempt))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _request_for(self, provider: ProviderEndpoint, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # Callers choose deployments of the primary provider; other providers use their own model
+        request = dict(kwargs)
+        if provider is not self.providers[0] or not request.get("model"):
+            request["model"] = provider.model
+        return request
+
+    async def _call(self, provider: ProviderEndpoint, priority: int, kwargs: Dict[str, Any], timeout: float,
+                    trace: Optional[Dict[str, Any]] = None) -> Any:
+        request = self._request_for(provider, kwargs)
+
+        # The half-open trial (if any) is taken only now that this provider is really called
+        if not provider.breaker.acquire(hold_seconds=timeout):
+            raise ProviderUnavailableError(f"{provider.name} circuit open")
+
+        provider.stats["calls"] += 1
+        started = time.monotonic()
+        try:
+            # The timeout starts after admission - waiting for a slot or quota is not the provider's fault
+            response = await provider.client.create(priority=priority, timeout=timeout, **request)
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                provider.stats["failures"] += 1
+            if isinstance(e, Exception) and is_retryable_error(e):
+                provider.breaker.record_failure()
+            else:
+                provider.breaker.release()
+            raise
+
+        provider.latency.record(time.monotonic() - started)
+        provider.stats["successes"] += 1
+        provider.breaker.record_success()
+        if trace is not None:
+            trace.update(provider=provider.name, model=request["model"])
+        return response
+
+    def _hedge_delay(self, provider: ProviderEndpoint) -> Optional[float]:
+        if not self.hedging or len(provider.latency) < self.hedge_min_samples:
+            return None
+        return provider.latency.percentile(self.hedge_percentile)
+
+    async def _attempt(self, candidates: List[ProviderEndpoint], priority: int,
+                       kwargs: Dict[str, Any], timeout: float, trace: Optional[Dict[str, Any]] = None) -> Any:
+        primary = candidates[0]
+        alternate = candidates[1] if len(candidates) > 1 else None
+        hedge_delay = self._hedge_delay(primary) if alternate else None
+
+        primary_task = asyncio.ensure_future(self._call(primary, priority, kwargs, timeout, trace))
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await primary_task
+
+        done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay)
+        if done:
+            return primary_task.result()
+
+        # Primary is slower than its p-th percentile - race the alternate provider
+        self._stats["hedged"] += 1
+        print(f"🏇 Hedging slow {primary.name} request to {alternate.name}")
+        hedge_task = asyncio.ensure_future(
+            self._call(alternate, priority, kwargs, max(timeout - hedge_delay, 0.1), trace)
+        )
+        pending = {primary_task, hedge_task}
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge_task:
+                        alternate.stats["hedged_wins"] += 1
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+
+    async def create(self, priority: int = PRIORITY_INTERACTIVE, trace: Optional[Dict[str, Any]] = None,
+                     **kwargs) -> Any:
+        """Chat completion with deadline, retries, hedging and breaker-based failover
+
+        trace (optional) receives the retry count and the provider/model that answered.
+        """
+        self._stats["calls"] += 1
+        deadline_at = time.monotonic() + self.deadline
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(self.max_retries + 1):
+            candidates = self._healthy()
+            if not candidates:
+                self._stats["unavailable"] += 1
+                raise ProviderUnavailableError("All LLM providers are unavailable (circuit open)") from last_error
+
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                return await self._attempt(candidates, priority, kwargs, remaining, trace)
+            except ProviderUnavailableError as e:
+                # Another call took the provider's half-open trial meanwhile - re-route without backoff
+                last_error = e
+                if attempt >= self.max_retries:
+                    raise
+                continue
+            except Exception as e:
+                last_error = e
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = min(self._backoff(attempt), max(deadline_at - time.monotonic(), 0))
+                self._stats["retries"] += 1
+                if trace is not None:
+                    trace["retries"] = trace.get("retries", 0) + 1
+                print(f"🔁 LLM call failed ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        self._stats["deadline_exceeded"] += 1
+        raise asyncio.TimeoutError(f"LLM call exceeded its {self.deadline:.0f}s deadline") from last_error
+
+    async def stream(self, sink, priority: int = PRIORITY_INTERACTIVE, trace: Optional[Dict[str, Any]] = None,
+                     **kwargs) -> None:
+        """Streaming call with deadlines: until the first chunk arrives, failures and stalls are retried
+        (on the other provider if one is healthy); once tokens flow, a stall past chunk_timeout ends the stream.
+        """
+        self._stats["streams"] += 1
+        deadline_at = time.monotonic() + self.deadline
+        last_error: Optional[BaseException] = None
+        failed: List[ProviderEndpoint] = []
+
+        for attempt in range(self.max_retries + 1):
+            healthy = self._healthy()
+            candidates = [provider for provider in healthy if provider not in failed] or healthy
+            if not candidates:
+                self._stats["unavailable"] += 1
+                last_error = ProviderUnavailableError("All LLM providers are unavailable (circuit open)")
+                break
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self._stats["deadline_exceeded"] += 1
+                last_error = asyncio.TimeoutError(f"LLM stream got no tokens within its {self.deadline:.0f}s deadline")
+                break
+
+            provider = candidates[0]
+            started, error = await self._stream_from(provider, sink, priority, kwargs, remaining, trace)
+            if error is None:
+                sink.put(None)
+                return
+            last_error = error
+            # Tokens already reached the caller - a second provider would repeat them
+            if started or not (is_retryable_error(error) or isinstance(error, ProviderUnavailableError)):
+                break
+            if attempt < self.max_retries:
+                failed.append(provider)
+                self._stats["retries"] += 1
+                if trace is not None:
+                    trace["retries"] = trace.get("retries", 0) + 1
+                print(f"🔁 LLM stream from {provider.name} failed before the first token ({type(error).__name__}), retrying")
+                if not isinstance(error, ProviderUnavailableError):
+                    await asyncio.sleep(min(self._backoff(attempt), max(deadline_at - time.monotonic(), 0)))
+
+        sink.put(last_error)
+        sink.put(None)
+
+    async def _stream_from(self, provider: ProviderEndpoint, sink, priority: int, kwargs: Dict[str, Any],
+                           first_token_timeout: float, trace: Optional[Dict[str, Any]] = None) -> "tuple[bool, Optional[BaseException]]":
+        """Relay one provider's stream into sink; returns (any chunk forwarded, error or None)"""
+        request = self._request_for(provider, kwargs)
+        first_token_timeout = min(first_token_timeout, self.first_token_timeout)
+        if not provider.breaker.acquire(hold_seconds=first_token_timeout):
+            return False, ProviderUnavailableError(f"{provider.name} circuit open")
+        if trace is not None:
+            trace.update(provider=provider.name, model=request["model"])
+        provider.stats["calls"] += 1
+
+        relay: "asyncio.Queue" = asyncio.Queue()
+        admitted = asyncio.Event()
+        task = asyncio.ensure_future(
+            provider.client.stream(_AsyncSink(relay), priority=priority, admitted=admitted, **request)
+        )
+        started_at = time.monotonic()
+        started = False
+        error: Optional[BaseException] = None
+        try:
+            # The first-token deadline starts once the request is admitted, not while it is queued
+            admission = asyncio.ensure_future(admitted.wait())
+            try:
+                await asyncio.wait({task, admission}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admission.cancel()
+            started_at = time.monotonic()
+            while True:
+                timeout = self.chunk_timeout if started else first_token_timeout - (time.monotonic() - started_at)
+                try:
+                    item = await asyncio.wait_for(relay.get(), timeout=max(timeout, 0.01))
+                except asyncio.TimeoutError:
+                    self._stats["stalled_streams"] += 1
+                    error = asyncio.TimeoutError(
+                        f"{provider.name} stream stalled ({'between chunks' if started else 'before the first token'})"
+                    )
+                    break
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    error = item
+                    break
+                started = True
+                sink.put(item)
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        finally:
+            if not task.done():
+                task.cancel()
+            if error is None:
+                provider.latency.record(time.monotonic() - started_at)
+                provider.stats["successes"] += 1
+                provider.breaker.record_success()
+            elif isinstance(error, asyncio.CancelledError):
+                provider.breaker.release()
+            else:
+                provider.stats["failures"] += 1
+                if isinstance(error, Exception) and is_retryable_error(error):
+                    provider.breaker.record_failure()
+                else:
+                    provider.breaker.release()
+        return started, error
+
+    def stats(self) -> Dict[str, Any]:
+        admission = {provider.name: provider.client.stats() for provider in self.providers}
+        return {
+            **self._stats,
+            "prefix_cache": prefix_cache_summary([stats["prefix_cache"] for stats in admission.values()]),
+            "providers": {
+                provider.name: {
+                    **provider.stats,
+                    "model": provider.model,
+                    "breaker": provider.breaker.snapshot(),
+                    "p50_seconds": provider.latency.percentile(50),
+                    "p95_seconds": provider.latency.percentile(95),
+                    "admission": admission[provider.name]
+                }
+                for provider in self.providers
+            }
+        }
+
+
+class _AsyncSink:
+    """Queue-like put() into an asyncio.Queue on the same loop (what AsyncLLMClient.stream writes to)"""
+
+    def __init__(self, queue: "asyncio.Queue"):
+        self._queue = queue
+
+    def put(self, item) -> None:
+        self._queue.put_nowait(item)
@@ -0,0 +1,272 @@
+"""
+LLM Call Telemetry
+==================
+
+One record per LLM call: purpose (summary, drug_risk, ...), model or
+deployment, prompt/cached/completion tokens, time to first token (streamed
+calls), total latency, retries, outcome and estimated cost.
+
+Streamed calls count the usage chunk the provider sends at the end
+(stream_options.include_usage); Batch API requests are recorded from the
+usage block of the result file, without latency.
+
+Records feed rolling per-purpose percentiles for the stats endpoint and are
+appended to a local SQLite file for daily reports:
+
+    python llm_telemetry.py --day 2026-10-19
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from llm_client import usage_cached_tokens
+from model_router import estimate_cost
+
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_UNAVAILABLE = "unavailable"
+OUTCOME_INVALID = "invalid_output"
+OUTCOME_CANCELLED = "cancelled"
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)], 3)
+
+
+def _outcome_for(error: BaseException) -> str:
+    name = type(error).__name__
+    if isinstance(error, GeneratorExit):
+        return OUTCOME_CANCELLED
+    if isinstance(error, TimeoutError) or "Timeout" in name:
+        return OUTCOME_TIMEOUT
+    if name == "ProviderUnavailableError":
+        return OUTCOME_UNAVAILABLE
+    if name == "StructuredOutputError":
+        return OUTCOME_INVALID
+    return OUTCOME_ERROR
+
+
+class LLMCall:
+    """
+    Context manager measuring one call; fill in usage and first token while it runs
+    """
+
+    def __init__(self, telemetry: "LLMTelemetry", purpose: str, model: Optional[str]):
+        self.telemetry = telemetry
+        self.purpose = purpose
+        self.model = model or ""
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.outcome = OUTCOME_OK
+        self.error = ""
+        # Applied to the estimated cost (Batch API requests are billed at a discount)
+        self.cost_factor = 1.0
+        # Filled in by ResilientLLMClient: retries, provider and the model actually used
+        self.trace: Dict[str, Any] = {"retries": 0}
+        self._started = 0.0
+
+    def __enter__(self) -> "LLMCall":
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.latency = time.monotonic() - self._started
+        if exc is not None and self.outcome == OUTCOME_OK:
+            self.outcome = _outcome_for(exc)
+            self.error = f"{type(exc).__name__}: {exc}"[:300]
+        self.model = self.trace.get("model") or self.model
+        self.telemetry.record(self)
+        return False
+
+    def set_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            # Usage block from a batch result file
+            usage = SimpleNamespace(**usage)
+        self.prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        self.completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+        self.cached_tokens = usage_cached_tokens(usage)
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self._started
+
+    @property
+    def retries(self) -> int:
+        return int(self.trace.get("retries", 0))
+
+
+class LLMTelemetry:
+    """
+    Rolling per-purpose metrics plus a local SQLite log of every call
+    """
+
+    def __init__(self, db_path: Path, prices: Optional[Dict[str, Dict[str, float]]] = None, window: int = 1000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.prices = prices
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._recent: Dict[str, deque] = {}
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                day TEXT NOT NULL,
+                purpose TEXT NOT NULL,
+                model TEXT,
+                provider TEXT,
+                prompt_tokens INTEGER,
+                cached_tokens INTEGER,
+                completion_tokens INTEGER,
+                ttft REAL,
+                latency REAL,
+                retries INTEGER,
+                outcome TEXT,
+                cost REAL,
+                error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_day ON llm_calls(day)")
+        self._conn.commit()
+
+    def track(self, purpose: str, model: Optional[str] = None) -> LLMCall:
+        return LLMCall(self, purpose, model)
+
+    def record_result(self, purpose: str, model: Optional[str], usage: Any = None, error: str = "",
+                      cost_factor: float = 1.0) -> None:
+        """Record a call that ran elsewhere (a Batch API request) from its reported usage"""
+        call = LLMCall(self, purpose, model)
+        call.set_usage(usage)
+        call.cost_factor = cost_factor
+        if error:
+            call.outcome = OUTCOME_ERROR
+            call.error = error[:300]
+        self.record(call)
+
+    def record(self, call: LLMCall) -> None:
+        cost = estimate_cost(call.model, call.prompt_tokens, call.completion_tokens, self.prices)
+        if cost is not None:
+            cost *= call.cost_factor
+        now = time.time()
+        row = {
+            "ts": now,
+            "purpose": call.purpose,
+            "model": call.model,
+            "prompt_tokens": call.prompt_tokens,
+            "cached_tokens": call.cached_tokens,
+            "completion_tokens": call.completion_tokens,
+            "ttft": call.ttft,
+            "latency": call.latency,
+            "retries": call.retries,
+            "outcome": call.outcome,
+            "cost": cost
+        }
+        with self._lock:
+            self._recent.setdefault(call.purpose, deque(maxlen=self.window)).append(row)
+            self._conn.execute(
+                """
+                INSERT INTO llm_calls
+                    (ts, day, purpose, model, provider, prompt_tokens, cached_tokens, completion_tokens,
+                     ttft, latency, retries, outcome, cost, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (now, date.fromtimestamp(now).isoformat(), call.purpose, call.model, call.trace.get("provider"),
+                 call.prompt_tokens, call.cached_tokens, call.completion_tokens, call.ttft, call.latency,
+                 call.retries, call.outcome, cost, call.error)
+            )
+            self._conn.commit()
+
+        ttft = f", first token {call.ttft:.2f}s" if call.ttft is not None else ""
+        latency = f" in {call.latency:.2f}s" if call.latency is not None else ""
+        print(f"📈 {call.purpose} [{call.model}] {call.outcome}{latency}{ttft} - "
+              f"{call.prompt_tokens}+{call.completion_tokens} tokens, {call.retries} retries")
+
+    @staticmethod
+    def _aggregate(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        latencies = [row["latency"] for row in rows if row["outcome"] == OUTCOME_OK and row["latency"] is not None]
+        ttfts = [row["ttft"] for row in rows if row["ttft"] is not None]
+        outcomes: Dict[str, int] = {}
+        for row in rows:
+            outcomes[row["outcome"]] = outcomes.get(row["outcome"], 0) + 1
+        return {
+            "calls": len(rows),
+            "outcomes": outcomes,
+            "retries": sum(row["retries"] or 0 for row in rows),
+            "latency_seconds": {"p50": _percentile(latencies, 50), "p95": _percentile(latencies, 95),
+                                "p99": _percentile(latencies, 99)},
+            "ttft_seconds": {"p50": _percentile(ttfts, 50), "p95": _percentile(ttfts, 95)},
+            "prompt_tokens": sum(row["prompt_tokens"] or 0 for row in rows),
+            "cached_tokens": sum(row["cached_tokens"] or 0 for row in rows),
+            "completion_tokens": sum(row["completion_tokens"] or 0 for row in rows),
+            "estimated_cost_usd": round(sum(row["cost"] or 0.0 for row in rows), 4)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Rolling metrics over the last `window` calls per purpose"""
+        with self._lock:
+            recent = {purpose: list(rows) for purpose, rows in self._recent.items()}
+        return {
+            "window": self.window,
+            "by_purpose": {purpose: self._aggregate(rows) for purpose, rows in sorted(recent.items())}
+        }
+
+    def daily_report(self, day: date) -> Dict[str, Any]:
+        """Per-purpose and per-model totals and percentiles for one day"""
+        columns = ["purpose", "model", "prompt_tokens", "cached_tokens", "completion_tokens",
+                   "ttft", "latency", "retries", "outcome", "cost"]
+        with self._lock:
+            rows = [dict(zip(columns, values)) for values in self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM llm_calls WHERE day = ?", (day.isoformat(),)
+            )]
+
+        by_purpose: Dict[str, List[Dict[str, Any]]] = {}
+        by_model: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_purpose.setdefault(row["purpose"], []).append(row)
+            by_model.setdefault(row["model"] or "unknown", []).append(row)
+        return {
+            "day": day.isoformat(),
+            "total": self._aggregate(rows),
+            "by_purpose": {name: self._aggregate(group) for name, group in sorted(by_purpose.items())},
+            "by_model": {name: self._aggregate(group) for name, group in sorted(by_model.items())}
+        }
+
+    def prune(self, retention_days: int) -> int:
+        """Delete records older than the retention period"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).timestamp()
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM llm_calls WHERE ts < ?", (cutoff,)).rowcount
+            self._conn.commit()
+        return deleted
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import os
+
+    parser = argparse.ArgumentParser(description="Print the daily LLM usage report")
+    parser.add_argument("--day", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--path", default=os.getenv(
+        "LLM_TELEMETRY_PATH", str(Path(__file__).parent / "cache" / "llm_telemetry.sqlite3")
+    ))
+    args = parser.parse_args()
+
+    print(json.dumps(LLMTelemetry(Path(args.path)).daily_report(args.day), indent=2))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Offline Load Test
+=================
+
+Drives the backend's LLM paths against the in-process fake provider and
+reports throughput and latency percentiles. No network, no API quota.
+
+    python load_test.py --scenario mixed --requests 200 --concurrency 16
+    FAKE_LLM_LATENCY=lognormal:1200:0.6 FAKE_LLM_ERROR_RATE=0.05 python load_test.py
+
+Scenarios:
+  summary    call_openai_for_summary with distinct prompts
+  stream     stream_openai_summary (time to first section and to completion)
+  drug_risk  generate_drug_risk_assessment with distinct medication lists
+  bdt        watcher pipeline: parse BDT file -> format -> summary
+  mixed      all of the above, round robin
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Must be configured before backend.py is imported
+os.environ.setdefault('AI_PROVIDER', 'fake')
+os.environ.setdefault('FAKE_LLM_SEED', '42')
+os.environ.setdefault('SUMMARY_STORE_PATH', str(Path(tempfile.mkdtemp()) / 'load_test_store.sqlite3'))
+
+SCENARIOS = ['summary', 'stream', 'drug_risk', 'bdt']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def build_runners(backend):
+    from bdt_parser import BDTParser
+
+    bdt_path = Path(__file__).parent / 'hans_mueller_test.bdt'
+    parser = BDTParser()
+    bdt_text = parser.format_for_ai(parser.parse_bdt_file(str(bdt_path))) if bdt_path.exists() else ""
+
+    def summary(i):
+        prompt = f"PATIENT DATA DUMP:\n\n1. DEMOGRAPHICS\n- Name: Load Test {i}\n- Age: {40 + i % 50}\n"
+        result = backend.call_openai_for_summary(prompt, temperature=0.1)
+        return "error" not in result, None
+
+    def stream(i):
+        prompt = f"PATIENT DATA DUMP:\n\n1. DEMOGRAPHICS\n- Name: Stream Test {i}\n- Age: {40 + i % 50}\n"
+        started = time.perf_counter()
+        first_section = None
+        ok = False
+        for event, data in backend.stream_openai_summary(prompt):
+            if event == "section" and first_section is None:
+                first_section = time.perf_counter() - started
+            if event == "complete":
+                ok = "error" not in data
+        return ok, first_section
+
+    def drug_risk(i):
+        patient_data = {
+            'patient': {'medications': [f"Metformin {500 + i}mg", "Ramipril 5mg"], 'allergies': '[]', 'chronic_conditions': '[]'},
+            'prescriptions': [],
+            'lab_orders': [{'test_name': 'Creatinine', 'result': f"{1 + i % 10 / 10:.1f}", 'status': 'completed'}]
+        }
+        result = backend.generate_drug_risk_assessment(patient_data)
+        return "error" not in result, None
+
+    def bdt(i):
+        result = backend.generate_ai_summary_from_bdt_text(f"{bdt_text}\nLoad test export #{i}")
+        return "error" not in result, None
+
+    return {'summary': summary, 'stream': stream, 'drug_risk': drug_risk, 'bdt': bdt}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against the fake LLM provider")
+    parser.add_argument('--scenario', choices=SCENARIOS + ['mixed'], default='mixed')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--verbose', action='store_true', help="Show backend log output")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import backend
+    runners = build_runners(backend)
+    names = SCENARIOS if args.scenario == 'mixed' else [args.scenario]
+
+    results = {name: {'latencies': [], 'first_section': [], 'errors': 0} for name in names}
+
+    def run(i):
+        name = names[i % len(names)]
+        started = time.perf_counter()
+        try:
+            ok, first_section = runners[name](i)
+        except Exception:
+            ok, first_section = False, None
+        elapsed = time.perf_counter() - started
+        return name, ok, elapsed, first_section
+
+    print(f"🚦 {args.requests} requests, concurrency {args.concurrency}, scenario {args.scenario}, "
+          f"fake latency {os.getenv('FAKE_LLM_LATENCY', 'lognormal:900:0.4')}")
+    started = time.perf_counter()
+    output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for name, ok, elapsed, first_section in executor.map(run, range(args.requests)):
+                results[name]['latencies'].append(elapsed)
+                if first_section is not None:
+                    results[name]['first_section'].append(first_section)
+                if not ok:
+                    results[name]['errors'] += 1
+    wall = time.perf_counter() - started
+
+    print(f"\n⏱️  Wall clock {wall:.2f}s - throughput {args.requests / wall:.2f} req/s\n")
+    print(f"{'scenario':<10} {'n':>5} {'errors':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, data in results.items():
+        latencies = data['latencies']
+        print(f"{name:<10} {len(latencies):>5} {data['errors']:>7} "
+              f"{percentile(latencies, 50):>7.2f}s {percentile(latencies, 95):>7.2f}s "
+              f"{percentile(latencies, 99):>7.2f}s {max(latencies or [0]):>7.2f}s")
+        if data['first_section']:
+            print(f"{'':<10} first section p50 {percentile(data['first_section'], 50):.2f}s "
+                  f"p95 {percentile(data['first_section'], 95):.2f}s")
+
+    if backend.llm_gateway:
+        llm = backend.llm_gateway.stats()
+        print(f"\n🔁 retries {llm['retries']}, hedged {llm['hedged']}, unavailable {llm['unavailable']}, "
+              f"prefix cache hit rate {llm['prefix_cache']['hit_rate']}")
+    print(f"🧪 fake provider: {backend.fake_engine.stats if hasattr(backend, 'fake_engine') else 'n/a'}")
+
+
+if __name__ == '__main__':
+    main()
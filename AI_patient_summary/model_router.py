@@ -0,0 +1,166 @@
+"""
+Complexity-Based Model Routing
+==============================
+
+Scores a patient bundle locally and picks the deployment for its summary:
+simple follow-ups go to a fast, cheap deployment, complex patients to a
+stronger one.
+
+The score adds up four features, each divided by its threshold:
+    history records, active problems, abnormal labs, distinct medications
+so a patient reaching any single threshold (or several partial ones)
+scores >= 1.0 and is routed to the strong deployment.
+
+Per-route call counts, latency percentiles, tokens and estimated cost are
+kept for the stats endpoint.
+"""
+
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from prompt_budget import looks_abnormal
+
+# USD per 1M tokens (input, output); override with LLM_MODEL_PRICES
+DEFAULT_MODEL_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "output": 8.00},
+    "fake-model": {"input": 0.0, "output": 0.0}
+}
+
+
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(item) for item in value if item]
+    text = str(value).strip()
+    if text.startswith('['):
+        try:
+            return [str(item) for item in json.loads(text) if item]
+        except json.JSONDecodeError:
+            pass
+    return [part.strip() for part in text.replace(';', ',').split(',') if part.strip()]
+
+
+def complexity_features(patient_data: Dict[str, Any]) -> Dict[str, int]:
+    patient = patient_data.get('patient') or {}
+    visits = patient_data.get('visits') or []
+    prescriptions = patient_data.get('prescriptions') or []
+    labs = patient_data.get('lab_orders') or []
+    radiology = patient_data.get('radiology_orders') or []
+
+    problems = {condition.lower() for condition in _as_list(patient.get('chronic_conditions'))}
+    problems.update(str(visit['diagnosis']).strip().lower() for visit in visits if visit.get('diagnosis'))
+
+    medications = {str(rx['medication_name']).strip().lower() for rx in prescriptions if rx.get('medication_name')}
+    medications.update(medication.lower() for medication in _as_list(patient.get('medications')))
+
+    return {
+        "history_records": len(visits) + len(prescriptions) + len(labs) + len(radiology),
+        "active_problems": len(problems),
+        "abnormal_labs": sum(1 for lab in labs if looks_abnormal(str(lab.get('result') or ''))),
+        "medications": len(medications)
+    }
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int,
+                  prices: Optional[Dict[str, Dict[str, float]]] = None) -> Optional[float]:
+    """Estimated USD cost of one call, or None for an unknown model"""
+    price = (prices or DEFAULT_MODEL_PRICES).get(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price["input"] + completion_tokens * price["output"]) / 1_000_000
+
+
+class _RouteMetrics:
+    def __init__(self):
+        self.decisions = 0
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latencies: deque = deque(maxlen=500)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+class ModelRouter:
+    """
+    Route patient summaries to the fast or the strong deployment
+    """
+
+    def __init__(self, fast_model: str, strong_model: str, thresholds: Dict[str, float],
+                 prices: Optional[Dict[str, Dict[str, float]]] = None):
+        self.routes = {"fast": fast_model, "strong": strong_model}
+        self.thresholds = thresholds
+        self.prices = {**DEFAULT_MODEL_PRICES, **(prices or {})}
+        self._lock = threading.Lock()
+        self._metrics = {name: _RouteMetrics() for name in self.routes}
+
+    def score(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        features = complexity_features(patient_data)
+        score = sum(features[name] / self.thresholds[name] for name in features if self.thresholds.get(name))
+        return {"features": features, "score": round(score, 3)}
+
+    def route(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Return {"route", "model", "score", "features"} for a patient bundle"""
+        scored = self.score(patient_data)
+        route = "strong" if scored["score"] >= 1.0 else "fast"
+        with self._lock:
+            self._metrics[route].decisions += 1
+        print(f"🧭 Routed to {route} ({self.routes[route]}) - complexity {scored['score']} {scored['features']}")
+        return {"route": route, "model": self.routes[route], **scored}
+
+    def _route_for_model(self, model: str) -> Optional[str]:
+        # When both routes share a deployment, calls are attributed to "fast"
+        for name, route_model in self.routes.items():
+            if route_model == model:
+                return name
+        return None
+
+    def observe(self, model: str, seconds: float, usage: Any = None, ok: bool = True) -> None:
+        """Record one completed call made with a routed deployment"""
+        route = self._route_for_model(model)
+        if route is None:
+            return
+        prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+        with self._lock:
+            metrics = self._metrics[route]
+            metrics.calls += 1
+            if not ok:
+                metrics.failures += 1
+                return
+            metrics.latencies.append(seconds)
+            metrics.prompt_tokens += prompt_tokens
+            metrics.completion_tokens += completion_tokens
+            metrics.cost += estimate_cost(model, prompt_tokens, completion_tokens, self.prices) or 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "thresholds": dict(self.thresholds),
+                "routes": {
+                    name: {
+                        "model": self.routes[name],
+                        "decisions": metrics.decisions,
+                        "calls": metrics.calls,
+                        "failures": metrics.failures,
+                        "p50_seconds": metrics.percentile(50),
+                        "p95_seconds": metrics.percentile(95),
+                        "prompt_tokens": metrics.prompt_tokens,
+                        "completion_tokens": metrics.completion_tokens,
+                        "estimated_cost_usd": round(metrics.cost, 4)
+                    }
+                    for name, metrics in self._metrics.items()
+                }
+            }
@@ -0,0 +1,369 @@
+"""
+Overnight Pre-Generation
+========================
+
+Reads the next clinic day's appointment list and pre-generates summaries
+for every scheduled patient during a configurable night window, so the
+morning list opens warm.
+
+Requests are submitted in bulk through a BatchProvider:
+    OpenAIBatchProvider  - provider Batch API (JSONL upload, poll, download)
+    LocalBatchProvider   - local stand-in that runs the same requests through
+                           any completion callable (fake provider, Azure, tests)
+
+Schedules come from the EHR `appointments` table or from a CSV/JSON file
+with patient_id, scheduled_at, reason and status columns.
+"""
+
+import abc
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+# ==========================================
+# 📅 SCHEDULE
+# ==========================================
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, dtime.min)
+    text = str(value or "").strip()
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M', '%d.%m.%Y %H:%M', '%d.%m.%Y', '%m/%d/%Y %H:%M'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_appointment(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Appointment row (DB or file) -> {patient_id, scheduled_at, reason, status}"""
+    try:
+        patient_id = int(row.get('patient_id'))
+    except (TypeError, ValueError):
+        return None
+    scheduled_at = _parse_datetime(row.get('scheduled_at'))
+    if scheduled_at is None:
+        return None
+    return {
+        "patient_id": patient_id,
+        "scheduled_at": scheduled_at,
+        "reason": (row.get('reason') or '').strip(),
+        "status": (row.get('status') or 'scheduled').strip().lower()
+    }
+
+
+def load_schedule_file(path: Path) -> List[Dict[str, Any]]:
+    """Read appointments from a CSV file or a JSON list (or {"appointments": [...]})"""
+    path = Path(path)
+    text = path.read_text(encoding='utf-8-sig')
+    if path.suffix.lower() == '.json':
+        data = json.loads(text)
+        rows = data.get('appointments', []) if isinstance(data, dict) else data
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    appointments = [normalize_appointment(row) for row in rows]
+    return [appointment for appointment in appointments if appointment]
+
+
+def appointments_for_day(appointments: List[Dict[str, Any]], day: date) -> List[Dict[str, Any]]:
+    """Scheduled (not cancelled/completed) appointments on one day, in time order"""
+    selected = [
+        appointment for appointment in appointments
+        if appointment['scheduled_at'].date() == day and appointment['status'] == 'scheduled'
+    ]
+    return sorted(selected, key=lambda appointment: appointment['scheduled_at'])
+
+
+# ==========================================
+# 🌙 TIME WINDOW
+# ==========================================
+
+def parse_window(spec: str) -> Tuple[dtime, dtime]:
+    """'22:00-06:00' -> (22:00, 06:00)"""
+    start, end = (part.strip() for part in spec.split('-', 1))
+    return dtime.fromisoformat(start), dtime.fromisoformat(end)
+
+
+def active_window(now: datetime, window: Tuple[dtime, dtime]) -> Optional[Dict[str, Any]]:
+    """The window containing `now` as {start, end, clinic_day}, or None outside it"""
+    start_time, end_time = window
+    start = datetime.combine(now.date(), start_time)
+    if start_time <= end_time:
+        end = datetime.combine(now.date(), end_time)
+    else:
+        # Wraps midnight: before the end time we are in the window that started yesterday
+        if now.time() < end_time:
+            start -= timedelta(days=1)
+        end = datetime.combine(start.date() + timedelta(days=1), end_time)
+
+    if not (start <= now < end):
+        return None
+
+    # The clinic day is the morning after the window (or the same day for early-morning windows)
+    clinic_day = end.date() if end.time() < dtime(12, 0) else end.date() + timedelta(days=1)
+    return {"start": start, "end": end, "clinic_day": clinic_day}
+
+
+# ==========================================
+# 📦 BATCH PROVIDERS
+# ==========================================
+
+class BatchProvider(abc.ABC):
+    """
+    Bulk submission interface: submit once, poll, then collect results by custom_id
+    """
+
+    name = "batch"
+
+    @abc.abstractmethod
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        """Submit [{"custom_id", "body"}] chat completion requests, return a batch id"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """{"status", "completed", "failed", "total"}"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """custom_id -> {"content": str, "usage": {...}} or {"error": str}"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def cancel(self, batch_id: str) -> None:
+        raise NotImplementedError
+
+
+class LocalBatchProvider(BatchProvider):
+    """
+    Runs batch requests locally through a completion callable (body -> response)
+    """
+
+    name = "local"
+
+    def __init__(self, complete: Callable[..., Any], workers: int = 2):
+        self.complete = complete
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        batch = {"status": "in_progress", "total": len(requests), "results": {}, "cancelled": False}
+        with self._lock:
+            self._batches[batch_id] = batch
+        threading.Thread(target=self._run, args=(batch, requests), daemon=True).start()
+        return batch_id
+
+    def _run(self, batch: Dict[str, Any], requests: List[Dict[str, Any]]) -> None:
+        def run_one(request):
+            if batch["cancelled"]:
+                return
+            try:
+                response = self.complete(**request["body"])
+                usage = getattr(response, "usage", None)
+                result = {
+                    "content": response.choices[0].message.content or "",
+                    "usage": {
+                        "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+                        "completion_tokens": getattr(usage, "completion_tokens", 0)
+                    }
+                }
+            except Exception as e:
+                result = {"error": str(e)}
+            with self._lock:
+                batch["results"][request["custom_id"]] = result
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run_one, requests))
+        with self._lock:
+            batch["status"] = "cancelled" if batch["cancelled"] else "completed"
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        with self._lock:
+            batch = self._batches[batch_id]
+            failed = sum(1 for result in batch["results"].values() if "error" in result)
+            return {
+                "status": batch["status"],
+                "completed": len(batch["results"]) - failed,
+                "failed": failed,
+                "total": batch["total"]
+            }
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return dict(self._batches[batch_id]["results"])
+
+    def cancel(self, batch_id: str) -> None:
+        with self._lock:
+            self._batches[batch_id]["cancelled"] = True
+
+
+# Batch API requests are billed at half the standard token price
+BATCH_PRICE_FACTOR = 0.5
+
+
+class OpenAIBatchProvider(BatchProvider):
+    """
+    OpenAI / Azure OpenAI Batch API (requests run at batch pricing within the completion window)
+
+    These requests never pass through the local client, so with a telemetry
+    store each result is recorded from the usage block of the result file.
+    """
+
+    name = "openai"
+
+    def __init__(self, client: Any, endpoint: str = "/v1/chat/completions", completion_window: str = "24h",
+                 telemetry: Any = None, purpose: str = "overnight_batch"):
+        self.client = client
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+        self.telemetry = telemetry
+        self.purpose = purpose
+        self._recorded = set()
+
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        lines = [
+            json.dumps({"custom_id": request["custom_id"], "method": "POST", "url": self.endpoint, "body": request["body"]})
+            for request in requests
+        ]
+        upload = self.client.files.create(
+            file=("overnight_batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint=self.endpoint,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "completed": getattr(counts, "completed", 0) if counts else 0,
+            "failed": getattr(counts, "failed", 0) if counts else 0,
+            "total": getattr(counts, "total", 0) if counts else 0
+        }
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        results: Dict[str, Dict[str, Any]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                body = response.get("body") or {}
+                if item.get("error") or response.get("status_code", 200) != 200:
+                    error = item.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+                    results[item["custom_id"]] = {"error": json.dumps(error) if isinstance(error, dict) else str(error)}
+                else:
+                    results[item["custom_id"]] = {
+                        "content": body["choices"][0]["message"].get("content") or "",
+                        "usage": body.get("usage") or {}
+                    }
+                self._record(batch_id, body.get("model"), results[item["custom_id"]])
+        self._recorded.add(batch_id)
+        return results
+
+    def _record(self, batch_id: str, model: Optional[str], result: Dict[str, Any]) -> None:
+        # Once per batch, however often its results are read
+        if self.telemetry is None or batch_id in self._recorded:
+            return
+        self.telemetry.record_result(self.purpose, model, result.get("usage"), error=result.get("error", ""),
+                                     cost_factor=BATCH_PRICE_FACTOR)
+
+    def cancel(self, batch_id: str) -> None:
+        self.client.batches.cancel(batch_id)
+
+
+def run_batch(provider: BatchProvider, requests: List[Dict[str, Any]], deadline: Optional[datetime] = None,
+              poll_seconds: float = 60.0) -> Dict[str, Dict[str, Any]]:
+    """Submit, poll until finished (or cancel at the deadline) and return whatever results exist"""
+    if not requests:
+        return {}
+
+    batch_id = provider.submit(requests)
+    print(f"📦 Submitted {len(requests)} requests as {provider.name} batch {batch_id}")
+    cancelled = False
+    while True:
+        status = provider.status(batch_id)
+        if status["status"] in TERMINAL_STATUSES:
+            break
+        if deadline and datetime.now() >= deadline and not cancelled:
+            print(f"⏰ Window closed with batch {batch_id} at {status['completed']}/{status['total']} - cancelling")
+            provider.cancel(batch_id)
+            cancelled = True
+        time.sleep(poll_seconds)
+
+    print(f"📦 Batch {batch_id} {status['status']}: {status['completed']} completed, {status['failed']} failed")
+    return provider.results(batch_id)
+
+
+# ==========================================
+# ⏰ SCHEDULER
+# ==========================================
+
+class OvernightScheduler:
+    """
+    Background loop that runs pre-generation once per clinic day inside the night window
+    """
+
+    def __init__(self, window: Tuple[dtime, dtime], run: Callable[[date, datetime], Dict[str, Any]],
+                 check_seconds: float = 300.0):
+        self.window = window
+        self.run = run
+        self.check_seconds = check_seconds
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._done_days = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            window = active_window(datetime.now(), self.window)
+            if window and window["clinic_day"] not in self._done_days:
+                self._done_days.add(window["clinic_day"])
+                try:
+                    self.last_report = self.run(window["clinic_day"], window["end"])
+                except Exception as e:
+                    print(f"❌ Overnight pre-generation failed: {e}")
+                    self.last_report = {"clinic_day": window["clinic_day"].isoformat(), "error": str(e)}
+            time.sleep(self.check_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window": f"{self.window[0].strftime('%H:%M')}-{self.window[1].strftime('%H:%M')}",
+            "running": bool(self._thread and self._thread.is_alive()),
+            "last_report": self.last_report
+        }
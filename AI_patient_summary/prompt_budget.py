@@ -0,0 +1,172 @@
+"""
+Token-Budgeted Prompt Assembly
+==============================
+
+Builds patient prompts that fit a configurable input-token budget.
+
+History entries (visits, labs, medications, imaging) are scored by recency,
+abnormality and relevance to the current visit reason, then added greedily
+until the budget is spent. Pinned content (visit reason, demographics) is
+always included. The assembler reports what it dropped so the omission is
+visible in the logs and, briefly, to the model itself.
+
+Section titles are fixed text and record counts and omission notes go in
+one line after the sections, so a new record appends to a section instead
+of changing bytes near the start of the prompt (provider prefix caching).
+"""
+
+import math
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Matches common abnormal-result markers: explicit flags, words and arrows
+ABNORMAL_PATTERN = re.compile(
+    r"(\[(HIGH|LOW|H|L|HH|LL)\]|\b(high|low|abnormal|elevated|decreased|positive|critical|pathologisch)\b|[↑↓])",
+    re.IGNORECASE
+)
+
+_WORD_PATTERN = re.compile(r"[a-zA-ZäöüÄÖÜß]{4,}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate (~4 characters per token for mixed clinical text)"""
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / 4))
+
+
+def parse_entry_date(value: Any) -> Optional[datetime]:
+    """Best-effort conversion of record dates (datetime, date, ISO or German strings)"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    if not value:
+        return None
+    candidate = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y', '%d%m%Y'):
+        try:
+            return datetime.strptime(candidate[:10], fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def looks_abnormal(text: str) -> bool:
+    return bool(text and ABNORMAL_PATTERN.search(text))
+
+
+def reason_keywords(reason: str) -> List[str]:
+    return sorted({word.lower() for word in _WORD_PATTERN.findall(reason or "")})
+
+
+class PromptItem:
+    def __init__(self, section: str, text: str, when: Optional[datetime], abnormal: bool, relevant: bool, order: int):
+        self.section = section
+        self.text = text
+        self.when = when
+        self.abnormal = abnormal
+        self.relevant = relevant
+        self.order = order
+        self.tokens = estimate_tokens(text) + 1
+        self.score = 0.0
+
+
+class PromptAssembler:
+    """
+    Greedy, score-ordered prompt builder with a hard token budget
+    """
+
+    def __init__(self, token_budget: int, reason: str = "", now: Optional[datetime] = None,
+                 recency_half_life_days: float = 365.0):
+        self.token_budget = token_budget
+        self.keywords = reason_keywords(reason)
+        self.now = now or datetime.now()
+        self.recency_half_life_days = recency_half_life_days
+        self._pinned: List[str] = []
+        self._tail: List[str] = []
+        self._sections: Dict[str, str] = {}
+        self._items: List[PromptItem] = []
+
+    def pin(self, text: str) -> None:
+        """Content that is always included (visit reason, demographics)"""
+        self._pinned.append(text)
+
+    def pin_tail(self, text: str) -> None:
+        """Always-included content placed after all sections (volatile context goes last)"""
+        self._tail.append(text)
+
+    def section(self, name: str, title: str) -> None:
+        """Declare a section; the title is used verbatim (counts go in the note after the sections)"""
+        self._sections[name] = title
+
+    def add(self, section: str, text: str, when: Optional[datetime] = None,
+            abnormal: Optional[bool] = None, relevant: bool = False) -> None:
+        if section not in self._sections:
+            self._sections[section] = section
+        if abnormal is None:
+            abnormal = looks_abnormal(text)
+        self._items.append(PromptItem(section, text, when, abnormal, relevant, len(self._items)))
+
+    def _score(self, item: PromptItem) -> float:
+        if item.when is not None:
+            age_days = max((self.now - item.when).total_seconds() / 86400.0, 0.0)
+            recency = 0.5 ** (age_days / self.recency_half_life_days)
+        else:
+            recency = 0.3
+
+        lowered = item.text.lower()
+        keyword_hits = sum(1 for keyword in self.keywords if keyword in lowered)
+
+        return recency + (1.0 if item.abnormal else 0.0) + (1.5 if item.relevant else 0.0) + 0.5 * min(keyword_hits, 3)
+
+    def assemble(self) -> Tuple[str, Dict[str, Any]]:
+        """Return the prompt text and a report of kept/dropped entries"""
+        pinned_text = "".join(self._pinned)
+        tail_text = "".join(self._tail)
+        used = estimate_tokens(pinned_text) + estimate_tokens(tail_text)
+        # Reserve room for section titles and the record-count note
+        used += sum(estimate_tokens(title) + 12 for title in self._sections.values())
+
+        for item in self._items:
+            item.score = self._score(item)
+
+        kept = set()
+        for item in sorted(self._items, key=lambda candidate: (-candidate.score, candidate.order)):
+            if used + item.tokens <= self.token_budget:
+                kept.add(item.order)
+                used += item.tokens
+
+        report: Dict[str, Any] = {"token_budget": self.token_budget, "kept": {}, "dropped": {}, "dropped_tokens": 0}
+        parts = [pinned_text]
+        counts = []
+        for name, title in self._sections.items():
+            items = [item for item in self._items if item.section == name]
+            if not items:
+                continue
+            shown = [item for item in items if item.order in kept]
+            dropped = len(items) - len(shown)
+            report["kept"][name] = len(shown)
+            report["dropped"][name] = dropped
+            report["dropped_tokens"] += sum(item.tokens for item in items if item.order not in kept)
+
+            parts.append(title)
+            parts.extend(f"{item.text}\n" for item in shown)
+            counts.append(f"{name} {len(items)}" + (f" ({dropped} lower-priority entries omitted)" if dropped else ""))
+
+        if counts:
+            omitted = " - omissions due to the input token budget" if report["dropped_tokens"] else ""
+            parts.append(f"\nRECORD COUNTS: {', '.join(counts)}{omitted}\n")
+        parts.append(tail_text)
+        prompt = "".join(parts)
+        report["estimated_tokens"] = estimate_tokens(prompt)
+        return prompt, report
+
+    @staticmethod
+    def describe(report: Dict[str, Any]) -> str:
+        dropped = {name: count for name, count in report["dropped"].items() if count}
+        if not dropped:
+            return f"~{report['estimated_tokens']} tokens, nothing dropped (budget {report['token_budget']})"
+        details = ", ".join(f"{count} {name}" for name, count in dropped.items())
+        return f"~{report['estimated_tokens']} tokens, dropped {details} (~{report['dropped_tokens']} tokens, budget {report['token_budget']})"
@@ -0,0 +1,198 @@
+"""
+Response Encoding
+=================
+
+Serialization for the large JSON responses (patient summaries): field
+projection, a fast JSON encoder for MySQL row values, and gzip/brotli
+compression negotiated from Accept-Encoding above a size threshold.
+
+Small payloads are sent uncompressed - below ~1 KB compression costs more
+time than it saves on a local network.
+
+PreparedJSON holds a response body serialized and deflated once, when the
+summary is cached. Fields that change per request (age, staleness) are
+appended at send time: as plain bytes, or as a final stored deflate block
+spliced onto the pre-compressed stream, so a gzip cache hit costs a header,
+a few bytes of CRC and the socket write. Brotli (optional `brotli`
+package) is only used for clients that do not accept gzip.
+"""
+
+import gzip
+import json
+import struct
+import threading
+import zlib
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def json_default(value: Any) -> Any:
+    """JSON for MySQL row values, matching FastAPI's encoder (ISO dates, Decimal as number)"""
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def encode_json(payload: Any) -> bytes:
+    return json.dumps(payload, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def parse_list(param: Optional[str]) -> List[str]:
+    """Comma-separated query parameter as a list ("a, b,,c" -> ["a", "b", "c"])"""
+    return [item.strip() for item in (param or "").split(",") if item.strip()]
+
+
+def project(payload: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keep only the listed fields; "key.sub" selects one entry of a nested object"""
+    result: Dict[str, Any] = {}
+    whole = {field for field in fields if "." not in field}
+    for field in fields:
+        key, _, sub = field.partition(".")
+        if key not in payload:
+            continue
+        if not sub:
+            result[key] = payload[key]
+        elif key not in whole and isinstance(payload[key], dict) and sub in payload[key]:
+            result.setdefault(key, {})[sub] = payload[key][sub]
+    return result
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding header as {encoding: quality}"""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str], preferred: Tuple[str, ...] = ("gzip", "br")) -> Optional[str]:
+    """First encoding in preferred order that the client accepts (and this host supports), or None"""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in preferred:
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 5) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+
+# Minimal gzip member header (no name, no mtime, unknown OS)
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+class PreparedJSON:
+    """
+    JSON object serialized (and deflated) once; per-request fields are appended when it is sent
+    """
+
+    def __init__(self, payload: Dict[str, Any], gzip_level: int = 5):
+        encoded = encode_json(payload)
+        # Everything but the closing brace, so more fields can follow
+        self.head = encoded[:-1]
+        self.empty = encoded == b"{}"
+        self.crc = zlib.crc32(self.head)
+
+        # Raw deflate ending on a byte-aligned, non-final block (sync flush): a final
+        # stored block with the per-request fields completes the stream
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.deflated = compressor.compress(self.head) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.head) + len(self.deflated)
+
+    def _tail(self, extra: Optional[Dict[str, Any]]) -> bytes:
+        if not extra:
+            return b"}"
+        fields = encode_json(extra)[1:]
+        return fields if self.empty else b"," + fields
+
+    def body(self, extra: Optional[Dict[str, Any]] = None) -> bytes:
+        return self.head + self._tail(extra)
+
+    def gzip_body(self, extra: Optional[Dict[str, Any]] = None) -> bytes:
+        tail = self._tail(extra)
+        stored_block = b"\x01" + struct.pack("<HH", len(tail), len(tail) ^ 0xFFFF) + tail
+        trailer = struct.pack("<II", zlib.crc32(tail, self.crc), (len(self.head) + len(tail)) & 0xFFFFFFFF)
+        return GZIP_HEADER + self.deflated + stored_block + trailer
+
+
+class ResponseEncoder:
+    """
+    Prepared JSON responses, compressed per Accept-Encoding once they pass min_size
+    """
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 5):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+
+        self._lock = threading.Lock()
+        self._stats = {"responses": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def prepare(self, payload: Dict[str, Any]) -> PreparedJSON:
+        return PreparedJSON(payload, self.gzip_level)
+
+    def prepared_response(self, prepared: PreparedJSON, extra: Optional[Dict[str, Any]] = None,
+                          accept_encoding: Optional[str] = None,
+                          headers: Optional[Dict[str, str]] = None) -> Response:
+        """Send a prepared body plus per-request fields; gzip is spliced, not recompressed"""
+        headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+        size = len(prepared.head) + 1
+        encoding = negotiate_encoding(accept_encoding) if size >= self.min_size else None
+        if encoding == "gzip":
+            body = prepared.gzip_body(extra)
+        else:
+            body = prepared.body(extra)
+            if encoding:
+                body = compress(body, encoding, self.gzip_level)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        with self._lock:
+            self._stats["responses"] += 1
+            self._stats["compressed"] += 1 if encoding else 0
+            self._stats["bytes_in"] += size
+            self._stats["bytes_out"] += len(body)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "min_size": self.min_size,
+                "brotli": brotli is not None,
+                "ratio": round(self._stats["bytes_out"] / self._stats["bytes_in"], 3) if self._stats["bytes_in"] else None
+            }
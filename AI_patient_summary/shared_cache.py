@@ -0,0 +1,249 @@
+"""
+Shared Cross-Process Cache
+==========================
+
+SQLite (WAL mode) store that lets several uvicorn worker processes on one
+host share the per-patient caches. Each worker keeps its BoundedTTLCache
+as an in-process L1; this file is the L2 every worker reads and writes.
+
+Rows carry an etag that changes on every write, so an L1 hit only costs a
+one-row metadata lookup; values are unpickled only when another worker
+wrote a newer entry. Values are pickled (MySQL rows hold datetime/Decimal
+values) and zlib compressed.
+
+ProcessLock is a lease lock in the same file: only one worker at a time
+generates a given patient's summary, the others wait and then find the
+result in L2 instead of calling the LLM again. The holder renews its lease
+while it works (generation can take longer than one lease); a crashed worker
+stops renewing, so its lock expires instead of blocking a patient forever.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+class ProcessLock:
+    """
+    Cross-process lease lock on a name (not re-entrant; wrap it in a thread lock)
+    """
+
+    def __init__(self, store: "SharedCacheStore", name: str):
+        self.store = store
+        self.name = name
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self._held: Optional[threading.Event] = None
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        started = time.monotonic()
+        delay = 0.02
+        while not self.store._try_lock(self.name, self.owner):
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+        self._held = threading.Event()
+        threading.Thread(target=self._renew, args=(self._held,), name=f"lease:{self.name}", daemon=True).start()
+        return True
+
+    def _renew(self, held: threading.Event) -> None:
+        # Extend the lease at a third of its length until released
+        while not held.wait(self.store.lock_lease_seconds / 3):
+            if not self.store._renew_lock(self.name, self.owner):
+                print(f"⚠️ Lease lock {self.name} expired before it could be renewed")
+                return
+
+    def release(self) -> None:
+        if self._held is not None:
+            self._held.set()
+            self._held = None
+        self.store._unlock(self.name, self.owner)
+
+    def __enter__(self) -> "ProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.release()
+        return False
+
+
+class SharedCacheStore:
+    """
+    SQLite WAL key-value store shared by all worker processes, with lease locks
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int = 256 * 1024 * 1024, lock_lease_seconds: float = 60.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock_lease_seconds = lock_lease_seconds
+
+        self._lock = threading.Lock()
+        self._stats = {"reads": 0, "loads": 0, "writes": 0, "evictions": 0, "lock_retries": 0}
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                stale INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_stored_at ON entries(stored_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    # ------------------------------------------------------------------
+    # Entries
+    # ------------------------------------------------------------------
+
+    def meta(self, namespace: str, key: str) -> Optional[Tuple[str, float, bool]]:
+        """(etag, stored_at, stale) for an entry, without loading its value"""
+        with self._lock:
+            self._stats["reads"] += 1
+            row = self._conn.execute(
+                "SELECT etag, stored_at, stale FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else None
+
+    def load(self, namespace: str, key: str) -> Optional[Tuple[str, Any, float, bool]]:
+        """(etag, value, stored_at, stale) for an entry, or None"""
+        with self._lock:
+            self._stats["loads"] += 1
+            row = self._conn.execute(
+                "SELECT etag, payload, stored_at, stale FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if not row:
+            return None
+        return row[0], pickle.loads(zlib.decompress(row[1])), row[2], bool(row[3])
+
+    def put(self, namespace: str, key: str, value: Any, stored_at: Optional[float] = None) -> str:
+        """Write an entry and return its new etag"""
+        payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        etag = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO entries (namespace, key, etag, payload, size, stored_at, stale)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                """,
+                (namespace, key, etag, payload, len(payload), stored_at or time.time())
+            )
+            self._stats["writes"] += 1
+            if self._stats["writes"] % 50 == 0:
+                self._evict_to_budget()
+        return etag
+
+    def touch(self, namespace: str, key: str) -> bool:
+        """Mark an entry fresh again (stored now, not stale)"""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE entries SET stored_at = ?, stale = 0 WHERE namespace = ? AND key = ?",
+                (time.time(), namespace, key)
+            ).rowcount > 0
+
+    def mark_stale(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE entries SET stale = 1 WHERE namespace = ? AND key = ?", (namespace, key)
+            ).rowcount > 0
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).rowcount > 0
+
+    def clear(self, namespace: str) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,)).rowcount
+
+    def prune(self, namespace: str, ttl_seconds: float) -> int:
+        """Delete a namespace's entries older than its TTL"""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND stored_at < ?", (namespace, time.time() - ttl_seconds)
+            ).rowcount
+
+    def _evict_to_budget(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Oldest writes go first
+        for namespace, key, size in self._conn.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY stored_at"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            total -= size
+            self._stats["evictions"] += 1
+
+    # ------------------------------------------------------------------
+    # Locks
+    # ------------------------------------------------------------------
+
+    def lock(self, name: str) -> ProcessLock:
+        return ProcessLock(self, name)
+
+    def _try_lock(self, name: str, owner: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+                if row and row[0] != owner and row[1] > now:
+                    self._stats["lock_retries"] += 1
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, owner, now + self.lock_lease_seconds)
+                )
+                return True
+            finally:
+                self._conn.execute("COMMIT")
+
+    def _renew_lock(self, name: str, owner: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE locks SET expires_at = ? WHERE name = ? AND owner = ? AND expires_at > ?",
+                (time.time() + self.lock_lease_seconds, name, owner, time.time())
+            ).rowcount > 0
+
+    def _unlock(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            held = self._conn.execute("SELECT COUNT(*) FROM locks WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {
+            **self._stats,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "locks_held": held,
+            "path": str(self.db_path)
+        }
@@ -0,0 +1,83 @@
+"""
+Single-Flight Call Deduplication
+================================
+
+Collapses concurrent calls for the same key into one execution.
+
+The first caller for a key runs the function; every caller that arrives
+while that call is still in flight blocks and receives the same result
+(or the same exception). Used around LLM generations, which are requested
+concurrently by the GDT watcher, the sidecar poll, cache misses on the
+summary endpoint and the preload thread.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Thread-based single-flight group with per-namespace statistics
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn once for all concurrent callers using the same key"""
+        namespace = key.split(":", 1)[0]
+
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {"executions": 0, "deduplicated": 0})
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                stats["deduplicated"] += 1
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            print(f"🔗 Joined in-flight generation for {key[:48]}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_namespace = {name: dict(values) for name, values in self._stats.items()}
+            return {
+                "in_flight": len(self._calls),
+                "executions": sum(v["executions"] for v in by_namespace.values()),
+                "deduplicated": sum(v["deduplicated"] for v in by_namespace.values()),
+                "by_purpose": by_namespace
+            }
@@ -0,0 +1,140 @@
+"""
+Structured Output Validation
+============================
+
+Strict JSON-schema responses for LLM calls, validated locally.
+
+SchemaValidator compiles a schema (the subset the backend uses: object,
+array, string, integer, number, boolean, null, properties, required,
+additionalProperties, items, enum) once into nested checks, so validating
+each response is a cheap tree walk. strict_response_format() converts a
+schema into the provider's strict structured-output form, where every
+object is closed and every property is required (optional ones become
+nullable).
+"""
+
+import copy
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None
+}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a response is not valid JSON for its schema"""
+
+    def __init__(self, message: str, errors: Optional[List[str]] = None, raw: str = ""):
+        super().__init__(message)
+        self.errors = errors or []
+        self.raw = raw
+
+
+def _compile(schema: Dict[str, Any]) -> Callable[[Any, str, List[str]], None]:
+    types = schema.get("type")
+    type_names = types if isinstance(types, list) else ([types] if types else [])
+    enum = schema.get("enum")
+    properties = {name: _compile(sub) for name, sub in (schema.get("properties") or {}).items()}
+    required = schema.get("required") or []
+    closed = schema.get("additionalProperties") is False
+    items = _compile(schema["items"]) if "items" in schema else None
+
+    def check(value: Any, path: str, errors: List[str]) -> None:
+        if type_names and not any(_TYPE_CHECKS[name](value) for name in type_names):
+            errors.append(f"{path}: expected {'/'.join(type_names)}, got {type(value).__name__}")
+            return
+        if enum is not None and value not in enum:
+            errors.append(f"{path}: {value!r} not in {enum}")
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: missing required property '{name}'")
+            for name, item in value.items():
+                if item is None and name not in required:
+                    # Strict mode returns null for optional properties
+                    continue
+                if name in properties:
+                    properties[name](item, f"{path}.{name}", errors)
+                elif closed:
+                    errors.append(f"{path}: unexpected property '{name}'")
+        elif isinstance(value, list) and items is not None:
+            for index, item in enumerate(value):
+                items(item, f"{path}[{index}]", errors)
+
+    return check
+
+
+class SchemaValidator:
+    """
+    Precompiled validator for one named response schema
+    """
+
+    def __init__(self, named_schema: Dict[str, Any]):
+        self.name = named_schema["name"]
+        self.schema = named_schema["schema"]
+        self._check = _compile(self.schema)
+
+    def errors(self, document: Any) -> List[str]:
+        errors: List[str] = []
+        self._check(document, "$", errors)
+        return errors
+
+    def parse(self, raw: str) -> Dict[str, Any]:
+        """Parse and validate raw model output (raises StructuredOutputError)"""
+        try:
+            document = json.loads(raw)
+        except (TypeError, json.JSONDecodeError) as e:
+            raise StructuredOutputError(f"{self.name}: response is not valid JSON ({e})", [str(e)], raw or "")
+
+        errors = self.errors(document)
+        if errors:
+            raise StructuredOutputError(f"{self.name}: {len(errors)} schema violations", errors, raw)
+        return document
+
+
+def _strict(schema: Dict[str, Any]) -> Dict[str, Any]:
+    if "items" in schema:
+        schema["items"] = _strict(schema["items"])
+    if "properties" in schema:
+        required = set(schema.get("required") or [])
+        for name, sub in schema["properties"].items():
+            sub = _strict(sub)
+            if name not in required and "type" in sub:
+                types = sub["type"] if isinstance(sub["type"], list) else [sub["type"]]
+                sub["type"] = types + (["null"] if "null" not in types else [])
+            schema["properties"][name] = sub
+        schema["required"] = list(schema["properties"])
+        schema["additionalProperties"] = False
+    return schema
+
+
+def strict_response_format(named_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """response_format for strict structured outputs (closed objects, all properties required)"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": named_schema["name"],
+            "schema": _strict(copy.deepcopy(named_schema["schema"])),
+            "strict": True
+        }
+    }
+
+
+def repair_messages(messages: List[Dict[str, Any]], error: StructuredOutputError) -> List[Dict[str, Any]]:
+    """Conversation for the single repair attempt after an invalid response"""
+    problems = "\n".join(f"- {problem}" for problem in error.errors[:20]) or f"- {error}"
+    return messages + [
+        {"role": "assistant", "content": error.raw},
+        {"role": "user", "content": (
+            "Your previous response did not match the required JSON schema:\n"
+            f"{problems}\n"
+            "Return the complete corrected JSON object only."
+        )}
+    ]
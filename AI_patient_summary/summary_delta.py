@@ -0,0 +1,153 @@
+"""
+Incremental (Delta) Summarization
+=================================
+
+Tracks which source records a stored summary was generated from, so a
+regeneration can send the prior summary plus only the new or changed
+records instead of the whole history.
+
+A summary state is a plain dict persisted in the summary store:
+    {"summary": {...}, "records": {record_id: content_hash},
+     "dates": {record_id: iso_date}, "delta_count": n}
+
+plan_update() decides between a delta update and a full regeneration
+(no prior state, too many consecutive deltas, too much of the record set
+changed at once, or records the prior summary covered were deleted - a
+delta can add to a summary but not take facts out of it).
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from prompt_budget import parse_entry_date
+from summary_mapreduce import HISTORY_DATE_FIELDS
+
+# Patient bundle section -> record id prefix
+RECORD_SECTIONS = {
+    'visits': 'visit',
+    'prescriptions': 'prescription',
+    'lab_orders': 'lab',
+    'radiology_orders': 'radiology'
+}
+
+
+def _record_hash(record: Dict[str, Any]) -> str:
+    serialized = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+def collect_source_records(patient_data: Dict[str, Any]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """Map record id -> (content hash, record) for every record in a patient bundle"""
+    records: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+    patient = patient_data.get('patient') or {}
+    if patient:
+        records[f"patient:{patient.get('id', '')}"] = (_record_hash(patient), patient)
+
+    for section, prefix in RECORD_SECTIONS.items():
+        for record in patient_data.get(section) or []:
+            content_hash = _record_hash(record)
+            # Rows without a primary key are identified by their content
+            record_id = f"{prefix}:{record.get('id', content_hash)}"
+            records[record_id] = (content_hash, record)
+
+    return records
+
+
+def record_hashes(records: Dict[str, Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+    return {record_id: content_hash for record_id, (content_hash, _) in records.items()}
+
+
+def record_dates(records: Dict[str, Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+    """Map record id -> ISO date for records of the dated history sections"""
+    fields = {prefix: HISTORY_DATE_FIELDS[section] for section, prefix in RECORD_SECTIONS.items()}
+    dates: Dict[str, str] = {}
+    for record_id, (_, record) in records.items():
+        field = fields.get(record_id.partition(":")[0])
+        when = parse_entry_date(record.get(field)) if field else None
+        if when:
+            dates[record_id] = when.isoformat()
+    return dates
+
+
+def removed_records(previous: Dict[str, str], records: Dict[str, Tuple[str, Dict[str, Any]]],
+                    previous_dates: Optional[Dict[str, str]] = None) -> List[str]:
+    """Previously summarized record ids that are gone from the current bundle.
+
+    Sections are fetched newest first up to a row limit, so a row dated before
+    the oldest one still fetched in its section aged out of the fetch window
+    and is not counted - the summary still covers it. Rows without a known
+    date count as removed.
+    """
+    window_start: Dict[str, str] = {}
+    for record_id, when in record_dates(records).items():
+        prefix = record_id.partition(":")[0]
+        window_start[prefix] = min(window_start.get(prefix, when), when)
+
+    previous_dates = previous_dates or {}
+    removed = []
+    for record_id in previous:
+        if record_id in records:
+            continue
+        prefix = record_id.partition(":")[0]
+        when = previous_dates.get(record_id)
+        if when and prefix in window_start and when < window_start[prefix]:
+            continue
+        removed.append(record_id)
+    return removed
+
+
+def plan_update(state: Dict[str, Any], records: Dict[str, Tuple[str, Dict[str, Any]]],
+                max_deltas: int, max_change_ratio: float) -> Dict[str, Any]:
+    """
+    Return {"mode": "unchanged" | "delta" | "full", "changed": [...], "reason": str}
+    """
+    if not state or "error" in (state.get("summary") or {"error": True}):
+        return {"mode": "full", "changed": [], "reason": "no prior summary"}
+
+    previous = state.get("records") or {}
+    changed = [record_id for record_id, (content_hash, _) in records.items()
+               if previous.get(record_id) != content_hash]
+
+    removed = removed_records(previous, records, state.get("dates"))
+    if removed:
+        return {"mode": "full", "changed": changed, "reason": f"{len(removed)} records removed"}
+
+    if not changed:
+        return {"mode": "unchanged", "changed": [], "reason": "no new or changed records"}
+
+    if state.get("delta_count", 0) >= max_deltas:
+        return {"mode": "full", "changed": changed, "reason": f"{max_deltas} deltas since last full summary"}
+
+    ratio = len(changed) / max(len(records), 1)
+    if ratio > max_change_ratio:
+        return {"mode": "full", "changed": changed, "reason": f"{ratio:.0%} of records changed"}
+
+    return {"mode": "delta", "changed": changed, "reason": f"{len(changed)} new or changed records"}
+
+
+def build_delta_prompt(prior_summary: Dict[str, Any], records: Dict[str, Tuple[str, Dict[str, Any]]],
+                       changed: List[str]) -> str:
+    """Prompt asking the model to update the prior summary with the changed records only"""
+    lines = [
+        "INCREMENTAL UPDATE OF AN EXISTING PATIENT SUMMARY",
+        "",
+        "PRIOR SUMMARY (JSON, generated from the earlier record set):",
+        json.dumps(prior_summary, ensure_ascii=False, default=str),
+        "",
+        f"NEW OR CHANGED RECORDS SINCE THE PRIOR SUMMARY ({len(changed)}):"
+    ]
+    for record_id in changed:
+        _, record = records[record_id]
+        compact = {key: value for key, value in record.items() if value not in (None, "")}
+        lines.append(f"   [{record_id}] {json.dumps(compact, ensure_ascii=False, default=str)}")
+
+    lines.extend([
+        "",
+        "INSTRUCTION: Return the complete updated summary in the same JSON structure. "
+        "Keep prior content that is still valid, integrate the new records (trends, red flags, "
+        "medication changes, action plan), replace anything a changed record supersedes, "
+        "and extend the citations for the new records."
+    ])
+    return "\n".join(lines)
@@ -0,0 +1,209 @@
+"""
+Hierarchical (Map-Reduce) Summarization
+=======================================
+
+Long patient histories are split into fixed time windows. Each window is
+summarized independently into a compact intermediate JSON (map), the
+window summaries are cached, and a final reduce call turns them plus the
+recent detailed records into the regular patient summary schema.
+
+Window boundaries are aligned to a fixed epoch, so a window that lies in
+the past always produces the same prompt and is served from the cache;
+only the current window is re-summarized as new records arrive.
+"""
+
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from prompt_budget import estimate_tokens, parse_entry_date
+
+_EPOCH = date(1970, 1, 1)
+
+# Patient bundle section -> field holding the record's date
+HISTORY_DATE_FIELDS = {
+    'visits': 'visit_date',
+    'prescriptions': 'created_at',
+    'lab_orders': 'ordered_at',
+    'radiology_orders': 'ordered_at'
+}
+
+WINDOW_SUMMARY_SYSTEM_PROMPT = """
+You are condensing one time period of a patient's medical record for a later consolidated clinical summary.
+Only use the records given. Be terse, keep exact values, dates and drug names.
+
+Return JSON ONLY with exactly these keys:
+{
+  "period": "YYYY-MM-DD to YYYY-MM-DD",
+  "diagnoses": ["Diagnosis (first seen YYYY-MM-DD)"],
+  "medication_changes": ["Started/Stopped/Adjusted: Drug dose (reason) YYYY-MM-DD"],
+  "lab_highlights": [{"metric": "HbA1c", "date": "YYYY-MM-DD", "value": "8.2%", "abnormal": true}],
+  "vitals_highlights": [{"metric": "Blood Pressure", "date": "YYYY-MM-DD", "value": "145/90"}],
+  "key_events": ["Hospitalisation, procedures, imaging findings, complications"],
+  "citations": [{"visit_date": "YYYY-MM-DD", "doctor_name": "Dr. X", "diagnosis": "...", "treatment_plan": "..."}]
+}
+"""
+
+WINDOW_SUMMARY_JSON_SCHEMA = {
+    "name": "window_summary",
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "period": {"type": "string"},
+            "diagnoses": {"type": "array", "items": {"type": "string"}},
+            "medication_changes": {"type": "array", "items": {"type": "string"}},
+            "lab_highlights": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "metric": {"type": "string"},
+                        "date": {"type": "string"},
+                        "value": {"type": "string"},
+                        "abnormal": {"type": "boolean"}
+                    },
+                    "required": ["metric", "date", "value"]
+                }
+            },
+            "vitals_highlights": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "metric": {"type": "string"},
+                        "date": {"type": "string"},
+                        "value": {"type": "string"}
+                    },
+                    "required": ["metric", "date", "value"]
+                }
+            },
+            "key_events": {"type": "array", "items": {"type": "string"}},
+            "citations": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "visit_date": {"type": "string"},
+                        "doctor_name": {"type": "string"},
+                        "diagnosis": {"type": "string"},
+                        "treatment_plan": {"type": "string"}
+                    },
+                    "required": ["visit_date"]
+                }
+            }
+        },
+        "required": ["period", "diagnoses", "medication_changes", "lab_highlights",
+                     "vitals_highlights", "key_events", "citations"]
+    }
+}
+
+
+def _window_index(day: date, window_days: int) -> int:
+    return (day - _EPOCH).days // window_days
+
+
+def history_span_windows(patient_data: Dict[str, Any], window_days: int) -> int:
+    """Number of distinct time windows the dated records fall into"""
+    indexes = set()
+    for section, field in HISTORY_DATE_FIELDS.items():
+        for record in patient_data.get(section) or []:
+            when = parse_entry_date(record.get(field))
+            if when:
+                indexes.add(_window_index(when.date(), window_days))
+    return len(indexes)
+
+
+def needs_hierarchical_summary(patient_data: Dict[str, Any], token_budget: int, window_days: int) -> bool:
+    """True when the raw history exceeds the prompt budget and spans several windows"""
+    history_tokens = sum(
+        estimate_tokens(json.dumps(record, default=str))
+        for section in HISTORY_DATE_FIELDS
+        for record in patient_data.get(section) or []
+    )
+    return history_tokens > token_budget and history_span_windows(patient_data, window_days) > 1
+
+
+def partition_history(patient_data: Dict[str, Any], window_days: int) -> List[Dict[str, Any]]:
+    """Split the dated history into aligned windows, oldest first"""
+    windows: Dict[int, Dict[str, Any]] = {}
+    latest_index: Optional[int] = None
+    undated: Dict[str, List[Dict[str, Any]]] = {}
+
+    for section, field in HISTORY_DATE_FIELDS.items():
+        for record in patient_data.get(section) or []:
+            when = parse_entry_date(record.get(field))
+            if not when:
+                undated.setdefault(section, []).append(record)
+                continue
+            index = _window_index(when.date(), window_days)
+            latest_index = index if latest_index is None else max(latest_index, index)
+            window = windows.setdefault(index, {section_name: [] for section_name in HISTORY_DATE_FIELDS})
+            window[section].append(record)
+
+    # Undated records are attributed to the most recent window
+    if undated:
+        index = latest_index if latest_index is not None else _window_index(date.today(), window_days)
+        window = windows.setdefault(index, {section_name: [] for section_name in HISTORY_DATE_FIELDS})
+        for section, records in undated.items():
+            window[section].extend(records)
+
+    result = []
+    for index in sorted(windows):
+        start = _EPOCH + timedelta(days=index * window_days)
+        window = windows[index]
+        for section, field in HISTORY_DATE_FIELDS.items():
+            window[section].sort(key=lambda record: str(record.get(field) or ''))
+        result.append({'start': start, 'end': start + timedelta(days=window_days - 1), **window})
+    return result
+
+
+def format_window_prompt(window: Dict[str, Any]) -> str:
+    """Stable, chronological text for one window (identical input -> identical prompt)"""
+    lines = [f"PERIOD: {window['start'].isoformat()} to {window['end'].isoformat()}", ""]
+
+    if window['visits']:
+        lines.append("VISITS:")
+        for visit in window['visits']:
+            lines.append(
+                f"   [{visit.get('visit_date')}] Reason: {visit.get('reason_for_visit') or visit.get('chief_complaint') or 'N/A'}"
+                f" | Dx: {visit.get('diagnosis') or 'N/A'} | Plan: {visit.get('treatment_plan') or 'N/A'}"
+                f" | Doctor: {visit.get('doctor_name') or visit.get('doctor_id') or 'N/A'}"
+            )
+            if visit.get('vitals_json'):
+                lines.append(f"   > Vitals: {visit.get('vitals_json')}")
+
+    if window['prescriptions']:
+        lines.append("MEDICATIONS:")
+        for rx in window['prescriptions']:
+            lines.append(f"   [{rx.get('created_at')}] {rx.get('medication_name')} {rx.get('dosage', '')} {rx.get('frequency', '')}")
+
+    if window['lab_orders']:
+        lines.append("LAB RESULTS:")
+        for lab in window['lab_orders']:
+            lines.append(f"   [{lab.get('ordered_at')}] {lab.get('test_name')}: {lab.get('result', 'Pending')}")
+
+    if window['radiology_orders']:
+        lines.append("RADIOLOGY:")
+        for rad in window['radiology_orders']:
+            lines.append(f"   [{rad.get('ordered_at')}] {rad.get('test_name')}: {rad.get('result', 'Pending')}")
+
+    return "\n".join(lines)
+
+
+def build_reduce_prompt(recent_prompt: str, windows: List[Dict[str, Any]],
+                        window_summaries: List[Dict[str, Any]]) -> str:
+    """Condensed earlier history (stable, oldest first) followed by the recent detailed records"""
+    lines = [
+        "LONGITUDINAL HISTORY BY PERIOD (oldest first)",
+        "   Condensed summaries of the full record. Use them for disease duration, long-term trends",
+        "   and medication history; cite the visit dates they reference."
+    ]
+    for window, summary in zip(windows, window_summaries):
+        lines.append(f"   --- {window['start'].isoformat()} to {window['end'].isoformat()} ---")
+        lines.append(f"   {json.dumps(summary, ensure_ascii=False, default=str)}")
+    # After the periods, so a newly opened window does not change the prefix
+    lines.append(f"   ({len(windows)} periods)")
+    lines.append("")
+    lines.append(recent_prompt.strip())
+    return "\n".join(lines) + "\n"
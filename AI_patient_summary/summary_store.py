@@ -0,0 +1,157 @@
+"""
+Persistent Summary Store
+========================
+
+Disk-backed, content-addressed store for generated AI output.
+
+Entries are keyed by a hash of the exact prompt text, the model/deployment
+name and the system-prompt version, so identical inputs are only ever sent
+to the LLM once - even across restarts of the sidecar backend. A small
+in-memory LRU sits in front of the SQLite file and the file itself is
+bounded by size (least recently used entries are evicted first).
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def make_content_key(prompt: str, model: Optional[str], prompt_version: str, purpose: str = "summary") -> str:
+    """Build the content address for a generation request"""
+    digest = hashlib.sha256()
+    for part in (purpose, model or "", prompt_version, prompt or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SummaryStore:
+    """
+    SQLite-backed summary store with an in-memory LRU in front
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int = 200 * 1024 * 1024, memory_entries: int = 256):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                purpose TEXT,
+                model TEXT,
+                prompt_version TEXT,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_last_access ON summaries(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str, use_memory: bool = True) -> Optional[Dict[str, Any]]:
+        """Return the stored value for a key, or None (use_memory=False for keys other processes may rewrite)"""
+        with self._lock:
+            if use_memory and key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._memory[key]
+
+            row = self._conn.execute("SELECT payload FROM summaries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE summaries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            value = json.loads(row[0])
+            self._remember(key, value)
+            self._stats["disk_hits"] += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any], purpose: str = "summary",
+            model: Optional[str] = None, prompt_version: str = "") -> None:
+        """Persist a value and evict old entries if the store grows past its budget"""
+        payload = json.dumps(value, default=str, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO summaries
+                    (key, purpose, model, prompt_version, payload, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, purpose, model, prompt_version, payload, len(payload), now, now)
+            )
+            self._conn.commit()
+            self._remember(key, value)
+            self._stats["writes"] += 1
+            self._evict_to_budget()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+            self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> int:
+        """Remove every stored entry and return how many were dropped"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            self._conn.execute("DELETE FROM summaries")
+            self._conn.commit()
+            self._memory.clear()
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries"
+            ).fetchone()
+            return {
+                **self._stats,
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+                "memory_entries": len(self._memory),
+                "path": str(self.db_path)
+            }
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_to_budget(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        overflow = total - self.max_bytes
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM summaries ORDER BY last_access ASC"):
+            if overflow <= 0:
+                break
+            evicted.append(key)
+            overflow -= size
+
+        self._conn.executemany("DELETE FROM summaries WHERE key = ?", [(key,) for key in evicted])
+        self._conn.commit()
+        for key in evicted:
+            self._memory.pop(key, None)
+        self._stats["evictions"] += len(evicted)
@@ -0,0 +1,84 @@
+"""
+Test fixtures: the backend on the fake LLM provider, with patient data served
+from memory instead of MySQL. LLM calls are counted through fake_engine.stats.
+"""
+
+import copy
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="ai_summary_tests_")
+os.environ.update({
+    "AI_PROVIDER": "fake",
+    "FAKE_LLM_LATENCY": "fixed:5",
+    "FAKE_LLM_TOKENS_PER_SECOND": "100000",
+    "SUMMARY_STORE_PATH": os.path.join(_tmp, "summaries.db"),
+    "LLM_TELEMETRY_PATH": os.path.join(_tmp, "telemetry.sqlite3"),
+    "CACHE_SNAPSHOT": "0",
+    "CACHE_SNAPSHOT_PATH": os.path.join(_tmp, "cache_snapshot.bin"),
+    "SKIP_PRELOAD": "1",
+    # Injected failures fail fast, and the admission buckets never throttle the suite
+    "LLM_MAX_RETRIES": "0",
+    "LLM_REQUESTS_PER_MINUTE": "100000",
+    "LLM_TOKENS_PER_MINUTE": "100000000",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402
+
+
+def make_patient(patient_id: int = 7) -> dict:
+    return {
+        'patient': {
+            'id': patient_id, 'first_name': 'Anna', 'last_name': 'Becker', 'date_of_birth': '1958-03-14',
+            'chronic_conditions': '["Type 2 diabetes", "Hypertension"]', 'medications': '["Metformin", "Ramipril"]'
+        },
+        'visits': [
+            {'id': 1, 'visit_date': backend.datetime(2025, 1, 10), 'chief_complaint': 'Follow-up',
+             'diagnosis': 'Type 2 diabetes', 'notes': 'HbA1c improving'}
+        ],
+        'prescriptions': [
+            {'id': 1, 'medication_name': 'Metformin', 'dosage': '1000 mg', 'frequency': 'twice daily'}
+        ],
+        'lab_orders': [
+            {'id': 1, 'test_name': 'HbA1c', 'result': '7.1 %', 'ordered_at': backend.datetime(2025, 1, 10)}
+        ],
+        'radiology_orders': []
+    }
+
+
+@pytest.fixture
+def patients(monkeypatch):
+    """Patient bundles by id; tests edit them to simulate changed data"""
+    data = {7: make_patient(7)}
+    monkeypatch.setattr(backend, "get_comprehensive_patient_data",
+                        lambda patient_id, **kwargs: copy.deepcopy(data.get(int(patient_id))))
+    return data
+
+
+@pytest.fixture
+def llm():
+    """The fake provider's engine: stats["requests"] counts LLM calls"""
+    engine = backend.fake_engine
+    config = dict(vars(engine.config))
+    yield engine
+    vars(engine.config).update(config)
+    # Injected failures may have opened the circuit breakers
+    for provider in backend.llm_providers:
+        provider.breaker.record_success()
+
+
+@pytest.fixture(autouse=True)
+def clean_caches():
+    backend.clear_all_cache(include_store=True)
+    yield
+
+
+@pytest.fixture
+def client(patients):
+    from fastapi.testclient import TestClient
+    with TestClient(backend.app) as test_client:
+        yield test_client
@@ -0,0 +1,42 @@
+"""BDT prompt formatting: visit cap without a budget and lab prioritisation by flag."""
+
+from bdt_parser import BDTParser
+
+
+def bdt_patient(visits=8, labs=()):
+    return {
+        'demographics': {'first_name': 'Hans', 'last_name': 'Müller', 'date_of_birth': '1955-06-02'},
+        'lab_results': list(labs),
+        'visits': [{'date': f"2025-01-{day:02d}", 'chief_complaint': f"complaint {day}"} for day in range(1, visits + 1)]
+    }
+
+
+def test_unbudgeted_format_keeps_the_last_five_visits():
+    text = BDTParser().format_for_ai(bdt_patient(visits=8))
+
+    assert "Visit #5:" in text
+    assert "Visit #6:" not in text
+
+
+def test_budgeted_format_considers_every_visit():
+    text = BDTParser().format_for_ai(bdt_patient(visits=8), token_budget=100000)
+
+    assert "Visit #8:" in text
+
+
+def test_normal_flag_is_not_prioritised_as_abnormal():
+    labs = [
+        {'test_name': 'Sodium', 'result_value': '139', 'unit': 'mmol/l', 'test_date': '2025-01-01', 'flag': 'N'},
+        {'test_name': 'Potassium', 'result_value': '5.9', 'unit': 'mmol/l', 'test_date': '2025-01-01', 'flag': 'H'},
+    ]
+    parser = BDTParser()
+    patient = bdt_patient(visits=0, labs=labs)
+
+    # Smallest budget that fits any lab line: the flagged result is the one kept
+    for budget in range(50, 400, 5):
+        text = parser.format_for_ai(patient, token_budget=budget)
+        if "Potassium" in text or "Sodium" in text:
+            break
+
+    assert "Potassium" in text
+    assert "Sodium" not in text
@@ -0,0 +1,31 @@
+"""Cache snapshots: entries restored on startup are kept when their fingerprints still match."""
+
+import backend
+
+
+def snapshot_and_clear():
+    backend.cache_snapshotter.save()
+    backend.clear_all_cache()
+
+
+def test_restore_keeps_database_and_bdt_summaries(patients, llm):
+    patients[8] = dict(patients[7], patient=dict(patients[7]['patient'], id=8))
+    backend.generate_and_cache_summary(7)
+    backend.generate_and_cache_summary_from_bdt(8, "Patient: Anna Becker")
+    snapshot_and_clear()
+
+    restored = backend.restore_cache_snapshot()
+
+    assert sorted(restored) == [7, 8]
+    assert backend.ai_summary_cache.peek(8)['source'] == 'bdt'
+
+
+def test_restored_entries_revalidate_without_llm_calls(patients, llm):
+    backend.generate_and_cache_summary_from_bdt(7, "Patient: Anna Becker")
+    snapshot_and_clear()
+    calls = llm.stats["requests"]
+
+    backend.revalidate_restored_patients(backend.restore_cache_snapshot())
+
+    assert llm.stats["requests"] == calls
+    assert not backend.ai_summary_cache.is_stale(7)
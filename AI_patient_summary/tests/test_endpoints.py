@@ -0,0 +1,66 @@
+"""HTTP validators and long-polling on the polled endpoints."""
+
+import threading
+import time
+
+import backend
+
+
+def test_unchanged_summary_answers_304(client, llm):
+    first = client.get("/api/patient/7/summary")
+    etag = first.headers["ETag"]
+    calls = llm.stats["requests"]
+
+    second = client.get("/api/patient/7/summary", headers={"If-None-Match": etag})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == etag
+    assert llm.stats["requests"] == calls
+
+
+def test_changed_summary_gets_a_new_etag(client, patients):
+    etag = client.get("/api/patient/7/summary").headers["ETag"]
+
+    patients[7]['visits'].append({'id': 2, 'visit_date': backend.datetime(2025, 3, 1), 'chief_complaint': 'Cough',
+                                  'diagnosis': 'Bronchitis', 'notes': ''})
+    backend.revalidate_summary(7)
+    response = client.get("/api/patient/7/summary", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_current_patient_answers_304(client):
+    etag = client.get("/api/current_patient").headers["ETag"]
+
+    assert client.get("/api/current_patient", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_long_poll_returns_at_once_for_an_old_version(client, monkeypatch):
+    monkeypatch.setattr(backend, "LONG_POLL_TIMEOUT_SECONDS", 5)
+    version = client.get("/api/patient/7/summary").json()["version"]
+
+    started = time.monotonic()
+    response = client.get(f"/api/patient/7/summary?wait_for_version={version - 1}")
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1
+
+
+def test_long_poll_wakes_on_revalidation(client, monkeypatch):
+    monkeypatch.setattr(backend, "LONG_POLL_TIMEOUT_SECONDS", 5)
+    version = client.get("/api/patient/7/summary").json()["version"]
+    backend.ai_summary_cache.mark_stale(7)
+
+    timer = threading.Timer(0.3, backend.revalidate_summary, args=(7,))
+    started = time.monotonic()
+    timer.start()
+    response = client.get(f"/api/patient/7/summary?wait_for_version={version}")
+    elapsed = time.monotonic() - started
+    timer.join()
+
+    assert 0.25 < elapsed < 3
+    assert response.json()["version"] == version
+    assert response.json()["is_stale"] is False
@@ -0,0 +1,60 @@
+"""Failed generations are returned to the caller but never cached."""
+
+import backend
+
+
+def test_failed_summary_is_not_cached(patients, llm):
+    llm.config.error_rate = 1.0
+    entry = backend.generate_and_cache_summary(7)
+
+    assert "error" in entry['summary']
+    assert backend.ai_summary_cache.peek(7) is None
+
+    llm.config.error_rate = 0.0
+    entry = backend.generate_and_cache_summary(7)
+
+    assert "error" not in entry['summary']
+    assert backend.ai_summary_cache.peek(7) is entry
+
+
+def test_failed_regeneration_keeps_the_last_good_summary(patients, llm):
+    good = backend.generate_and_cache_summary(7)
+    llm.config.error_rate = 1.0
+
+    entry = backend.generate_and_cache_summary(7, force=True)
+
+    assert entry is good
+    assert backend.ai_summary_cache.peek(7) is good
+
+
+def test_failed_summary_endpoint_retries_on_the_next_request(client, llm):
+    llm.config.error_rate = 1.0
+    assert "error" in client.get("/api/patient/7/summary").json()["ai_summary"]
+
+    llm.config.error_rate = 0.0
+    response = client.get("/api/patient/7/summary").json()
+
+    assert "error" not in response["ai_summary"]
+    assert response["cached"] is False
+
+
+def test_failed_drug_risk_is_not_cached(client, llm):
+    llm.config.error_rate = 1.0
+    assert "error" in client.get("/api/patient/7/drug_risk_assessment").json()["assessment"]
+    assert backend.drug_risk_cache.peek(7) is None
+
+    llm.config.error_rate = 0.0
+    assert "error" not in client.get("/api/patient/7/drug_risk_assessment").json()["assessment"]
+    assert backend.drug_risk_cache.peek(7) is not None
+
+
+def test_drug_risk_hit_is_checked_against_current_data(client, llm, patients):
+    client.get("/api/patient/7/drug_risk_assessment")
+    calls = llm.stats["requests"]
+
+    client.get("/api/patient/7/drug_risk_assessment")
+    assert llm.stats["requests"] == calls
+
+    patients[7]['patient']['medications'] = '["Metformin", "Ramipril", "Spironolactone"]'
+    client.get("/api/patient/7/drug_risk_assessment")
+    assert llm.stats["requests"] == calls + 1
@@ -0,0 +1,22 @@
+"""Slow subscribers are ended cleanly instead of blocking publishers."""
+
+import asyncio
+
+from event_bus import EventBus
+
+
+def test_overflowing_subscriber_gets_only_the_end_marker():
+    async def run():
+        bus = EventBus(max_pending=2)
+        subscription, _ = bus.subscribe()
+        for index in range(3):
+            bus.publish("summary_ready", {"patient_id": index})
+        await asyncio.sleep(0.01)
+
+        item = subscription.queue.get_nowait()
+        return subscription, item
+
+    subscription, item = asyncio.run(run())
+    assert item is None
+    assert subscription.overflowed
+    assert subscription.queue.empty()
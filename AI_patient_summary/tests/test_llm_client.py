@@ -0,0 +1,75 @@
+"""Admission control: shared concurrency slots and slot accounting on cancellation."""
+
+import asyncio
+import queue
+
+from fake_llm import FakeAsyncOpenAI, FakeLLMConfig, FakeLLMEngine
+from llm_client import AsyncLLMClient, ConcurrencySlots
+
+
+class CountingClient:
+    """Async client stand-in that records how many calls run at once (across instances)"""
+
+    running = 0
+    peak = 0
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        CountingClient.running += 1
+        CountingClient.peak = max(CountingClient.peak, CountingClient.running)
+        await asyncio.sleep(0.02)
+        CountingClient.running -= 1
+        return None
+
+
+def test_shared_slots_cap_concurrency_across_providers():
+    async def run():
+        slots = ConcurrencySlots(2)
+        primary = AsyncLLMClient(CountingClient(), slots=slots)
+        fallback = AsyncLLMClient(CountingClient(), slots=slots)
+        messages = [{"role": "user", "content": "hi"}]
+        await asyncio.gather(*[client.create(model="m", messages=messages)
+                               for client in [primary, fallback] * 4])
+        return slots
+
+    CountingClient.peak = 0
+    slots = asyncio.run(run())
+
+    assert CountingClient.peak == 2
+    assert slots.active == 0
+
+
+def test_cancel_right_after_admission_returns_the_slot():
+    async def run():
+        client = AsyncLLMClient(object(), max_concurrency=1)
+        task = asyncio.create_task(client._admit("m", 10, 0))
+        while client.slots.active == 0:
+            await asyncio.sleep(0)
+        # Slot granted, caller not resumed yet
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return client.slots.active
+
+    assert asyncio.run(run()) == 0
+
+
+def test_stream_releases_its_slot():
+    async def run():
+        engine = FakeLLMEngine(FakeLLMConfig(latency="fixed:1", tokens_per_second=100000))
+        client = AsyncLLMClient(FakeAsyncOpenAI(engine), max_concurrency=1)
+        sink = queue.Queue()
+        await client.stream(sink, model="m", messages=[{"role": "user", "content": "hi"}])
+        return client.slots.active, sink
+
+    active, sink = asyncio.run(run())
+    items = []
+    while (item := sink.get()) is not None:
+        items.append(item)
+    assert active == 0
+    assert items and not isinstance(items[-1], Exception)
@@ -0,0 +1,40 @@
+"""Prompt assembly keeps a byte-stable prefix as records are added."""
+
+import copy
+
+import backend
+from prompt_budget import PromptAssembler
+
+
+def history_part(prompt):
+    # Everything before the record-count note and the volatile tail
+    return prompt[:prompt.index("\nRECORD COUNTS:")]
+
+
+def test_new_visit_appends_to_the_prompt(patients):
+    before = backend.format_patient_data_for_ai(patients[7])
+    changed = copy.deepcopy(patients[7])
+    changed['visits'].insert(0, {'id': 2, 'visit_date': backend.datetime(2025, 3, 1), 'chief_complaint': 'Cough',
+                                 'diagnosis': 'Bronchitis', 'notes': ''})
+    after = backend.format_patient_data_for_ai(changed)
+
+    visits_end = before.index("\n3. MEDICATIONS")
+    assert after.startswith(before[:visits_end])
+    assert "Bronchitis" in after[visits_end:after.index("\n3. MEDICATIONS")]
+    assert history_part(after).endswith(history_part(before)[visits_end:])
+
+
+def test_counts_and_omissions_follow_the_sections():
+    assembler = PromptAssembler(60)
+    assembler.pin("HEAD\n")
+    assembler.section('visits', "VISITS\n")
+    assembler.pin_tail("TAIL\n")
+    for index in range(10):
+        assembler.add('visits', f"visit {index} " * 5)
+
+    prompt, report = assembler.assemble()
+
+    assert prompt.startswith("HEAD\nVISITS\nvisit")
+    assert "omitted" not in prompt[:prompt.index("RECORD COUNTS:")]
+    assert f"visits 10 ({report['dropped']['visits']} lower-priority entries omitted)" in prompt
+    assert prompt.endswith("TAIL\n")
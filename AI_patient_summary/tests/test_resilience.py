@@ -0,0 +1,243 @@
+"""Circuit breaker half-open recovery, breaker accounting and single-flight deduplication."""
+
+import asyncio
+import queue
+import threading
+import time
+
+import backend
+from fake_llm import FakeAPIError, FakeAsyncOpenAI, FakeLLMConfig, FakeLLMEngine
+from llm_client import AsyncLLMClient, ConcurrencySlots
+from llm_resilience import CircuitBreaker, ProviderEndpoint, ResilientLLMClient
+from singleflight import SingleFlight
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def fake_provider(max_concurrency=4, max_rate_limit_retries=0, **config):
+    engine = FakeLLMEngine(FakeLLMConfig(**{"latency": "fixed:1", "tokens_per_second": 100000, **config}))
+    client = AsyncLLMClient(FakeAsyncOpenAI(engine), slots=ConcurrencySlots(max_concurrency),
+                            default_limits={"rpm": 100000, "tpm": 100000000},
+                            max_rate_limit_retries=max_rate_limit_retries)
+    return ProviderEndpoint("fake", client, "m", CircuitBreaker(failure_threshold=1, reset_timeout=60))
+
+
+def test_breaker_recovers_through_one_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.acquire(hold_seconds=1)
+
+    time.sleep(0.06)
+    assert breaker.acquire(hold_seconds=1)
+    assert breaker.state == "half_open"
+    # Only one trial at a time
+    assert not breaker.available()
+    assert not breaker.acquire(hold_seconds=1)
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.acquire(hold_seconds=1) and breaker.acquire(hold_seconds=1)
+
+
+def test_failed_trial_reopens_and_released_trial_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.acquire(hold_seconds=1)
+    breaker.release()
+    assert breaker.acquire(hold_seconds=1)
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+
+
+def test_expired_trial_hold_allows_a_new_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+
+    assert breaker.acquire(hold_seconds=0.05)
+    assert not breaker.available()
+    time.sleep(0.06)
+    assert breaker.acquire(hold_seconds=0.05)
+
+
+def test_rate_limits_do_not_open_the_breaker():
+    provider = fake_provider(rate_limit_rate=1.0, retry_after=0.01)
+    resilient = ResilientLLMClient([provider], max_retries=0)
+
+    async def run():
+        try:
+            await resilient.create(model="m", messages=MESSAGES)
+        except FakeAPIError as e:
+            return e.status_code
+
+    assert asyncio.run(run()) == 429
+    assert provider.breaker.state == "closed"
+
+
+def test_rate_limits_are_retried_by_the_admission_client_only():
+    provider = fake_provider(max_rate_limit_retries=2, rate_limit_rate=1.0, retry_after=0.01)
+    engine = provider.client.client.engine
+    resilient = ResilientLLMClient([provider], max_retries=2)
+
+    async def run():
+        try:
+            await resilient.create(model="m", messages=MESSAGES)
+        except FakeAPIError as e:
+            return e.status_code
+
+    assert asyncio.run(run()) == 429
+    assert engine.stats["requests"] == 3
+    assert resilient.stats()["retries"] == 0
+
+
+class RateLimitedOnce:
+    """Async client stand-in: the first request gets a 429, later ones go to the fake provider"""
+
+    def __init__(self, client):
+        self.chat = self
+        self.completions = self
+        self.client = client
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise FakeAPIError("Fake rate limit exceeded", 429, {"retry-after": "0.01"})
+        return await self.client.chat.completions.create(**kwargs)
+
+
+def test_rate_limited_stream_is_requeued_before_the_first_chunk():
+    engine = FakeLLMEngine(FakeLLMConfig(latency="fixed:1", tokens_per_second=100000))
+    client = AsyncLLMClient(RateLimitedOnce(FakeAsyncOpenAI(engine)), max_rate_limit_retries=1)
+
+    async def run():
+        sink = queue.Queue()
+        await client.stream(sink, model="m", messages=MESSAGES)
+        return sink
+
+    sink = asyncio.run(run())
+    items = []
+    while (item := sink.get()) is not None:
+        items.append(item)
+    assert items and not any(isinstance(item, BaseException) for item in items)
+    assert client.stats()["rate_limited"] == 1
+    assert client.slots.active == 0
+
+
+def test_server_errors_open_the_breaker():
+    provider = fake_provider(error_rate=1.0)
+    resilient = ResilientLLMClient([provider], max_retries=0)
+
+    async def run():
+        try:
+            await resilient.create(model="m", messages=MESSAGES)
+        except FakeAPIError as e:
+            return e.status_code
+
+    assert asyncio.run(run()) == 500
+    assert provider.breaker.state == "open"
+
+
+def test_queue_wait_does_not_count_against_the_deadline():
+    # One slot, 100 ms per call: the third call waits ~200 ms for admission, beyond the 150 ms deadline
+    provider = fake_provider(max_concurrency=1, latency="fixed:100")
+    resilient = ResilientLLMClient([provider], deadline=0.15, max_retries=0, hedging=False)
+
+    async def run():
+        return await asyncio.gather(*[resilient.create(model="m", messages=MESSAGES) for _ in range(3)])
+
+    assert len(asyncio.run(run())) == 3
+    assert provider.breaker.state == "closed"
+
+
+def test_queued_stream_gets_its_full_first_token_deadline():
+    provider = fake_provider(max_concurrency=1, latency="fixed:100")
+    resilient = ResilientLLMClient([provider], deadline=5, max_retries=0, first_token_timeout=0.15)
+
+    async def run():
+        sinks = [queue.Queue() for _ in range(3)]
+        await asyncio.gather(*[resilient.stream(sink, model="m", messages=MESSAGES) for sink in sinks])
+        return sinks
+
+    for sink in asyncio.run(run()):
+        items = []
+        while (item := sink.get()) is not None:
+            items.append(item)
+        assert items and not any(isinstance(item, BaseException) for item in items)
+    assert provider.breaker.state == "closed"
+
+
+def test_single_flight_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("summary:7", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["deduplicated"] < 4:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+    assert not flight.in_flight("summary:7")
+
+
+def test_single_flight_shares_the_error_and_then_retries():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(2)
+        raise RuntimeError("provider down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("summary:7", fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["deduplicated"] < 2:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3 and len({id(e) for e in errors}) == 1
+    assert flight.do("summary:7", lambda: "recovered") == "recovered"
+
+
+def test_concurrent_summary_requests_make_one_llm_call(patients, llm):
+    llm.config.latency = "fixed:100"
+    calls = llm.stats["requests"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(backend.generate_and_cache_summary(7)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 4
+    assert all(result == results[0] for result in results)
+    assert llm.stats["requests"] - calls == 1
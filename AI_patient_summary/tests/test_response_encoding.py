@@ -0,0 +1,53 @@
+"""Prepared JSON bodies: the spliced gzip stream must decode to the plain body."""
+
+import gzip
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from response_encoding import PreparedJSON, ResponseEncoder
+
+PAYLOAD = {
+    "patient_id": 7,
+    "ai_summary": {"overview": "Stable type 2 diabetes. " * 80, "red_flags": ["Ödem", "HbA1c 9.1 %"]},
+    "patient_data": {"lab_orders": [{"value": Decimal("5.4"), "ordered_at": datetime(2025, 2, 1)}]},
+}
+
+
+def test_gzip_splice_round_trips_with_and_without_extra_fields():
+    prepared = PreparedJSON(PAYLOAD)
+
+    for extra in (None, {}, {"age_seconds": 12.5, "cached": True, "stale": False}):
+        body = prepared.body(extra)
+        assert gzip.decompress(prepared.gzip_body(extra)) == body
+        assert json.loads(body) == {**json.loads(prepared.body()), **(extra or {})}
+
+
+def test_gzip_splice_of_an_empty_object():
+    prepared = PreparedJSON({})
+
+    assert gzip.decompress(prepared.gzip_body()) == b"{}"
+    assert json.loads(gzip.decompress(prepared.gzip_body({"version": 3}))) == {"version": 3}
+
+
+def test_extra_fields_longer_than_the_deflated_head():
+    prepared = PreparedJSON({"a": 1})
+    extra = {"note": "x" * 5000}
+
+    assert json.loads(gzip.decompress(prepared.gzip_body(extra))) == {"a": 1, **extra}
+
+
+def test_encoder_compresses_only_above_threshold_and_when_accepted():
+    encoder = ResponseEncoder(min_size=256)
+    prepared = encoder.prepare(PAYLOAD)
+    extra = {"age_seconds": 1.0}
+
+    gzipped = encoder.prepared_response(prepared, extra, accept_encoding="gzip, deflate")
+    plain = encoder.prepared_response(prepared, extra, accept_encoding="identity")
+    small = encoder.prepared_response(encoder.prepare({"a": 1}), extra, accept_encoding="gzip")
+
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(gzipped.body) == plain.body == prepared.body(extra)
+    assert "Content-Encoding" not in plain.headers
+    assert "Content-Encoding" not in small.headers
+    assert encoder.stats()["compressed"] == 1
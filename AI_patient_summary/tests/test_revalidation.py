@@ -0,0 +1,50 @@
+"""Summary revalidation: unchanged data is confirmed without calling the LLM."""
+
+import backend
+
+
+BDT_TEXT = "Patient: Anna Becker\nDiagnoses: Type 2 diabetes (E11.9)"
+
+
+def test_unchanged_patient_revalidates_without_llm_calls(patients, llm):
+    entry = backend.generate_and_cache_summary(7)
+    calls = llm.stats["requests"]
+
+    revalidated = backend.revalidate_summary(7)
+
+    assert llm.stats["requests"] == calls
+    assert revalidated is entry
+
+
+def test_changed_patient_is_regenerated(patients, llm):
+    backend.generate_and_cache_summary(7)
+    calls = llm.stats["requests"]
+
+    patients[7]['lab_orders'].append({'id': 2, 'test_name': 'eGFR', 'result': '58', 'ordered_at': backend.datetime(2025, 2, 3)})
+    entry = backend.revalidate_summary(7)
+
+    assert llm.stats["requests"] > calls
+    assert entry['patient_data']['lab_orders'][-1]['test_name'] == 'eGFR'
+
+
+def test_unchanged_bdt_patient_revalidates_without_llm_calls(patients, llm):
+    entry = backend.generate_and_cache_summary_from_bdt(7, BDT_TEXT)
+    calls = llm.stats["requests"]
+
+    revalidated = backend.revalidate_summary(7)
+
+    assert llm.stats["requests"] == calls
+    assert revalidated is entry
+
+
+def test_changed_bdt_patient_keeps_the_bdt_record(patients, llm):
+    backend.generate_and_cache_summary_from_bdt(7, BDT_TEXT)
+    calls = llm.stats["requests"]
+
+    patients[7]['visits'].append({'id': 2, 'visit_date': backend.datetime(2025, 3, 1), 'chief_complaint': 'Cough',
+                                  'diagnosis': 'Bronchitis', 'notes': ''})
+    entry = backend.revalidate_summary(7)
+
+    assert llm.stats["requests"] > calls
+    assert entry['source'] == 'bdt'
+    assert entry['bdt_formatted'] == BDT_TEXT
@@ -0,0 +1,31 @@
+"""Cross-process lease locks in the shared cache store."""
+
+import time
+
+from shared_cache import SharedCacheStore
+
+
+def test_held_lock_is_renewed_past_its_lease(tmp_path):
+    store = SharedCacheStore(tmp_path / "shared.sqlite3", lock_lease_seconds=0.3)
+    holder = store.lock("patient:7")
+    other = store.lock("patient:7")
+
+    assert holder.acquire()
+    time.sleep(0.8)
+    assert not other.acquire(timeout=0.1)
+
+    holder.release()
+    assert other.acquire(timeout=1)
+    other.release()
+
+
+def test_abandoned_lock_expires(tmp_path):
+    store = SharedCacheStore(tmp_path / "shared.sqlite3", lock_lease_seconds=0.3)
+    # A crashed worker: locked, never renewed or released
+    assert store._try_lock("patient:7", "crashed-worker")
+
+    lock = store.lock("patient:7")
+    started = time.monotonic()
+    assert lock.acquire(timeout=2)
+    assert time.monotonic() - started >= 0.2
+    lock.release()
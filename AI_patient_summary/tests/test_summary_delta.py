@@ -0,0 +1,69 @@
+"""Delta planning: which record changes can be merged into the prior summary."""
+
+from datetime import datetime, timedelta
+
+from summary_delta import collect_source_records, plan_update, record_dates, record_hashes
+
+
+def bundle(visit_ids, notes=None, days=None):
+    notes, days = notes or {}, days or {}
+    return {
+        'patient': {'id': 7, 'first_name': 'Anna'},
+        'visits': [{'id': visit_id, 'visit_date': datetime(2025, 1, 1) + timedelta(days=days.get(visit_id, visit_id)),
+                    'notes': notes.get(visit_id, f"visit {visit_id}")} for visit_id in visit_ids]
+    }
+
+
+def state_for(patient_data, delta_count=0):
+    records = collect_source_records(patient_data)
+    return {"summary": {"summary": "prior"}, "records": record_hashes(records), "dates": record_dates(records),
+            "delta_count": delta_count}
+
+
+def plan(state, patient_data):
+    return plan_update(state, collect_source_records(patient_data), max_deltas=5, max_change_ratio=0.5)
+
+
+def test_unchanged_records():
+    data = bundle(range(1, 11))
+    assert plan(state_for(data), data)["mode"] == "unchanged"
+
+
+def test_new_record_is_a_delta():
+    result = plan(state_for(bundle(range(1, 11))), bundle(range(1, 12)))
+    assert result == {"mode": "delta", "changed": ["visit:11"], "reason": "1 new or changed records"}
+
+
+def test_deleted_record_forces_full_rebuild():
+    result = plan(state_for(bundle(range(1, 11))), bundle([1, 2, 3, 5, 6, 7, 8, 9, 10]))
+    assert result["mode"] == "full"
+    assert result["reason"] == "1 records removed"
+
+
+def test_record_aged_out_of_fetch_window_is_not_a_deletion():
+    # Newest ten visits fetched: visit 1 dropped out when visit 11 arrived
+    result = plan(state_for(bundle(range(1, 11))), bundle(range(2, 12)))
+    assert result["mode"] == "delta"
+    assert result["changed"] == ["visit:11"]
+
+
+def test_deleted_low_id_record_is_not_mistaken_for_aged_out():
+    # Visit 0 has the lowest id but a recent date (ids do not follow dates), and was deleted
+    days = {0: 50}
+    before = bundle([0, 1, 2, 3, 4, 5], days=days)
+    result = plan(state_for(before), bundle([1, 2, 3, 4, 5], days=days))
+    assert result["mode"] == "full"
+    assert result["reason"] == "1 records removed"
+
+
+def test_record_dated_before_the_fetch_window_aged_out():
+    # Re-imported with a high id but an old date: dropped from the newest-first fetch, not deleted
+    days = {20: -30}
+    result = plan(state_for(bundle([20, 2, 3, 4, 5], days=days)), bundle([2, 3, 4, 5, 6], days=days))
+    assert result["mode"] == "delta"
+    assert result["changed"] == ["visit:6"]
+
+
+def test_too_many_deltas_forces_full_rebuild():
+    result = plan(state_for(bundle(range(1, 11)), delta_count=5), bundle(range(1, 12)))
+    assert result["mode"] == "full"
@@ -0,0 +1,17 @@
+"""Reduce prompts keep earlier periods as a stable prefix."""
+
+from datetime import date
+
+from summary_mapreduce import build_reduce_prompt
+
+WINDOWS = [{'start': date(2022 + offset, 1, 1), 'end': date(2022 + offset, 12, 31)} for offset in range(3)]
+SUMMARIES = [{'period_summary': f"year {offset}"} for offset in range(3)]
+
+
+def test_new_period_appends_to_the_reduce_prompt():
+    before = build_reduce_prompt("RECENT", WINDOWS[:2], SUMMARIES[:2])
+    after = build_reduce_prompt("RECENT", WINDOWS, SUMMARIES)
+
+    periods_end = before.index("   (2 periods)")
+    assert after.startswith(before[:periods_end])
+    assert "   (3 periods)" in after
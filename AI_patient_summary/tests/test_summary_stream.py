@@ -0,0 +1,134 @@
+"""Streamed summaries share generation with the other summary paths."""
+
+import json
+import threading
+
+import backend
+
+
+def stream_events(client, url):
+    events = []
+    with client.stream("GET", url) as response:
+        name = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                name = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((name, json.loads(line[len("data: "):])))
+    return events
+
+
+def test_stream_sends_sections_then_caches(client, llm, monkeypatch):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+
+    events = stream_events(client, "/api/patient/7/summary/stream")
+
+    assert [name for name, _ in events][-1] == "complete"
+    assert any(name == "section" for name, _ in events)
+    assert backend.ai_summary_cache.peek(7) is not None
+    assert events[-1][1]["cached"] is False
+
+
+def test_concurrent_streams_make_one_llm_call(client, llm, monkeypatch):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+    llm.config.latency = "fixed:300"
+    calls = llm.stats["requests"]
+    results = []
+
+    def request():
+        results.append(stream_events(client, "/api/patient/7/summary/stream"))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert llm.stats["requests"] - calls == 1
+    summaries = [events[-1][1]["ai_summary"] for events in results]
+    assert all(summary == summaries[0] for summary in summaries)
+
+
+def test_streamed_summary_is_the_base_for_delta_updates(client, llm, monkeypatch, patients):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+    stream_events(client, "/api/patient/7/summary/stream")
+
+    state = backend.summary_store.get(backend.summary_state_key(7), use_memory=False)
+    assert state is not None
+    assert backend.plan_update(state, backend.collect_source_records(patients[7]), 5, 0.5)["mode"] == "unchanged"
+
+
+def add_visit(patient_data, visit_id, day):
+    patient_data['visits'].append({'id': visit_id, 'visit_date': backend.datetime(2025, 2, day),
+                                   'chief_complaint': 'Cough', 'diagnosis': 'Bronchitis', 'notes': ''})
+
+
+def test_stream_after_a_new_visit_sends_a_delta_prompt(client, llm, monkeypatch, patients):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+    prompts = []
+    stream = backend.stream_openai_summary
+
+    def recording_stream(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return stream(prompt, *args, **kwargs)
+
+    monkeypatch.setattr(backend, "stream_openai_summary", recording_stream)
+    for visit_id in range(2, 8):
+        add_visit(patients[7], visit_id, visit_id)
+    stream_events(client, "/api/patient/7/summary/stream")
+
+    add_visit(patients[7], 8, 20)
+    # Entry evicted (or the backend restarted) - the saved delta state is all that is left
+    backend.ai_summary_cache.pop(7)
+    events = stream_events(client, "/api/patient/7/summary/stream")
+
+    assert len(prompts) == 2
+    assert not prompts[0].startswith("INCREMENTAL UPDATE")
+    assert prompts[1].startswith("INCREMENTAL UPDATE")
+    assert "[visit:8]" in prompts[1] and "[visit:7]" not in prompts[1]
+    assert events[-1][0] == "complete" and events[-1][1]["cached"] is False
+
+
+def test_stream_with_unchanged_records_reuses_the_summary(client, llm, monkeypatch):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+    first = stream_events(client, "/api/patient/7/summary/stream")
+    backend.ai_summary_cache.pop(7)
+    calls = llm.stats["requests"]
+
+    second = stream_events(client, "/api/patient/7/summary/stream")
+
+    assert llm.stats["requests"] == calls
+    assert second[-1][1]["ai_summary"] == first[-1][1]["ai_summary"]
+
+
+def test_long_history_streams_the_reduce_step(client, llm, monkeypatch, patients):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+    monkeypatch.setattr(backend, "PROMPT_TOKEN_BUDGET", 50)
+    prompts = []
+    stream = backend.stream_openai_summary
+
+    def recording_stream(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return stream(prompt, *args, **kwargs)
+
+    monkeypatch.setattr(backend, "stream_openai_summary", recording_stream)
+    patients[7]['visits'].append({'id': 2, 'visit_date': backend.datetime(2022, 6, 1), 'chief_complaint': 'Dizziness',
+                                  'diagnosis': 'Hypertension', 'notes': 'Ramipril started'})
+
+    events = stream_events(client, "/api/patient/7/summary/stream")
+
+    assert len(prompts) == 1 and "LONGITUDINAL HISTORY BY PERIOD" in prompts[0]
+    assert any(name == "section" for name, _ in events)
+    assert events[-1][0] == "complete" and "error" not in events[-1][1]["ai_summary"]
+
+
+def test_failed_streamed_regeneration_keeps_the_last_good_summary(client, llm, monkeypatch):
+    monkeypatch.setattr(backend, "generate_and_cache_drug_risk", lambda *args: None)
+    good = backend.generate_and_cache_summary(7)
+    llm.config.error_rate = 1.0
+
+    events = stream_events(client, "/api/patient/7/summary/stream?force_refresh=true")
+
+    assert events[-1][0] == "complete"
+    assert events[-1][1]["ai_summary"] == good['summary']
+    assert backend.ai_summary_cache.peek(7) is good
@@ -0,0 +1,70 @@
+"""LLM call telemetry and the model router's per-route metrics."""
+
+import json
+from types import SimpleNamespace
+
+import backend
+from llm_telemetry import LLMTelemetry
+from overnight_scheduler import OpenAIBatchProvider
+
+
+def routed_calls():
+    return sum(route["calls"] for route in backend.model_router.stats()["routes"].values())
+
+
+def test_router_observes_summary_calls_only(patients, llm):
+    calls = routed_calls()
+
+    backend.generate_and_cache_drug_risk(7)
+    assert routed_calls() == calls
+
+    backend.generate_and_cache_summary(7)
+    assert routed_calls() == calls + 1
+
+
+def test_router_observes_streamed_summaries(patients, llm):
+    calls = routed_calls()
+
+    events = list(backend.stream_openai_summary(backend.format_patient_data_for_ai(patients[7])))
+
+    assert events[-1][0] == "complete" and "error" not in events[-1][1]
+    assert routed_calls() == calls + 1
+
+
+def purpose_stats(purpose):
+    return backend.llm_telemetry.stats()["by_purpose"].get(purpose, {"calls": 0, "completion_tokens": 0})
+
+
+def test_streamed_summaries_record_usage(patients, llm):
+    before = purpose_stats("summary_stream")
+
+    list(backend.stream_openai_summary(backend.format_patient_data_for_ai(patients[7])))
+
+    after = purpose_stats("summary_stream")
+    assert after["calls"] == before["calls"] + 1
+    assert after["completion_tokens"] > before["completion_tokens"]
+
+
+def test_batch_results_are_recorded_from_the_result_file(tmp_path):
+    lines = [
+        {"custom_id": "summary:7", "response": {"status_code": 200, "body": {
+            "model": "gpt-4o-mini", "choices": [{"message": {"content": "{}"}}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": 300, "prompt_tokens_details": {"cached_tokens": 1024}}
+        }}},
+        {"custom_id": "summary:8", "response": {"status_code": 500, "body": {"error": {"message": "boom"}}}}
+    ]
+    client = SimpleNamespace(
+        batches=SimpleNamespace(retrieve=lambda batch_id: SimpleNamespace(output_file_id="out", error_file_id=None)),
+        files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text="\n".join(json.dumps(line) for line in lines)))
+    )
+    telemetry = LLMTelemetry(tmp_path / "telemetry.sqlite3")
+    provider = OpenAIBatchProvider(client, telemetry=telemetry)
+
+    results = provider.results("batch_1")
+    provider.results("batch_1")
+
+    assert results["summary:7"]["usage"]["prompt_tokens"] == 1200
+    stats = telemetry.stats()["by_purpose"]["overnight_batch"]
+    assert stats["calls"] == 2
+    assert stats["outcomes"] == {"ok": 1, "error": 1}
+    assert (stats["prompt_tokens"], stats["cached_tokens"], stats["completion_tokens"]) == (1200, 1024, 300)
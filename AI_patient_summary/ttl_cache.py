@@ -0,0 +1,372 @@
+"""
+Bounded In-Memory Cache
+=======================
+
+LRU cache with a memory budget and a time-to-live, for the backend's
+per-patient summary and drug risk entries.
+
+Entry size is approximated by the length of the entry's JSON encoding, so
+the budget covers the patient data bundles stored next to each summary.
+Inserting past the budget evicts least recently used entries; entries older
+than the TTL are treated as misses and dropped. The sidecar runs for weeks
+on small practice PCs, so memory stays flat no matter how many patients
+are opened.
+
+PatientCache wraps it with the one key type every endpoint uses: the
+canonical patient ID plus a fingerprint of the data and prompt an entry
+was generated from, and hands out per-patient locks so concurrent
+producers (GDT watcher, preload, request threads) cannot interleave.
+Entries past the optional soft TTL are stale (serve, then revalidate);
+past the cache TTL (hard) they are gone. Entries can also be marked stale
+when the EHR reports a change. Every write bumps the entry's version so
+clients can tell when a refresh has landed.
+
+With a SharedCacheStore (shared_cache.py) each cache becomes the worker's
+L1 in front of a store shared by all uvicorn workers on the host, and the
+per-patient locks also hold across processes.
+"""
+
+import json
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+def approximate_size(value: Any) -> int:
+    """Approximate in-memory footprint of a cache value (bytes of its JSON encoding, or its own nbytes)"""
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    try:
+        return len(json.dumps(value, default=str, ensure_ascii=False).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class _Entry:
+    __slots__ = ("value", "size", "stored_at", "etag", "marked_stale")
+
+    def __init__(self, value: Any, size: int, age: float = 0.0, etag: Optional[str] = None):
+        self.value = value
+        self.size = size
+        self.stored_at = time.monotonic() - age
+        self.etag = etag
+        self.marked_stale = False
+
+
+class BoundedTTLCache:
+    """
+    Thread-safe LRU + TTL cache bounded by approximate entry size, optionally backed by a shared L2
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: float, shared: Optional[Any] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # SharedCacheStore used by all worker processes; this cache is then the worker's L1
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0, "rejected": 0, "shared_loads": 0}
+        if shared is not None:
+            shared.prune(name, ttl_seconds)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.stored_at >= self.ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _insert(self, key: Hashable, value: Any, age: float = 0.0, etag: Optional[str] = None) -> Optional[_Entry]:
+        # Caller holds self._lock
+        size = approximate_size(value)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            # A single entry larger than the whole budget is not cached at all
+            self._stats["rejected"] += 1
+            return None
+        entry = _Entry(value, size, age, etag)
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+        return entry
+
+    def _sync(self, key: Hashable) -> None:
+        """Bring the L1 entry in line with the shared L2 (another worker may have written, touched or dropped it)"""
+        if self.shared is None:
+            return
+        meta = self.shared.meta(self.name, str(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if meta is None:
+                if entry is not None:
+                    self._remove(key)
+                return
+            etag, stored_at, stale = meta
+            if entry is not None and entry.etag == etag:
+                entry.stored_at = time.monotonic() - (time.time() - stored_at)
+                entry.marked_stale = stale
+                return
+        if time.time() - stored_at >= self.ttl_seconds:
+            return
+
+        loaded = self.shared.load(self.name, str(key))
+        if loaded is None:
+            return
+        etag, value, stored_at, stale = loaded
+        with self._lock:
+            entry = self._insert(key, value, age=time.time() - stored_at, etag=etag)
+            if entry is not None:
+                entry.marked_stale = stale
+            self._stats["shared_loads"] += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Fresh value for a key, or None (expired entries are dropped)"""
+        self._sync(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry.value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Value even if expired, without touching LRU order or stats (last-known-good fallback)"""
+        self._sync(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def age(self, key: Hashable) -> Optional[float]:
+        self._sync(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            return time.monotonic() - entry.stored_at if entry is not None else None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Insert or replace a value, evicting least recently used entries past the budget"""
+        etag = self.shared.put(self.name, str(key), value) if self.shared is not None else None
+        with self._lock:
+            self._insert(key, value, etag=etag)
+
+    def touch(self, key: Hashable) -> bool:
+        """Mark an entry as fresh again (revalidated without changes)"""
+        if self.shared is not None:
+            self.shared.touch(self.name, str(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.stored_at = time.monotonic()
+            entry.marked_stale = False
+            self._entries.move_to_end(key)
+            return True
+
+    def mark_stale(self, key: Hashable) -> bool:
+        """Flag an entry for revalidation (source data changed); False if nothing is cached"""
+        if self.shared is not None:
+            self.shared.mark_stale(self.name, str(key))
+        self._sync(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.marked_stale = True
+            return True
+
+    def is_marked_stale(self, key: Hashable) -> bool:
+        self._sync(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.marked_stale
+
+    def export(self) -> List[Tuple[Hashable, Any, float]]:
+        """Unexpired (key, value, age in seconds) triples, least recently used first (for snapshots)"""
+        with self._lock:
+            return [(key, entry.value, time.monotonic() - entry.stored_at)
+                    for key, entry in self._entries.items() if not self._expired(entry)]
+
+    def restore(self, items: Iterable[Tuple[Hashable, Any, float]]) -> int:
+        """Insert exported triples keeping their ages (LRU order preserved); returns how many were kept"""
+        restored = 0
+        for key, value, age in items:
+            if age >= self.ttl_seconds:
+                continue
+            with self._lock:
+                if key in self._entries or self._insert(key, value, age) is None:
+                    continue
+            restored += 1
+        return restored
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        if self.shared is not None:
+            self.shared.delete(self.name, str(key))
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value = self._entries[key].value
+            self._remove(key)
+            return value
+
+    def clear(self) -> int:
+        """Drop every entry and return how many there were"""
+        shared_count = self.shared.clear(self.name) if self.shared is not None else 0
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            return max(count, shared_count)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "name": self.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "marked_stale": sum(1 for entry in self._entries.values() if entry.marked_stale),
+                "shared": self.shared is not None,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None
+            }
+
+
+def patient_cache_key(patient_id: Any) -> str:
+    """Canonical cache key for a patient ID (int 42, "42" and " 042 " are the same patient)"""
+    text = str(patient_id).strip()
+    return str(int(text)) if text.isdigit() else text.lower()
+
+
+class _PatientLock:
+    """
+    Re-entrant per-patient lock, also held across worker processes when the cache is shared
+    """
+
+    def __init__(self, process_lock: Optional[Any] = None):
+        self._lock = threading.RLock()
+        self._process_lock = process_lock
+        self._depth = 0
+
+    def __enter__(self) -> "_PatientLock":
+        self._lock.acquire()
+        if self._depth == 0 and self._process_lock is not None:
+            try:
+                self._process_lock.acquire()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._depth -= 1
+        if self._depth == 0 and self._process_lock is not None:
+            self._process_lock.release()
+        self._lock.release()
+        return False
+
+
+class PatientCache:
+    """
+    Per-patient view over a BoundedTTLCache, keyed by canonical ID and checked by fingerprint
+    """
+
+    def __init__(self, cache: BoundedTTLCache, soft_ttl_seconds: Optional[float] = None):
+        self.cache = cache
+        self.soft_ttl_seconds = soft_ttl_seconds
+        self._locks_guard = threading.Lock()
+        self._locks: "weakref.WeakValueDictionary[str, Any]" = weakref.WeakValueDictionary()
+        self._fingerprint_mismatches = 0
+
+    def lock(self, patient_id: Any) -> _PatientLock:
+        """Re-entrant lock for one patient's entry (hold it across read-generate-write)"""
+        key = patient_cache_key(patient_id)
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                shared = self.cache.shared
+                lock = _PatientLock(shared.lock(f"{self.cache.name}:{key}") if shared is not None else None)
+                self._locks[key] = lock
+            return lock
+
+    def get(self, patient_id: Any, fingerprint: Optional[str] = None) -> Optional[Any]:
+        """Fresh entry for a patient; with a fingerprint, only if it was built from the same data and prompt"""
+        stored = self.cache.get(patient_cache_key(patient_id))
+        if stored is None:
+            return None
+        if fingerprint is not None and stored[0] != fingerprint:
+            self._fingerprint_mismatches += 1
+            return None
+        return stored[1]
+
+    def peek(self, patient_id: Any) -> Optional[Any]:
+        stored = self.cache.peek(patient_cache_key(patient_id))
+        return stored[1] if stored is not None else None
+
+    def fingerprint(self, patient_id: Any) -> Optional[str]:
+        stored = self.cache.peek(patient_cache_key(patient_id))
+        return stored[0] if stored is not None else None
+
+    def version(self, patient_id: Any) -> Optional[int]:
+        stored = self.cache.peek(patient_cache_key(patient_id))
+        return stored[2] if stored is not None else None
+
+    def is_stale(self, patient_id: Any) -> bool:
+        """Past the soft TTL or marked stale - still served, but due for revalidation"""
+        age = self.age(patient_id)
+        if age is None:
+            return False
+        if self.cache.is_marked_stale(patient_cache_key(patient_id)):
+            return True
+        return self.soft_ttl_seconds is not None and age >= self.soft_ttl_seconds
+
+    def mark_stale(self, patient_id: Any) -> bool:
+        """Flag an entry for revalidation (source data changed); False if nothing is cached"""
+        return self.cache.mark_stale(patient_cache_key(patient_id))
+
+    def set(self, patient_id: Any, fingerprint: str, entry: Any) -> int:
+        """Store an entry and return its new version (increasing, millisecond based so it survives restarts)"""
+        key = patient_cache_key(patient_id)
+        previous = self.cache.peek(key)
+        version = max(int(time.time() * 1000), previous[2] + 1 if previous is not None else 0)
+        self.cache.set(key, (fingerprint, entry, version))
+        return version
+
+    def touch(self, patient_id: Any) -> bool:
+        return self.cache.touch(patient_cache_key(patient_id))
+
+    def pop(self, patient_id: Any) -> Optional[Any]:
+        stored = self.cache.pop(patient_cache_key(patient_id))
+        return stored[1] if stored is not None else None
+
+    def age(self, patient_id: Any) -> Optional[float]:
+        return self.cache.age(patient_cache_key(patient_id))
+
+    def clear(self) -> int:
+        return self.cache.clear()
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "fingerprint_mismatches": self._fingerprint_mismatches}
@@ -0,0 +1,65 @@
+/**
+ * Patient Change Notifier
+ *
+ * Tells the AI summary backend which patients' charts were written to, so
+ * their cached summaries are revalidated within seconds instead of waiting
+ * for the cache to expire. IDs are collected for a short moment and sent as
+ * one batch (POST /api/events/patient_changed). Notification is best effort:
+ * a stopped AI backend never fails an EHR request.
+ */
+
+class PatientChangeNotifier {
+    constructor(options = {}) {
+        // Empty AI_BACKEND_URL disables notifications
+        this.baseUrl = options.baseUrl !== undefined
+            ? options.baseUrl
+            : (process.env.AI_BACKEND_URL ?? 'http://localhost:8001');
+        this.token = options.token || process.env.AI_EVENTS_TOKEN || '';
+        this.batchDelayMs = options.batchDelayMs ?? Number(process.env.AI_EVENTS_BATCH_MS || 500);
+        this.timeoutMs = options.timeoutMs ?? 3000;
+
+        this.pending = new Set();
+        this.timer = null;
+    }
+
+    patientChanged(patientId) {
+        const id = Number(patientId);
+        if (!this.baseUrl || !Number.isInteger(id) || id <= 0) {
+            return;
+        }
+        this.pending.add(id);
+        if (!this.timer) {
+            this.timer = setTimeout(() => this.flush(), this.batchDelayMs);
+        }
+    }
+
+    async flush() {
+        this.timer = null;
+        const patientIds = Array.from(this.pending);
+        this.pending.clear();
+        if (!patientIds.length) {
+            return;
+        }
+
+        const headers = { 'Content-Type': 'application/json' };
+        if (this.token) {
+            headers['X-Events-Token'] = this.token;
+        }
+
+        try {
+            const response = await fetch(`${this.baseUrl.replace(/\/$/, '')}/api/events/patient_changed`, {
+                method: 'POST',
+                headers,
+                body: JSON.stringify({ patient_ids: patientIds, source: 'ehr-backend' }),
+                signal: AbortSignal.timeout(this.timeoutMs)
+            });
+            if (!response.ok) {
+                console.warn(`⚠️  AI backend rejected change notification (HTTP ${response.status})`);
+            }
+        } catch (err) {
+            console.warn(`⚠️  AI backend not notified about patients ${patientIds.join(', ')}: ${err.message}`);
+        }
+    }
+}
+
+module.exports = PatientChangeNotifier;
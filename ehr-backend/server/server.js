@@ -9,9 +9,12 @@ const fs = require('fs');
 const { initializeDatabase, run, get, all } = require('./db');
 const BDTGenerator = require('./bdt-generator');
 const FHIRGenerator = require('./fhir-generator');
+const PatientChangeNotifier = require('./patient-change-notifier');
 
 const bdtGenerator = new BDTGenerator();
 const fhirGenerator = new FHIRGenerator();
+// Keeps the AI backend's cached summaries in step with chart writes
+const patientChanges = new PatientChangeNotifier();
 
 const ROOT_DIR = path.resolve(__dirname, '..', '..');
 
@@ -617,6 +620,7 @@ app.put('/api/lab/orders/:id/result', authenticateLabToken, async (req, res) =>
        WHERE id = ?`,
       [resultSummary || null, serializedDetails, now, labId, now, orderId]
     );
+    patientChanges.patientChanged(order.patient_id);
 
     const updated = await get(
       `SELECT lo.*, 
@@ -944,6 +948,7 @@ app.put('/api/patients/:id', authenticateToken, async (req, res) => {
       [patientId, doctorId]
     );
 
+    patientChanges.patientChanged(patientId);
     return res.json(parsePatientRow(updated));
   } catch (err) {
     console.error('Update patient error', err);
@@ -959,6 +964,7 @@ app.delete('/api/patients/:id', authenticateToken, async (req, res) => {
     if (result.changes === 0) {
       return res.status(404).json({ message: 'Patient not found.' });
     }
+    patientChanges.patientChanged(patientId);
     return res.json({ message: 'Patient deleted.' });
   } catch (err) {
     console.error('Delete patient error', err);
@@ -1028,6 +1034,7 @@ app.post('/api/patients/:id/visits', authenticateToken, async (req, res) => {
     );
 
     const visit = await get('SELECT * FROM visits WHERE id = ?', [result.lastID]);
+    patientChanges.patientChanged(patientId);
     return res.status(201).json(parseVisitRow(visit));
   } catch (err) {
     console.error('Create visit error', err);
@@ -1094,6 +1101,7 @@ app.put('/api/visits/:id', authenticateToken, async (req, res) => {
     );
 
     const updated = await get('SELECT * FROM visits WHERE id = ?', [visitId]);
+    patientChanges.patientChanged(visit.patient_id);
     return res.json(parseVisitRow(updated));
   } catch (err) {
     console.error('Update visit error', err);
@@ -1105,13 +1113,14 @@ app.post('/api/visits/:id/complete', authenticateToken, async (req, res) => {
   try {
     const doctorId = req.doctorId;
     const visitId = Number(req.params.id);
-    const visit = await get('SELECT id FROM visits WHERE id = ? AND doctor_id = ?', [visitId, doctorId]);
+    const visit = await get('SELECT id, patient_id FROM visits WHERE id = ? AND doctor_id = ?', [visitId, doctorId]);
     if (!visit) {
       return res.status(404).json({ message: 'Visit not found.' });
     }
 
     await run("UPDATE visits SET status = 'completed', updated_at = CURRENT_TIMESTAMP WHERE id = ?", [visitId]);
     const updated = await get('SELECT * FROM visits WHERE id = ?', [visitId]);
+    patientChanges.patientChanged(visit.patient_id);
     return res.json(parseVisitRow(updated));
   } catch (err) {
     console.error('Complete visit error', err);
@@ -1200,6 +1209,7 @@ app.post('/api/patients/:id/prescriptions', authenticateToken, async (req, res)
       [insert.lastID]
     );
 
+    patientChanges.patientChanged(patientId);
     return res.status(201).json(parsePrescriptionRow(record));
   } catch (err) {
     console.error('Create prescription error', err);
@@ -1229,10 +1239,12 @@ app.delete('/api/prescriptions/:id', authenticateToken, async (req, res) => {
   try {
     const doctorId = req.doctorId;
     const prescriptionId = Number(req.params.id);
+    const prescription = await get('SELECT patient_id FROM prescriptions WHERE id = ? AND doctor_id = ?', [prescriptionId, doctorId]);
     const result = await run('DELETE FROM prescriptions WHERE id = ? AND doctor_id = ?', [prescriptionId, doctorId]);
     if (result.changes === 0) {
       return res.status(404).json({ message: 'Prescription not found.' });
     }
+    patientChanges.patientChanged(prescription?.patient_id);
     return res.json({ message: 'Prescription removed.' });
   } catch (err) {
     console.error('Delete prescription error', err);
@@ -1284,6 +1296,9 @@ app.post('/api/patients/:id/lab-orders', authenticateToken, async (req, res) =>
       created.push(parseOrderRow(order));
     }
 
+    if (created.length) {
+      patientChanges.patientChanged(patientId);
+    }
     return res.status(201).json(created);
   } catch (err) {
     console.error('Create lab order error', err);
@@ -1337,6 +1352,7 @@ app.put('/api/lab-orders/:id', authenticateToken, async (req, res) => {
         WHERE lo.id = ?`,
       [orderId]
     );
+    patientChanges.patientChanged(order.patient_id);
     return res.json(parseOrderRow(updated));
   } catch (err) {
     console.error('Update lab order error', err);
@@ -1388,6 +1404,9 @@ app.post('/api/patients/:id/radiology-orders', authenticateToken, async (req, re
       created.push(parseOrderRow(order));
     }
 
+    if (created.length) {
+      patientChanges.patientChanged(patientId);
+    }
     return res.status(201).json(created);
   } catch (err) {
     console.error('Create radiology order error', err);
@@ -1428,6 +1447,7 @@ app.put('/api/radiology-orders/:id', authenticateToken, async (req, res) => {
     );
 
     const updated = await get('SELECT * FROM radiology_orders WHERE id = ?', [orderId]);
+    patientChanges.patientChanged(order.patient_id);
     return res.json(parseOrderRow(updated));
   } catch (err) {
     console.error('Update radiology order error', err);